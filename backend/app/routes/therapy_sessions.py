@@ -1,11 +1,13 @@
 """Routes for Therapy Sessions."""
 from __future__ import annotations
 
+import asyncio
 from typing import TYPE_CHECKING
 
-from config import logger
+from config import STREAM_CHAT_RESPONSES, logger
 from database import get_db
 from fastapi import APIRouter, Depends, HTTPException, status
+from llm.errors import LLMError
 from logic.therapy_session_logic import TherapySessionLogic
 from models import Chat, ChatReference, Node, TherapySession, User
 from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
@@ -97,14 +99,14 @@ async def websocket_endpoint(websocket: WebSocket, therapy_session_id: int) -> N
             await websocket.send_text("Valid token")
 
         logger.info("Getting initial messages")
-        # Get the therapy session - TODO needs to be async
-        therapy_session = TherapySessionLogic(pre_existing_session_id=therapy_session_id)
+        # Get the therapy session - loading it queries the database, so run it in a thread
+        therapy_session = await asyncio.to_thread(TherapySessionLogic, pre_existing_session_id=therapy_session_id)
         if not therapy_session:
             await websocket.send_text("No therapy session found")
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
-        # Get existing or initial chat messages  - TODO needs to be async
-        messages_to_send = therapy_session.get_messages()
+        # Get existing or initial chat messages
+        messages_to_send = await therapy_session.async_get_messages()
         # Send initial therapist message
         await websocket.send_json(messages_to_send.model_dump(mode="json"))
 
@@ -112,8 +114,20 @@ async def websocket_endpoint(websocket: WebSocket, therapy_session_id: int) -> N
             logger.info("Entering Chat While Loop - Waiting for message")
             data = await websocket.receive_json()
             user_text = data.get("message")
-            # Process user message and generate therapist response - TODO needs to be async
-            messages_to_send = therapy_session.generate_response(user_text)
+            # Process user message and generate therapist response
+            try:
+                if data.get("stream", STREAM_CHAT_RESPONSES):
+                    # Forward the reply as it is generated, then send the saved message as usual
+                    messages_to_send = await therapy_session.async_stream_response(
+                        user_text, lambda delta: websocket.send_json({"delta": delta})
+                    )
+                else:
+                    messages_to_send = await therapy_session.async_generate_response(user_text)
+            except LLMError as e:
+                # Keep the connection open so the user can try again
+                logger.error(f"Failed to generate a response: {e}")
+                await websocket.send_json({"error": "The therapist could not respond, please try again."})
+                continue
             # Send therapist response
             await websocket.send_json(messages_to_send.model_dump(mode="json"))
     except WebSocketDisconnect:
@@ -1,4 +1,5 @@
 """Configuration for the backend."""
+import json
 import os
 import tempfile
 from pathlib import Path
@@ -14,6 +15,11 @@ load_from_env_file()
 
 # Load API Key from environment variable
 openai_api_key = os.getenv("OPENAI_API_KEY")
+# Base URL of an OpenAI-compatible API, such as the local mock server in llm.mock_server - unset for the real API
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+# A local API such as the mock server needs no key, but the OpenAI clients will not start without one
+if LLM_BASE_URL and not openai_api_key:
+    openai_api_key = "placeholder"
 
 # Generate a secret key for the JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "dummy_secret_key")
@@ -35,6 +41,78 @@ USE_GPU = os.getenv("USE_GPU", "False").lower() == "true"
 # SPACY Model
 SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
 
+# Embedding backend - "openai" for the API, or "hashing" / "spacy" to embed locally without the network
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+DEFAULT_EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "hashing": "hashing-512",
+    "spacy": f"spacy-{SPACY_MODEL}",
+}
+# Embedding model used for chats, nodes and edges - defaults to the backend's model
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODELS[EMBEDDING_BACKEND]
+# Storage dtype for vectors in the database - unset to store them exactly at their own float precision, or opt in
+# to smaller lossy storage with "float32", "float16" or "int8" (quantised with a per-vector scale)
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "").lower() or None
+
+# Embed chats in a background worker after saving them, rather than before returning them
+DEFER_CHAT_EMBEDDINGS = os.getenv("DEFER_CHAT_EMBEDDINGS", "False").lower() == "true"
+
+# Seconds before a single LLM API attempt times out, and the overall budget for a call including its retries
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "120"))
+
+# Client-side limits per model as JSON {"model": {"rpm": requests per minute, "tpm": tokens per minute}} - models
+# left out are not limited
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+
+# Stream therapist replies over the websocket as they are generated - clients can override it per message
+STREAM_CHAT_RESPONSES = os.getenv("STREAM_CHAT_RESPONSES", "False").lower() == "true"
+
+# Optional SQLite file caching embeddings by a hash of the model and text - unset to disable the cache
+EMBEDDING_CACHE_PATH = Path(os.environ["EMBEDDING_CACHE_PATH"]) if os.getenv("EMBEDDING_CACHE_PATH") else None
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# Optional SQLite file caching deterministic extraction responses by a hash of the request - unset to disable the
+# cache. Entries expire after the TTL so prompt or model behaviour changes are picked up.
+RESPONSE_CACHE_PATH = Path(os.environ["RESPONSE_CACHE_PATH"]) if os.getenv("RESPONSE_CACHE_PATH") else None
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+
+# Memory budget for the process-wide cache of per-user chat embedding matrices
+CHAT_MEMORY_CACHE_MAX_BYTES = int(os.getenv("CHAT_MEMORY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Process-wide cache of rendered system prompts per user and therapist. Prompts are rebuilt when either row is
+# updated in this process, and after the TTL to pick up updates made by other processes.
+SYSTEM_PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("SYSTEM_PROMPT_CACHE_MAX_ENTRIES", "10000"))
+SYSTEM_PROMPT_CACHE_TTL_SECONDS = float(os.getenv("SYSTEM_PROMPT_CACHE_TTL_SECONDS", "3600"))
+
+# Session history sent with each turn - at most this many latest messages within the token budget, with older
+# messages folded into a rolling summary in the background and persisted on the session
+SESSION_HISTORY_MAX_MESSAGES = int(os.getenv("SESSION_HISTORY_MAX_MESSAGES", "8"))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "1500"))
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "gpt-3.5-turbo")
+SESSION_SUMMARY_MAX_ENTRIES = int(os.getenv("SESSION_SUMMARY_MAX_ENTRIES", "10000"))
+# Longest summary kept, so the summary itself does not grow without bound as a session goes on
+SESSION_SUMMARY_MAX_TOKENS = int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", "400"))
+
+# Graph extraction - "combined" asks for nodes and edges in one request, falling back to a request each if the
+# response is unusable, and "separate" always makes the two requests
+GRAPH_EXTRACTION_MODE = os.getenv("GRAPH_EXTRACTION_MODE", "separate").lower()
+# How token indexes are given in extraction prompts - "tuples", or the more compact "inline" or "offsets" - compare
+# them with python -m llm.extraction_benchmark
+GRAPH_TOKEN_INDEX_FORMAT = os.getenv("GRAPH_TOKEN_INDEX_FORMAT", "tuples").lower()
+# Stream extraction responses so each node is saved as soon as it is generated, rather than after the response ends
+STREAM_GRAPH_EXTRACTION = os.getenv("STREAM_GRAPH_EXTRACTION", "False").lower() == "true"
+
+# Optional directory of memory-mapped chat embedding shards - unset to load embeddings from the database
+EMBEDDING_SHARD_DIR = Path(os.environ["EMBEDDING_SHARD_DIR"]) if os.getenv("EMBEDDING_SHARD_DIR") else None
+
+# Vector index used for chat and graph similarity search - "exact" or "ivf" (approximate)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "exact").lower()
+# IVF index settings - raise the probe count for better recall at the cost of latency
+IVF_N_LISTS = int(os.getenv("IVF_N_LISTS", "64"))
+IVF_N_PROBE = int(os.getenv("IVF_N_PROBE", "8"))
+
 
 class ProductionConfig:
     """Production configuration - e.g. for remote deployment."""
@@ -1,18 +1,21 @@
 """Functions to handle chat completion."""
 from __future__ import annotations
 
-from llm.common import api_request
+from typing import TYPE_CHECKING
 
+from llm.common import api_request, async_api_request, async_stream_request
 
-def get_chat_completion(
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+
+def build_chat_messages(
     next_message_prompt: str,
     system_prompt: str,
     history: str | None = None,
     briefing_messages: list[str] | None = None,
-    model: str = "gpt-3.5-turbo",
-    temperature: float = 0.3,
-) -> str:
-    """Get a chat completion from the OpenAI API."""
+) -> list[dict]:
+    """Build the messages of a chat completion request."""
     messages = [{"role": "system", "content": system_prompt}]
     if history:
         messages.append({"role": "user", "content": history})
@@ -20,5 +23,44 @@ def get_chat_completion(
         messages.extend([{"role": "user", "content": message} for message in briefing_messages])
 
     messages.append({"role": "user", "content": next_message_prompt})
+    return messages
 
+
+def get_chat_completion(
+    next_message_prompt: str,
+    system_prompt: str,
+    history: str | None = None,
+    briefing_messages: list[str] | None = None,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.3,
+) -> str:
+    """Get a chat completion from the OpenAI API."""
+    messages = build_chat_messages(next_message_prompt, system_prompt, history, briefing_messages)
     return api_request(messages=messages, model=model, temperature=temperature)
+
+
+async def async_get_chat_completion(
+    next_message_prompt: str,
+    system_prompt: str,
+    history: str | None = None,
+    briefing_messages: list[str] | None = None,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.3,
+) -> str:
+    """Get a chat completion from the OpenAI API without blocking the event loop."""
+    messages = build_chat_messages(next_message_prompt, system_prompt, history, briefing_messages)
+    return await async_api_request(messages=messages, model=model, temperature=temperature)
+
+
+async def async_stream_chat_completion(
+    next_message_prompt: str,
+    system_prompt: str,
+    history: str | None = None,
+    briefing_messages: list[str] | None = None,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.3,
+) -> AsyncIterator[str]:
+    """Stream a chat completion from the OpenAI API, yielding the text as it is generated."""
+    messages = build_chat_messages(next_message_prompt, system_prompt, history, briefing_messages)
+    async for delta in async_stream_request(messages=messages, model=model, temperature=temperature):
+        yield delta
@@ -1,13 +1,17 @@
 """Common functions for GPT generation."""
 from __future__ import annotations
 
+import asyncio
 import random
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterator, TypeVar
 
-import tiktoken
-from config import logger, openai_api_key
-from openai import OpenAI
+from config import LLM_BASE_URL, LLM_REQUEST_DEADLINE, LLM_REQUEST_TIMEOUT, logger, openai_api_key
+from openai import AsyncOpenAI, OpenAI
+
+from llm import token_counter
+from llm.errors import LLMDeadlineExceededError, LLMError, LLMUnavailableError, classify_error
+from llm.rate_limiter import Priority, rate_limiter
 
 if TYPE_CHECKING:
     from logging import Logger
@@ -15,74 +19,295 @@ if TYPE_CHECKING:
 # Set the OpenAI model
 MODEL = "gpt-4"
 
-client = OpenAI(api_key=openai_api_key)
+# The client's own retries are disabled as requests are retried here with error classification and a deadline
+client = OpenAI(api_key=openai_api_key, base_url=LLM_BASE_URL, timeout=LLM_REQUEST_TIMEOUT, max_retries=0)
+# Used by the async request path so waiting on the API does not block the event loop
+async_client = AsyncOpenAI(
+    api_key=openai_api_key, base_url=LLM_BASE_URL, timeout=LLM_REQUEST_TIMEOUT, max_retries=0
+)
+
+T = TypeVar("T")
+
+# Retry settings
+MAX_TRIES = 5
+INITIAL_DELAY = 1
+BACKOFF_FACTOR = 2
+MAX_DELAY = 16
+# Jitter as a fraction of the delay, so retries spread out in proportion to how long they wait
+JITTER_FRACTION = 0.25
 
 
-# TODO Switch to ASync Client
 def chat_completion_wrapper(model, messages, temperature: float = 0.7):
     """Wrap the openai chat completion API to allow test substitution."""
     response = client.chat.completions.create(model=model, messages=messages, temperature=temperature)
     return response.choices[0].message.content
 
 
+async def async_chat_completion_wrapper(model: str, messages: list[dict], temperature: float = 0.7) -> str:
+    """Wrap the async openai chat completion API to allow test substitution."""
+    response = await async_client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+    return response.choices[0].message.content
+
+
+async def async_chat_completion_stream_wrapper(
+    model: str, messages: list[dict], temperature: float = 0.7
+) -> AsyncIterator[str]:
+    """Wrap the streaming async openai chat completion API to allow test substitution, yielding content deltas."""
+    stream = await async_client.chat.completions.create(
+        model=model, messages=messages, temperature=temperature, stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def chat_completion_stream_wrapper(model: str, messages: list[dict], temperature: float = 0.7) -> Iterator[str]:
+    """Wrap the streaming openai chat completion API to allow test substitution, yielding content deltas."""
+    stream = client.chat.completions.create(model=model, messages=messages, temperature=temperature, stream=True)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def retry_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Return the seconds to wait after a failed attempt.
+
+    The wait is the Retry-After the API asked for, or else exponential backoff, plus proportional jitter.
+    """
+    if retry_after is not None:
+        delay = retry_after
+    else:
+        delay = min(INITIAL_DELAY * (BACKOFF_FACTOR ** (attempt - 1)), MAX_DELAY)
+    return delay * (1 + random.uniform(0, JITTER_FRACTION))  # nosec: B311
+
+
+def check_retry(error: LLMError, attempt: int, elapsed: float, deadline: float | None, gen_logger: Logger) -> float:
+    """Return the seconds to wait before retrying a failed attempt, raising the error if it should not be retried."""
+    if not error.retryable or attempt == MAX_TRIES:
+        gen_logger.error(f"API request failed after {attempt} attempts with final error {error}.")
+        raise error
+    sleep_time = retry_delay(attempt, error.retry_after)
+    if deadline is not None and elapsed + sleep_time > deadline:
+        gen_logger.error(f"API request failed with error: {error}. Retrying would pass the {deadline}s deadline.")
+        msg = f"Retrying would pass the {deadline}s deadline after {attempt} attempts - last error: {error}"
+        raise LLMDeadlineExceededError(msg, error.status_code) from error
+    gen_logger.warning(f"API request failed with error: {error}. Retrying in {sleep_time:.2f} seconds.")
+    return sleep_time
+
+
+def request_with_retries(
+    request: Callable[[], T], gen_logger: Logger = logger, deadline: float | None = LLM_REQUEST_DEADLINE
+) -> T:
+    """Call the request, retrying retryable failures until the deadline in seconds - raises an LLMError."""
+    start_time = time.monotonic()
+    for attempt in range(1, MAX_TRIES + 1):
+        try:
+            return request()
+        except Exception as e:  # noqa: BLE001
+            error = classify_error(e)
+            time.sleep(check_retry(error, attempt, time.monotonic() - start_time, deadline, gen_logger))
+    msg = "Unreachable - the final attempt either returns or raises."
+    raise AssertionError(msg)
+
+
+async def async_request_with_retries(
+    request: Callable[[], Awaitable[T]], gen_logger: Logger = logger, deadline: float | None = LLM_REQUEST_DEADLINE
+) -> T:
+    """Await the request, retrying retryable failures without blocking the event loop - raises an LLMError.
+
+    Unlike the sync version an attempt still running at the deadline is cancelled.
+    """
+    start_time = time.monotonic()
+    for attempt in range(1, MAX_TRIES + 1):
+        try:
+            timeout = None if deadline is None else max(deadline - (time.monotonic() - start_time), 0)
+            return await asyncio.wait_for(request(), timeout)
+        except asyncio.TimeoutError as e:
+            msg = f"API request did not finish within the {deadline}s deadline after {attempt} attempts."
+            gen_logger.error(msg)
+            raise LLMDeadlineExceededError(msg) from e
+        except Exception as e:  # noqa: BLE001
+            error = classify_error(e)
+            await asyncio.sleep(check_retry(error, attempt, time.monotonic() - start_time, deadline, gen_logger))
+    msg = "Unreachable - the final attempt either returns or raises."
+    raise AssertionError(msg)
+
+
 def api_request(
-    text: str | None = None,
+    text: str | list[str] | None = None,
     messages: list[dict] | None = None,
     model: str = MODEL,
     temperature: float = 0.7,
     gen_logger: Logger = logger,
-) -> list[list[float]] | str:
-    """Make a request to the openai api."""
-    max_tries = 5
-    initial_delay = 1
-    backoff_factor = 2
-    max_delay = 16
-    jitter_range = (1, 3)
+    priority: Priority | None = None,
+    deadline: float | None = LLM_REQUEST_DEADLINE,
+) -> list[float] | str:
+    """Make a request to the openai api - embedding requests return the embedding of the first text.
 
+    The request waits its turn in the model's rate limiter, by default as an embedding or interactive request.
+    Raises an LLMError if the request is rejected, retrying is exhausted or the deadline would be passed.
+    """
     if model.startswith("text-embedding"):
-        # Get rid of newlines
-        text = [t.replace("\n", " ") for t in text]
+        # A single string is one input rather than a list of characters
+        texts = [text] if isinstance(text, str) else text
+
+        def request() -> list[float]:
+            return embeddings_request(
+                texts, model=model, gen_logger=gen_logger, retry=False, priority=priority or Priority.EMBEDDING
+            )[0]
+
+    else:
+
+        def request() -> str:
+            rate_limiter.acquire_request(model, priority or Priority.INTERACTIVE, messages=messages)
+            gen_logger.info(f"Making API request with {model}")
+            return chat_completion_wrapper(model, messages, temperature=temperature)
+
+    return request_with_retries(request, gen_logger, deadline)
+
+
+def embeddings_request(
+    texts: list[str],
+    model: str,
+    gen_logger: Logger = logger,
+    *,
+    retry: bool = True,
+    priority: Priority = Priority.EMBEDDING,
+    token_counts: list[int] | None = None,
+) -> list[list[float]]:
+    """Embed a batch of texts in one request, returning the embeddings in input order.
+
+    Token counts the caller already has for the texts are given to the rate limiter instead of counting them again.
+    """
+    # Get rid of newlines
+    texts = [t.replace("\n", " ") for t in texts]
 
-    for attempt in range(1, max_tries + 1):
+    def request() -> list[list[float]]:
+        rate_limiter.acquire_request(model, priority, texts=texts, token_counts=token_counts)
+        gen_logger.info(f"Making API request for {len(texts)} text embeddings")
+        response = client.embeddings.create(input=texts, model=model)
+        if len(response.data) != len(texts):
+            # A malformed response, which may be fine on another attempt
+            msg = f"Got {len(response.data)} embeddings for {len(texts)} texts."
+            raise LLMUnavailableError(msg)
+        return [item.embedding for item in response.data]
+
+    return request_with_retries(request, gen_logger) if retry else request()
+
+
+async def async_api_request(
+    text: str | list[str] | None = None,
+    messages: list[dict] | None = None,
+    model: str = MODEL,
+    temperature: float = 0.7,
+    gen_logger: Logger = logger,
+    priority: Priority | None = None,
+    deadline: float | None = LLM_REQUEST_DEADLINE,
+) -> list[float] | str:
+    """Make a request to the openai api with the async client - the async version of api_request."""
+    if model.startswith("text-embedding"):
+        texts = [text] if isinstance(text, str) else text
+
+        async def request() -> list[float]:
+            return (
+                await async_embeddings_request(
+                    texts, model=model, gen_logger=gen_logger, retry=False, priority=priority or Priority.EMBEDDING
+                )
+            )[0]
+
+    else:
+
+        async def request() -> str:
+            await rate_limiter.async_acquire_request(model, priority or Priority.INTERACTIVE, messages=messages)
+            gen_logger.info(f"Making async API request with {model}")
+            return await async_chat_completion_wrapper(model, messages, temperature=temperature)
+
+    return await async_request_with_retries(request, gen_logger, deadline)
+
+
+def stream_request(
+    messages: list[dict],
+    model: str = MODEL,
+    temperature: float = 0.7,
+    gen_logger: Logger = logger,
+    priority: Priority = Priority.INTERACTIVE,
+    deadline: float | None = LLM_REQUEST_DEADLINE,
+) -> Iterator[str]:
+    """Stream the content deltas of a chat completion - the sync version of async_stream_request."""
+    start_time = time.monotonic()
+    for attempt in range(1, MAX_TRIES + 1):
+        started = False
         try:
-            # gen_logger.info(f"Making API request with {model}")
-            if model.startswith("text-embedding"):
-                gen_logger.info("Making API request for text embedding")
-                response = client.embeddings.create(input=text, model=model)
-                result = response.data[0].embedding
-            else:
-                gen_logger.info(f"Making API request with {model}")
-                result = chat_completion_wrapper(model, messages, temperature=temperature)
-            return result
-        except Exception as e:
-            if attempt == max_tries:
-                gen_logger.exception(f"API request failed after {attempt} attempts with final error {e}.")
-                return []
-
-            delay = min(initial_delay * (backoff_factor ** (attempt - 1)), max_delay)
-            jitter = random.uniform(jitter_range[0], jitter_range[1])  # nosec: B311
-            sleep_time = delay + jitter
-            gen_logger.exception(f"API request failed with error: {e}. " f"Retrying in {sleep_time:.2f} seconds.")
-            time.sleep(sleep_time)
-    return None
+            rate_limiter.acquire_request(model, priority, messages=messages)
+            gen_logger.info(f"Making streaming API request with {model}")
+            for delta in chat_completion_stream_wrapper(model, messages, temperature=temperature):
+                started = True
+                yield delta
+            return
+        except Exception as e:  # noqa: BLE001
+            error = classify_error(e)
+            if started:
+                gen_logger.error(f"Streaming API request failed part way with error {error}.")
+                raise error from e
+            time.sleep(check_retry(error, attempt, time.monotonic() - start_time, deadline, gen_logger))
+
+
+async def async_stream_request(
+    messages: list[dict],
+    model: str = MODEL,
+    temperature: float = 0.7,
+    gen_logger: Logger = logger,
+    priority: Priority = Priority.INTERACTIVE,
+    deadline: float | None = LLM_REQUEST_DEADLINE,
+) -> AsyncIterator[str]:
+    """Stream the content deltas of a chat completion.
+
+    Retryable failures before the first delta are retried like other requests. Once deltas have been yielded the
+    stream cannot be replayed, so a later failure is raised as an LLMError straight away.
+    """
+    start_time = time.monotonic()
+    for attempt in range(1, MAX_TRIES + 1):
+        started = False
+        try:
+            await rate_limiter.async_acquire_request(model, priority, messages=messages)
+            gen_logger.info(f"Making streaming API request with {model}")
+            async for delta in async_chat_completion_stream_wrapper(model, messages, temperature=temperature):
+                started = True
+                yield delta
+            return
+        except Exception as e:  # noqa: BLE001
+            error = classify_error(e)
+            if started:
+                gen_logger.error(f"Streaming API request failed part way with error {error}.")
+                raise error from e
+            await asyncio.sleep(check_retry(error, attempt, time.monotonic() - start_time, deadline, gen_logger))
+
+
+async def async_embeddings_request(
+    texts: list[str],
+    model: str,
+    gen_logger: Logger = logger,
+    *,
+    retry: bool = True,
+    priority: Priority = Priority.EMBEDDING,
+    token_counts: list[int] | None = None,
+) -> list[list[float]]:
+    """Embed a batch of texts in one request with the async client, returning the embeddings in input order."""
+    texts = [t.replace("\n", " ") for t in texts]
+
+    async def request() -> list[list[float]]:
+        await rate_limiter.async_acquire_request(model, priority, texts=texts, token_counts=token_counts)
+        gen_logger.info(f"Making async API request for {len(texts)} text embeddings")
+        response = await async_client.embeddings.create(input=texts, model=model)
+        if len(response.data) != len(texts):
+            # A malformed response, which may be fine on another attempt
+            msg = f"Got {len(response.data)} embeddings for {len(texts)} texts."
+            raise LLMUnavailableError(msg)
+        return [item.embedding for item in response.data]
+
+    return await async_request_with_retries(request, gen_logger) if retry else await request()
 
 
 def num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301"):
-    """Returns the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo-0301":  # note: future models may deviate from this
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-            num_tokens += 2  # every reply is primed with <im_start>assistant
-        return num_tokens
-    else:
-        msg = f"""num_tokens_from_messages() is not presently implemented for model {model}."""
-        raise NotImplementedError(msg)
+    """Returns the number of tokens used by a list of messages - see llm.token_counter for other models."""
+    return token_counter.num_tokens_from_messages(messages, model)
@@ -0,0 +1,73 @@
+"""Persistent content-addressed cache of text embeddings."""
+from __future__ import annotations
+
+import hashlib
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+from config import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PATH
+
+from llm.sqlite_lru import SQLiteLRUCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    dtype TEXT NOT NULL,
+    last_used INTEGER NOT NULL
+)
+"""
+
+
+def normalise_text(text: str) -> str:
+    """Collapse runs of whitespace so texts that differ only in spacing share a cache entry.
+
+    This is looser than the request itself, which only replaces newlines with spaces, as spacing makes a
+    negligible difference to an embedding.
+    """
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Return the cache key of a text embedded by a model."""
+    return hashlib.sha256(f"{model}\0{normalise_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """SQLite cache of embeddings keyed by a hash of the model and normalised text.
+
+    Only hashes are stored, never the text itself. Once the cache holds more than max_entries embeddings
+    the least recently used ones are evicted.
+    """
+
+    table = "embeddings"
+    schema = SCHEMA
+    value_columns = ("vector", "dtype")
+
+    def __init__(self, path: Path | str, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES) -> None:
+        """Open the cache, creating the database if needed."""
+        super().__init__(path, max_entries)
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        """Return the cached embedding of the text, or None on a miss."""
+        row = self._get_row(cache_key(model, text))
+        return None if row is None else np.frombuffer(row[0], dtype=row[1])
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        """Cache the embedding of the text in its own dtype, evicting the least recently used if over the limit."""
+        if vector is None or len(vector) == 0:
+            return
+        vector = np.asarray(vector)
+        self._put_row(cache_key(model, text), (vector.tobytes(), vector.dtype.str))
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Return the process-wide embedding cache, or None if it is not configured."""
+    if EMBEDDING_CACHE_PATH is None:
+        return None
+    return EmbeddingCache(EMBEDDING_CACHE_PATH)
@@ -1,28 +1,153 @@
 """LLM embedding functions."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 import numpy as np
-from config import openai_api_key
+import tiktoken
+from config import EMBEDDING_MODEL, openai_api_key
+
+from llm.common import api_request, async_api_request, embeddings_request
+from llm.embedding_cache import get_embedding_cache
+from llm.local_embeddings import get_local_embeddings, is_local_model
+from llm.rate_limiter import Priority
+from llm.token_counter import CHARS_PER_TOKEN, load_encoding
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+# Limits of the OpenAI embeddings endpoint
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_INPUT = 8191
+MAX_TOKENS_PER_REQUEST = 300_000
+
 
-from llm.common import api_request
+def get_embedding_encoding() -> tiktoken.Encoding | None:
+    """Return the tokeniser used by the embedding models, or None if it cannot be loaded."""
+    return load_encoding("cl100k_base")
 
 
-def get_embedding(text: str, model: str = "text-embedding-ada-002", api_key: str = openai_api_key) -> np.array:
+def truncate_to_token_limit(text: str, max_tokens: int = MAX_TOKENS_PER_INPUT) -> tuple[str, int]:
+    """Truncate the text to the token limit of a single embedding input, returning it with its token count."""
+    encoding = get_embedding_encoding()
+    if encoding is None:
+        text = text[: max_tokens * CHARS_PER_TOKEN]
+        return text, len(text) // CHARS_PER_TOKEN + 1
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) > max_tokens:
+        return encoding.decode(tokens[:max_tokens]), max_tokens
+    return text, len(tokens)
+
+
+def batch_by_token_budget(
+    token_counts: list[int],
+    max_inputs: int = MAX_INPUTS_PER_REQUEST,
+    max_tokens: int = MAX_TOKENS_PER_REQUEST,
+) -> Iterator[tuple[int, int]]:
+    """Yield (start, end) slices of consecutive inputs that fit within the per-request limits."""
+    start, batch_tokens = 0, 0
+    for end, n_tokens in enumerate(token_counts):
+        if end > start and (end - start >= max_inputs or batch_tokens + n_tokens > max_tokens):
+            yield start, end
+            start, batch_tokens = end, 0
+        batch_tokens += n_tokens
+    if start < len(token_counts):
+        yield start, len(token_counts)
+
+
+def get_embedding(text: str, model: str = EMBEDDING_MODEL, api_key: str = openai_api_key) -> np.array:
     """
-    Get the embedding for a given text using the OpenAI Embedding API.
+    Get the embedding for a given text using the OpenAI Embedding API or a local model.
 
     Args:
     ----
         text: The input text as a list of strings.
-        model: The model name or ID to use for embeddings. Default is "text-embedding-ada-002".
+        model: The model name or ID to use for embeddings. Default is the configured EMBEDDING_MODEL.
         api_key: The OpenAI API key to use for embeddings. Default is the value of the OPENAI_API_KEY environment
             variable.
 
     Returns:
     -------
-        An embedding as a numpy array.
+        A float32 embedding as a numpy array, like the rows of get_embeddings, taken from the embedding cache
+        without a request if it is enabled.
+
+    """
+    if is_local_model(model):
+        return get_local_embeddings([text], model)[0]
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached = cache.get(model, text)
+        if cached is not None:
+            # Entries cached before embeddings were float32 may be float64
+            return cached.astype(np.float32, copy=False)
+    vector_result = np.array(api_request(text=text, messages=[], model=model), dtype=np.float32)
+    if cache is not None:
+        cache.put(model, text, vector_result)
+    return vector_result
+
+
+async def async_get_embedding(text: str, model: str = EMBEDDING_MODEL) -> np.array:
+    """Get the embedding for a given text without blocking the event loop - the async version of get_embedding."""
+    if is_local_model(model):
+        return get_local_embeddings([text], model)[0]
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached = cache.get(model, text)
+        if cached is not None:
+            # Entries cached before embeddings were float32 may be float64
+            return cached.astype(np.float32, copy=False)
+    vector_result = np.array(await async_api_request(text=text, messages=[], model=model), dtype=np.float32)
+    if cache is not None:
+        cache.put(model, text, vector_result)
+    return vector_result
+
+
+def get_embeddings(
+    texts: list[str],
+    model: str = EMBEDDING_MODEL,
+    max_inputs: int = MAX_INPUTS_PER_REQUEST,
+    max_tokens: int = MAX_TOKENS_PER_REQUEST,
+    priority: Priority = Priority.EMBEDDING,
+) -> np.ndarray:
+    """
+    Get the embeddings for many texts, packing them into as few embedding API requests as the limits allow.
+
+    Args:
+    ----
+        texts: The input texts.
+        model: The model name or ID to use for embeddings. Default is the configured EMBEDDING_MODEL.
+        max_inputs: The most texts sent in one request.
+        max_tokens: The most tokens sent in one request. Texts over the single input limit are truncated.
+        priority: The rate limiter priority of the requests - background jobs should not delay interactive ones.
+
+    Returns:
+    -------
+        An (n, d) float32 array with a row per text in input order. Cached embeddings are reused and only the
+        other texts are sent. Raises an LLMError if a request still fails after retrying.
 
     """
-    vector_result = api_request(text=text, messages=[], model=model)
-    return np.array(vector_result)
+    if is_local_model(model):
+        return get_local_embeddings(texts, model)
+    cache = get_embedding_cache()
+    rows = [None] * len(texts) if cache is None else [cache.get(model, text) for text in texts]
+    missing = [position for position, row in enumerate(rows) if row is None]
+    # The API rejects empty inputs
+    truncated = [truncate_to_token_limit(texts[position] or " ") for position in missing]
+    token_counts = [n_tokens for _, n_tokens in truncated]
+    for start, end in batch_by_token_budget(token_counts, max_inputs=max_inputs, max_tokens=max_tokens):
+        batch = embeddings_request(
+            [text for text, _ in truncated[start:end]],
+            model=model,
+            priority=priority,
+            token_counts=token_counts[start:end],
+        )
+        for position, vector in zip(missing[start:end], batch):
+            rows[position] = np.asarray(vector, dtype=np.float32)
+            if cache is not None:
+                cache.put(model, texts[position], rows[position])
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(rows).astype(np.float32, copy=False)
 
 
 def compute_cosine_similarities(query_embedding: np.array, embeddings_matrix: np.array) -> np.array:
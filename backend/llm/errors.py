@@ -0,0 +1,92 @@
+"""Typed errors of failed LLM requests and the classification of API exceptions into them."""
+from __future__ import annotations
+
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+# Statuses worth retrying - timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+class LLMError(Exception):
+    """Base class of LLM requests that failed after any retries."""
+
+    retryable = False
+
+    def __init__(self, message: str, status_code: int | None = None, retry_after: float | None = None) -> None:
+        """Create the error with the HTTP status and requested wait in seconds, if the API gave them."""
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMRequestError(LLMError):
+    """The request was rejected, for example as malformed or unauthorised, and retrying cannot help."""
+
+
+class LLMRateLimitError(LLMError):
+    """The API rate limit or quota was hit."""
+
+    retryable = True
+
+
+class LLMUnavailableError(LLMError):
+    """The API could not be reached, timed out, failed with a server error or sent a malformed response."""
+
+    retryable = True
+
+
+class LLMDeadlineExceededError(LLMError):
+    """The request could not be completed within its deadline."""
+
+
+def parse_retry_after(headers: dict | None) -> float | None:
+    """Return the seconds the API asked to wait before retrying, or None if it did not say."""
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(float(retry_after_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    # Otherwise an HTTP date
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> LLMError:
+    """Convert an exception raised by a request into the typed error deciding whether to retry it."""
+    if isinstance(error, LLMError):
+        return error
+    typed_error = _classify(error)
+    typed_error.__cause__ = error
+    return typed_error
+
+
+def _classify(error: Exception) -> LLMError:
+    """Return the typed error of an exception that is not one already."""
+    if isinstance(error, openai.APIStatusError):
+        status_code = error.status_code
+        retry_after = parse_retry_after(error.response.headers)
+        if status_code == 429:  # noqa: PLR2004
+            return LLMRateLimitError(str(error), status_code, retry_after)
+        if status_code in RETRYABLE_STATUS_CODES or status_code >= 500:  # noqa: PLR2004
+            return LLMUnavailableError(str(error), status_code, retry_after)
+        return LLMRequestError(str(error), status_code)
+    # Connection errors, timeouts and responses the client could not validate may succeed on another attempt
+    if isinstance(error, (openai.APIConnectionError, openai.APIResponseValidationError)):
+        return LLMUnavailableError(str(error))
+    # Anything else, such as a bug in building the request, would fail the same way again
+    return LLMRequestError(str(error))
@@ -0,0 +1,137 @@
+"""Benchmark of the token index formats of graph extraction prompts.
+
+For each format this reports the tokens of the indexed input text and of the whole node extraction prompt for a
+set of texts. With extraction on it also reports the share of extracted node spans whose tokens match the node's
+label - a wrong span means the model misread the token indexes, so the span accuracy shows what a more compact
+format costs. Run from the backend folder with:
+
+    python -m llm.extraction_benchmark --texts chats.txt --formats tuples inline offsets
+
+Set LLM_BASE_URL to the mock server in llm.mock_server to check the harness without using the API.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+from spacy_nlp import NLPService
+
+from llm.graph_processing import (
+    MODEL,
+    TOKEN_INDEX_FORMATS,
+    build_node_messages,
+    format_input_text,
+    get_nodes,
+    prompt_tokens,
+)
+from llm.token_counter import count_tokens
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from spacy.language import Language
+    from spacy.tokens import Doc
+
+SAMPLE_TEXTS = (
+    "I had an argument with my sister Anna about our mother's birthday party last weekend.",
+    "Work has been stressful since my manager, David, moved to the Chicago office in March.",
+    "I went running in Hyde Park with Tom every morning and it really helped my anxiety.",
+    "My therapist in Leeds suggested I keep a journal, but I keep forgetting to write in it.",
+    "When I visited my grandparents in Dublin I felt calmer than I have in months.",
+)
+
+
+class FormatReport(NamedTuple):
+    """Prompt size and extraction accuracy of one token index format over the benchmark texts."""
+
+    index_format: str
+    text_tokens: int
+    input_tokens: int
+    prompt_tokens: int
+    nodes: int
+    correct_spans: int
+    spans: int
+    seconds: float
+
+    @property
+    def tokens_per_text_token(self) -> float:
+        """Return the tokens of the indexed input text per token of the raw texts."""
+        return self.input_tokens / self.text_tokens if self.text_tokens else 0.0
+
+    @property
+    def span_accuracy(self) -> float | None:
+        """Return the share of node spans matching their label, or None if nothing was extracted."""
+        return self.correct_spans / self.spans if self.spans else None
+
+
+def score_spans(doc: Doc, nodes: list[dict]) -> tuple[int, int]:
+    """Return how many of the nodes' spans cover exactly their label, and the number of spans."""
+    correct = total = 0
+    for node in nodes:
+        for span in node.get("spans") or []:
+            total += 1
+            try:
+                text = doc[span[0] : span[-1] + 1].text
+            except (IndexError, KeyError, TypeError):
+                continue
+            correct += text.lower() == str(node.get("label", "")).lower()
+    return correct, total
+
+
+def run_benchmark(
+    texts: Sequence[str], nlp: Language, index_formats: Sequence[str] = TOKEN_INDEX_FORMATS, *, extract: bool = True
+) -> list[FormatReport]:
+    """Measure each token index format over the texts, extracting nodes with the API unless extract is off."""
+    docs = [nlp(text) for text in texts]
+    text_tokens = sum(count_tokens(doc.text, MODEL) for doc in docs)
+    reports = []
+    for index_format in index_formats:
+        n_input_tokens = n_prompt_tokens = n_nodes = n_correct = n_spans = 0
+        start_time = time.monotonic()
+        for doc in docs:
+            n_input_tokens += count_tokens(format_input_text(doc, index_format), MODEL)
+            n_prompt_tokens += prompt_tokens(build_node_messages(doc, index_format))
+            if extract:
+                nodes = get_nodes(doc, index_format)
+                nodes = nodes if isinstance(nodes, list) else []
+                correct, spans = score_spans(doc, nodes)
+                n_nodes, n_correct, n_spans = n_nodes + len(nodes), n_correct + correct, n_spans + spans
+        seconds = time.monotonic() - start_time
+        reports.append(
+            FormatReport(
+                index_format, text_tokens, n_input_tokens, n_prompt_tokens, n_nodes, n_correct, n_spans, seconds
+            )
+        )
+    return reports
+
+
+def format_report(report: FormatReport) -> str:
+    """Return a report as one line of the results table."""
+    accuracy = "-" if report.span_accuracy is None else f"{report.span_accuracy:.1%}"
+    return (
+        f"{report.index_format:<8} {report.input_tokens:>8} {report.tokens_per_text_token:>10.2f} "
+        f"{report.prompt_tokens:>8} {report.nodes:>6} {accuracy:>9} {report.seconds:>8.1f}"
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=Path, help="File of texts to extract from, one per line")
+    parser.add_argument("--formats", nargs="+", choices=TOKEN_INDEX_FORMATS, default=list(TOKEN_INDEX_FORMATS))
+    parser.add_argument("--tokens-only", action="store_true", help="Count prompt tokens without extracting")
+    args = parser.parse_args(argv)
+    texts = SAMPLE_TEXTS
+    if args.texts is not None:
+        texts = [line for line in args.texts.read_text().splitlines() if line.strip()]
+    reports = run_benchmark(texts, NLPService().get_nlp(), args.formats, extract=not args.tokens_only)
+    print(f"{len(texts)} texts, {reports[0].text_tokens} text tokens")
+    print(f"{'format':<8} {'input':>8} {'per token':>10} {'prompt':>8} {'nodes':>6} {'spans ok':>9} {'seconds':>8}")
+    for report in reports:
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,31 @@
 from __future__ import annotations
 
 import json
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator
 
-from config import logger
+from config import GRAPH_TOKEN_INDEX_FORMAT, logger
 
 if TYPE_CHECKING:
     from spacy.tokens import Doc
 
 from models.knowledge import VALID_TYPES
 
-from llm.common import api_request
+from llm.common import api_request, async_api_request, stream_request
+from llm.json_stream import parse_objects
+from llm.rate_limiter import Priority
+from llm.response_cache import get_response_cache
+from llm.token_counter import num_tokens_from_messages
+from llm.token_index_formats import (
+    INLINE_INPUT_PROMPT,
+    OFFSETS_INPUT_PROMPT,
+    OFFSETS_LINE_TOKENS,
+    TOKEN_INDEX_FORMATS,
+    TUPLES_INPUT_PROMPT,
+)
 
 MODEL = "gpt-4o"
+# Low temperature so extraction is repeatable, which also lets responses be cached
+TEMPERATURE = 0.1
 
 GRAPH_PROCESSOR_SYSTEM_PROMPT = (
     "You are an AI expert specializing in knowledge graph creation with the "
@@ -60,9 +73,7 @@ GP_NODE_JSON_PROMPT = (
 GP_NODE_PROMPT = (
     "Please provide the nodes for the knowledge graph based on the following input text.\n"
     "\n"
-    "Input Text: \n"
-    "{}\n\n"
-    "Token Indexes: {}"
+    "{}"
 )
 
 GP_EDGE_JSON_PROMPT = (
@@ -82,9 +93,42 @@ GP_EDGE_JSON_PROMPT = (
 GP_EDGE_PROMPT = (
     "Please provide the edges for the knowledge graph based on the following input text.\n"
     "\n"
-    "Input Text: \n"
-    "{}\n\n"
-    "Token Indexes: {}"
+    "{}"
+)
+
+GP_GRAPH_JSON_PROMPT = (
+    "Here an example of the JSON format for the knowledge graph. Number the nodes with an id starting from 1 and "
+    "give the ids of the nodes each edge connects as its source and target.\n"
+    "{\n"
+    '  "nodes": [\n'
+    "    {\n"
+    '      "id": 1,\n'
+    '      "label": "Apple",\n'
+    '      "spans": [[0]],\n'
+    f'      "type": one of {TYPE_STRING},\n'
+    "    },\n"
+    "    {\n"
+    '      "id": 2,\n'
+    '      "label": "Steve Jobs",\n'
+    '      "spans": [[4, 5]],\n'
+    f'      "type": one of {TYPE_STRING},\n'
+    "    }\n"
+    "  ],\n"
+    '  "edges": [\n'
+    "    {\n"
+    '      "label": "was run by",\n'
+    '      "source": 1,\n'
+    '      "target": 2,\n'
+    '      "spans": [[1, 3]],\n'
+    "    }\n"
+    "  ]\n"
+    "}"
+)
+
+GP_GRAPH_PROMPT = (
+    "Please provide the nodes and edges for the knowledge graph based on the following input text.\n"
+    "\n"
+    "{}"
 )
 
 GP_EXISTING_NODES_PROMPT = (
@@ -92,53 +136,231 @@ GP_EXISTING_NODES_PROMPT = (
 )
 
 
-def get_nodes(doc: Doc) -> list[dict]:
-    """Generate candidate nodes from the input text."""
-    text = doc.text
-    tokens_and_indexes = [(token.text, token.i) for token in doc]
+def token_indexes(doc: Doc) -> list[tuple[str, int]]:
+    """Return the text and index of each token in the document."""
+    return [(token.text, token.i) for token in doc]
 
-    messages = [
-        {"role": "system", "content": GRAPH_PROCESSOR_SYSTEM_PROMPT},
-        {"role": "user", "content": GP_NODE_JSON_PROMPT + "\n\n" + GP_NODE_PROMPT.format(text, tokens_and_indexes)},
-    ]
 
-    response = api_request(messages=messages, model=MODEL, temperature=0.1)
-    # Parse the response as JSON
-    try:
-        # First replace any stray triple backticks
-        clean_response = response.replace("```", "")
-        nodes = json.loads(clean_response)
-    except json.JSONDecodeError:
-        logger.error(f"Error parsing JSON response: {response}")
-        nodes = {}
-    # If the response is nested, extract the nodes
-    if "nodes" in nodes:
-        nodes = nodes["nodes"]
-    return nodes
+def format_input_text(doc: Doc, index_format: str | None = None) -> str:
+    """Return the input text with the index of each token, in one of the TOKEN_INDEX_FORMATS.
 
+    "tuples" gives the text then a list of (token, index) pairs, which costs about three times the tokens of the
+    text. "inline" follows each token with its index, as in "Alice[0] went[1]", and "offsets" gives lines of
+    tokens each starting with the index of its first token, leaving the model to count along the line. Defaults
+    to the GRAPH_TOKEN_INDEX_FORMAT setting.
+    """
+    index_format = index_format or GRAPH_TOKEN_INDEX_FORMAT
+    if index_format == "tuples":
+        return TUPLES_INPUT_PROMPT.format(doc.text, token_indexes(doc))
+    if index_format == "inline":
+        return INLINE_INPUT_PROMPT.format("".join(f"{token.text}[{token.i}]{token.whitespace_}" for token in doc))
+    if index_format == "offsets":
+        # Whitespace tokens are quoted so they stay visible and do not break the lines
+        texts = [repr(token.text) if token.is_space else token.text for token in doc]
+        lines = [
+            f"[{start}] " + " ".join(texts[start : start + OFFSETS_LINE_TOKENS])
+            for start in range(0, len(texts), OFFSETS_LINE_TOKENS)
+        ]
+        return OFFSETS_INPUT_PROMPT.format("\n".join(lines))
+    msg = f"Unknown token index format {index_format}, expected one of {TOKEN_INDEX_FORMATS}."
+    raise ValueError(msg)
 
-def get_edges(doc: Doc, existing_nodes: list[dict]) -> list[dict]:
-    """Generate candidate edges from the input text."""
-    text = doc.text
-    tokens_and_indexes = [(token.text, token.i) for token in doc]
 
-    messages = [
+def build_node_messages(doc: Doc, index_format: str | None = None) -> list[dict]:
+    """Build the messages asking for the nodes of the document."""
+    return [
+        {"role": "system", "content": GRAPH_PROCESSOR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": GP_NODE_JSON_PROMPT + "\n\n" + GP_NODE_PROMPT.format(format_input_text(doc, index_format)),
+        },
+    ]
+
+
+def build_edge_messages(doc: Doc, existing_nodes: list[dict], index_format: str | None = None) -> list[dict]:
+    """Build the messages asking for the edges between the existing nodes of the document."""
+    return [
         {"role": "system", "content": GRAPH_PROCESSOR_SYSTEM_PROMPT},
         {"role": "user", "content": GP_EDGE_JSON_PROMPT},
-        {"role": "user", "content": GP_EDGE_PROMPT.format(text, tokens_and_indexes)},
+        {"role": "user", "content": GP_EDGE_PROMPT.format(format_input_text(doc, index_format))},
         {"role": "user", "content": GP_EXISTING_NODES_PROMPT.format(existing_nodes)},
     ]
 
-    response = api_request(messages=messages, model=MODEL, temperature=0.1)
-    # Parse the response as JSON
+
+def build_graph_messages(doc: Doc, index_format: str | None = None) -> list[dict]:
+    """Build the messages asking for the nodes and edges of the document in one response."""
+    return [
+        {"role": "system", "content": GRAPH_PROCESSOR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": GP_GRAPH_JSON_PROMPT + "\n\n" + GP_GRAPH_PROMPT.format(format_input_text(doc, index_format)),
+        },
+    ]
+
+
+def prompt_tokens(messages: list[dict]) -> int:
+    """Return the prompt tokens of extraction messages with the extraction model's tokeniser."""
+    return num_tokens_from_messages(messages, MODEL)
+
+
+def parse_graph_response(response: str, key: str) -> list[dict]:
+    """Parse the JSON response, extracting the list under the key if it is nested."""
     try:
         # First replace any stray triple backticks
         clean_response = response.replace("```", "")
-        edges = json.loads(clean_response)
+        parsed = json.loads(clean_response)
     except json.JSONDecodeError:
         logger.error(f"Error parsing JSON response: {response}")
-        edges = {}
-    # If the response is nested, extract the edges
-    if "edges" in edges:
-        edges = edges["edges"]
-    return edges
+        # Keep the complete objects of a truncated or partly malformed response
+        salvaged = list(parse_objects([response], key))
+        if salvaged:
+            logger.warning(f"Salvaged {len(salvaged)} {key} from the malformed response")
+        return salvaged or {}
+    # If the response is nested, extract the list
+    if key in parsed:
+        parsed = parsed[key]
+    return parsed
+
+
+def parse_combined_response(response: str) -> tuple[list[dict], list[dict] | None] | None:
+    """Parse a combined response into its nodes and any edges, or None if it has no usable list of nodes."""
+    try:
+        parsed = json.loads(response.replace("```", ""))
+    except (AttributeError, json.JSONDecodeError):
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("nodes"), list):
+        return None
+    edges = parsed.get("edges")
+    return parsed["nodes"], edges if isinstance(edges, list) else None
+
+
+def number_nodes(nodes: list[dict]) -> list[dict]:
+    """Give the nodes ids for edges to refer to, keeping the ids they have if they are present and unique."""
+    nodes = [node for node in nodes if isinstance(node, dict)]
+    ids = [node.get("id") for node in nodes]
+    if None not in ids and len(set(ids)) == len(ids):
+        return nodes
+    return [{**node, "id": i} for i, node in enumerate(nodes, 1)]
+
+
+def connected_edges(nodes: list[dict], edges: list[dict]) -> list[dict]:
+    """Return the edges whose source and target are ids of the nodes."""
+    node_ids = {node["id"] for node in nodes}
+    connected = [
+        edge for edge in edges if isinstance(edge, dict) and {edge.get("source"), edge.get("target")} <= node_ids
+    ]
+    if len(connected) < len(edges):
+        logger.warning(f"Dropped {len(edges) - len(connected)} extracted edges that do not connect extracted nodes")
+    return connected
+
+
+def is_json(response: str) -> bool:
+    """Check if the response parses as JSON, so only usable responses are cached."""
+    try:
+        json.loads(response.replace("```", ""))
+    except (AttributeError, json.JSONDecodeError):
+        return False
+    return True
+
+
+def extraction_request(messages: list[dict]) -> str:
+    """Request an extraction, reusing the cached response to the same request if the response cache is enabled."""
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(MODEL, messages, TEMPERATURE)
+        if cached is not None:
+            return cached
+    # Extraction is background work, so interactive chat requests go ahead of it
+    response = api_request(messages=messages, model=MODEL, temperature=TEMPERATURE, priority=Priority.BACKGROUND)
+    if cache is not None and is_json(response):
+        cache.put(MODEL, messages, TEMPERATURE, response)
+    return response
+
+
+async def async_extraction_request(messages: list[dict]) -> str:
+    """Request an extraction without blocking the event loop - the async version of extraction_request."""
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(MODEL, messages, TEMPERATURE)
+        if cached is not None:
+            return cached
+    response = await async_api_request(
+        messages=messages, model=MODEL, temperature=TEMPERATURE, priority=Priority.BACKGROUND
+    )
+    if cache is not None and is_json(response):
+        cache.put(MODEL, messages, TEMPERATURE, response)
+    return response
+
+
+def stream_extraction(messages: list[dict]) -> Iterator[str]:
+    """Stream the deltas of an extraction response, replaying the cached response if the request has one."""
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(MODEL, messages, TEMPERATURE)
+        if cached is not None:
+            yield cached
+            return
+    deltas = []
+    for delta in stream_request(messages, model=MODEL, temperature=TEMPERATURE, priority=Priority.BACKGROUND):
+        deltas.append(delta)
+        yield delta
+    response = "".join(deltas)
+    if cache is not None and is_json(response):
+        cache.put(MODEL, messages, TEMPERATURE, response)
+
+
+def get_nodes(doc: Doc, index_format: str | None = None) -> list[dict]:
+    """Generate candidate nodes from the input text."""
+    return parse_graph_response(extraction_request(build_node_messages(doc, index_format)), "nodes")
+
+
+def get_edges(doc: Doc, existing_nodes: list[dict], index_format: str | None = None) -> list[dict]:
+    """Generate candidate edges from the input text."""
+    return parse_graph_response(extraction_request(build_edge_messages(doc, existing_nodes, index_format)), "edges")
+
+
+async def async_get_nodes(doc: Doc, index_format: str | None = None) -> list[dict]:
+    """Generate candidate nodes from the input text without blocking the event loop."""
+    return parse_graph_response(await async_extraction_request(build_node_messages(doc, index_format)), "nodes")
+
+
+async def async_get_edges(doc: Doc, existing_nodes: list[dict], index_format: str | None = None) -> list[dict]:
+    """Generate candidate edges from the input text without blocking the event loop."""
+    messages = build_edge_messages(doc, existing_nodes, index_format)
+    return parse_graph_response(await async_extraction_request(messages), "edges")
+
+
+def get_graph(doc: Doc, index_format: str | None = None) -> tuple[list[dict], list[dict]]:
+    """Generate candidate nodes and the edges between them from the input text in one request.
+
+    Nodes are given ids that the edges' source and target refer to. If the response has no usable nodes the
+    nodes and edges are requested separately, and if it only lacks the edges they are requested on their own.
+    """
+    graph = parse_combined_response(extraction_request(build_graph_messages(doc, index_format)))
+    if graph is None:
+        logger.warning("Unusable combined graph extraction response - requesting nodes and edges separately")
+        graph = (get_nodes(doc, index_format), None)
+    nodes, edges = graph
+    nodes = number_nodes(nodes if isinstance(nodes, list) else [])
+    if edges is None:
+        edges = get_edges(doc, nodes, index_format)
+    return nodes, connected_edges(nodes, edges if isinstance(edges, list) else [])
+
+
+async def async_get_graph(doc: Doc, index_format: str | None = None) -> tuple[list[dict], list[dict]]:
+    """Generate candidate nodes and edges in one request without blocking the event loop."""
+    graph = parse_combined_response(await async_extraction_request(build_graph_messages(doc, index_format)))
+    if graph is None:
+        logger.warning("Unusable combined graph extraction response - requesting nodes and edges separately")
+        graph = (await async_get_nodes(doc, index_format), None)
+    nodes, edges = graph
+    nodes = number_nodes(nodes if isinstance(nodes, list) else [])
+    if edges is None:
+        edges = await async_get_edges(doc, nodes, index_format)
+    return nodes, connected_edges(nodes, edges if isinstance(edges, list) else [])
+
+
+def stream_nodes(doc: Doc, index_format: str | None = None) -> Iterator[dict]:
+    """Yield candidate nodes from the input text as each one is generated."""
+    yield from parse_objects(stream_extraction(build_node_messages(doc, index_format)), "nodes")
+
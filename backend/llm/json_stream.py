@@ -0,0 +1,118 @@
+"""Incremental, error-tolerant parsing of streamed JSON extraction responses.
+
+Extraction responses are a JSON object of lists, such as {"nodes": [...], "edges": [...]}, or a bare list. The
+parser is fed the response a delta at a time and returns each object in those lists as soon as its closing brace
+arrives, so the objects can be used before the response ends. Text around the JSON such as markdown fences is
+skipped, an object that does not parse is dropped without losing the others, and a truncated response still
+yields every object that was complete.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import TYPE_CHECKING, Optional
+
+from config import logger
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+# Commas before a closing bracket, which models often leave in and json rejects
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+# A parsed object with the key of the list it is in, or None for a bare list
+KeyedObject = tuple[Optional[str], dict]
+
+
+def loads_lenient(text: str) -> dict | None:
+    """Parse a JSON object, allowing trailing commas, returning None if it is still not valid."""
+    for candidate in (text, TRAILING_COMMA_PATTERN.sub(r"\1", text)):
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        return parsed if isinstance(parsed, dict) else None
+    return None
+
+
+class ExtractionStreamParser:
+    """Parser returning the objects in the top level lists of a JSON response as they are completed."""
+
+    def __init__(self) -> None:
+        """Create a parser waiting for the start of the JSON."""
+        self._buffer: list[str] = []
+        # Open brackets, and where the open object in a top level list started in the buffer
+        self._stack: list[str] = []
+        self._object_start: int | None = None
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: str | None = None
+        self._list_key: str | None = None
+        self._done = False
+        self.dropped = 0
+
+    def _in_top_level_list(self) -> bool:
+        """Check if the parser is directly inside the root list or a list that is a value of the root object."""
+        return self._stack in (["["], ["{", "["])
+
+    def feed(self, delta: str) -> list[KeyedObject]:
+        """Consume the next part of the response, returning the objects completed by it."""
+        completed = []
+        for char in delta:
+            if self._done:
+                break
+            position = len(self._buffer)
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack == ["{"]:
+                        self._last_string = "".join(self._buffer[self._string_start + 1 : position])
+                continue
+            if not self._stack and char not in "{[":
+                # Skip anything before the JSON starts
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                if char == "{" and self._in_top_level_list():
+                    self._object_start = position
+                elif char == "[" and self._stack == ["{"]:
+                    self._list_key = self._last_string
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and self._object_start is not None and self._in_top_level_list():
+                    completed.extend(self._complete_object(position))
+                self._done = not self._stack
+        return completed
+
+    def _complete_object(self, end: int) -> list[KeyedObject]:
+        """Parse the object that ended at the position, dropping it if it is malformed."""
+        text = "".join(self._buffer[self._object_start : end + 1])
+        self._object_start = None
+        parsed = loads_lenient(text)
+        if parsed is None:
+            self.dropped += 1
+            logger.warning(f"Dropped malformed object from extraction response: {text}")
+            return []
+        key = self._list_key if self._stack == ["{", "["] else None
+        return [(key, parsed)]
+
+
+def parse_objects(deltas: Iterable[str], key: str | None = None) -> Iterator[dict]:
+    """Yield each object in the lists of a streamed response as it completes, only from the key's list if given."""
+    parser = ExtractionStreamParser()
+    for delta in deltas:
+        for object_key, parsed in parser.feed(delta):
+            if key is None or object_key in (key, None):
+                yield parsed
+
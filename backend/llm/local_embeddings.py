@@ -0,0 +1,85 @@
+"""Local embedding backends that run on the CPU without the network."""
+from __future__ import annotations
+
+import hashlib
+import re
+from functools import lru_cache
+
+import numpy as np
+from config import SPACY_MODEL
+
+HASHING_MODEL_PREFIX = "hashing-"
+SPACY_MODEL_PREFIX = "spacy-"
+WORD_PATTERN = re.compile(r"\w+")
+# Texts per spaCy batch
+SPACY_BATCH_SIZE = 256
+
+
+def is_local_model(model: str) -> bool:
+    """Check if the embedding model runs locally rather than through the API."""
+    return model.startswith((HASHING_MODEL_PREFIX, SPACY_MODEL_PREFIX))
+
+
+@lru_cache(maxsize=65536)
+def hash_feature(feature: str, dim: int) -> tuple[int, float]:
+    """Return the column and sign a feature is hashed to."""
+    value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def text_features(text: str) -> list[str]:
+    """Return the word and character trigram features of a text."""
+    features = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        features.append(word)
+        padded = f"<{word}>"
+        features.extend(f"#{padded[i : i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def hashing_embeddings(texts: list[str], dim: int) -> np.ndarray:
+    """Embed texts with a signed hashing vectoriser over words and character trigrams.
+
+    The embeddings are deterministic across processes and need no model, so they suit tests, benchmarks
+    and air-gapped deployments. Texts sharing words or word fragments score as similar.
+    """
+    embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+    rows, columns, signs = [], [], []
+    for row, text in enumerate(texts):
+        for feature in text_features(text):
+            column, sign = hash_feature(feature, dim)
+            rows.append(row)
+            columns.append(column)
+            signs.append(sign)
+    np.add.at(embeddings, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), signs)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+
+
+def spacy_embeddings(texts: list[str], model_name: str) -> np.ndarray:
+    """Embed texts with the vectors of the spaCy model already loaded by the NLP service."""
+    if model_name != SPACY_MODEL:
+        msg = f"spaCy embeddings need the loaded model {SPACY_MODEL}, not {model_name}."
+        raise ValueError(msg)
+    # Imported here so the API backend does not pay for loading spaCy
+    from spacy_nlp import nlp_service
+
+    nlp = nlp_service.get_nlp()
+    return np.array([doc.vector for doc in nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE)], dtype=np.float32)
+
+
+def get_local_embeddings(texts: list[str], model: str) -> np.ndarray:
+    """Embed texts with a local model, returning an (n, d) float32 array in input order.
+
+    Models are named "hashing-<dimension>" for the hashing vectoriser or "spacy-<spaCy model>".
+    """
+    if model.startswith(HASHING_MODEL_PREFIX):
+        dim = model.removeprefix(HASHING_MODEL_PREFIX)
+        if not dim.isdigit() or int(dim) < 1:
+            msg = f"Hashing model {model} must be named {HASHING_MODEL_PREFIX}<dimension>."
+            raise ValueError(msg)
+        return hashing_embeddings(texts, int(dim))
+    if model.startswith(SPACY_MODEL_PREFIX):
+        return spacy_embeddings(texts, model.removeprefix(SPACY_MODEL_PREFIX))
+    msg = f"Unknown local embedding model {model}."
+    raise ValueError(msg)
@@ -0,0 +1,291 @@
+"""Local stand-in for the OpenAI API, for load and latency testing without the network.
+
+Serves chat completions, including streamed ones, and embeddings with configurable latency and injected errors.
+Graph extraction requests get canned JSON built from the token indexes in the prompt, so the graph pipeline runs
+end to end. Run from the backend folder with:
+
+    python -m llm.mock_server --port 8001 --latency lognormal --latency-mean 0.8 --rate-limit-rate 0.05
+
+and point the backend at it by setting LLM_BASE_URL=http://localhost:8001/v1.
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import time
+import uuid
+from typing import TYPE_CHECKING, AsyncIterator, NamedTuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm.token_index_formats import INLINE_INPUT_PROMPT, OFFSETS_INPUT_PROMPT
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+DEFAULT_REPLY = "Thank you for sharing that with me. How did it make you feel when it happened?"
+# Matches the token index list of extraction prompts in each format
+TUPLES_PATTERN = re.compile(r"Token Indexes: (\[.*?\])\s*$", re.DOTALL | re.MULTILINE)
+INLINE_PATTERN = re.compile(r"(\S*?)\[(\d+)\]")
+# Matches the node types listed in the JSON example of node extraction prompts
+NODE_TYPES_PATTERN = re.compile(r'"type": one of ((?:"\w+", )*"\w+")')
+OFFSETS_PATTERN = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+
+
+class MockServerSettings(NamedTuple):
+    """Behaviour of the mock server.
+
+    Latency is drawn per request before the first byte, with lognormal latencies having the given mean. Streamed
+    replies then wait token_delay between chunks. The error rates are the chances of a request failing with a
+    429, a 500 or hanging for timeout_seconds before failing with a 504.
+    """
+
+    latency: str = "fixed"
+    latency_mean: float = 0.0
+    latency_spread: float = 0.5
+    token_delay: float = 0.0
+    rate_limit_rate: float = 0.0
+    server_error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 120.0
+    retry_after: float = 1.0
+    reply: str = DEFAULT_REPLY
+    embedding_dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS
+    seed: int | None = None
+
+
+def sample_latency(settings: MockServerSettings, rng: random.Random) -> float:
+    """Draw the seconds before a response starts from the configured distribution."""
+    if settings.latency_mean <= 0:
+        return 0.0
+    if settings.latency == "uniform":
+        spread = settings.latency_mean * settings.latency_spread
+        return rng.uniform(settings.latency_mean - spread, settings.latency_mean + spread)
+    if settings.latency == "lognormal":
+        # Choose mu so the distribution's mean is latency_mean
+        mu = math.log(settings.latency_mean) - settings.latency_spread**2 / 2
+        return rng.lognormvariate(mu, settings.latency_spread)
+    return settings.latency_mean
+
+
+def mock_embedding(text: str, dimensions: int) -> list[float]:
+    """Return a deterministic unit vector for the text, so equal texts get equal embeddings."""
+    rng = random.Random(hashlib.sha256(text.encode()).digest())  # nosec: B311
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def extraction_tokens(messages: list[dict]) -> list[tuple[str, int]] | None:
+    """Return the token indexes of a graph extraction request in any index format, or None if it is not one."""
+    inline_header, offsets_header = (prompt.split("{}")[0] for prompt in (INLINE_INPUT_PROMPT, OFFSETS_INPUT_PROMPT))
+    for message in messages:
+        content = message.get("content") or ""
+        match = TUPLES_PATTERN.search(content)
+        if match is not None:
+            try:
+                return [tuple(token) for token in ast.literal_eval(match.group(1))]
+            except (SyntaxError, ValueError):
+                return []
+        if inline_header in content:
+            text = content.split(inline_header, 1)[1]
+            return [(token, int(index)) for token, index in INLINE_PATTERN.findall(text)]
+        if offsets_header in content:
+            text = content.split(offsets_header, 1)[1]
+            return [
+                (token, int(start) + i)
+                for start, line in OFFSETS_PATTERN.findall(text)
+                for i, token in enumerate(line.split(" "))
+            ]
+    return None
+
+
+def node_types(content: str) -> list[str | None]:
+    """Return the node types an extraction prompt allows, or just None if it does not list them."""
+    match = NODE_TYPES_PATTERN.search(content)
+    types = [] if match is None else [name for name in re.findall(r'"(\w+)"', match.group(1)) if name != "None"]
+    return types or [None]
+
+
+def canned_nodes(tokens: list[tuple[str, int]], types: list[str | None], max_nodes: int = 3) -> list[dict]:
+    """Return nodes for the longest word tokens, as a stand-in for real extraction."""
+    words = sorted((token for token in tokens if token[0].isalpha()), key=lambda token: (-len(token[0]), token[1]))
+    chosen = sorted(words[:max_nodes], key=lambda token: token[1])
+    return [
+        {"id": i, "label": text, "spans": [[index]], "type": types[(i - 1) % len(types)]}
+        for i, (text, index) in enumerate(chosen, 1)
+    ]
+
+
+def canned_extraction(messages: list[dict], tokens: list[tuple[str, int]]) -> str:
+    """Return the JSON of the nodes, edges or both asked for by an extraction request."""
+    content = " ".join(message.get("content") or "" for message in messages)
+    nodes = canned_nodes(tokens, node_types(content))
+    if "provide the edges" not in content and "provide the nodes and edges" not in content:
+        return json.dumps({"nodes": nodes})
+    # Connect consecutive nodes with the tokens between them
+    edges = []
+    for source, target in zip(nodes, nodes[1:]):
+        between = [token for token in tokens if source["spans"][0][0] < token[1] < target["spans"][0][0]]
+        edges.append(
+            {
+                "label": " ".join(text for text, _ in between) or "relates to",
+                "source": source["id"],
+                "target": target["id"],
+                "spans": [[index for _, index in between]] if between else [],
+            }
+        )
+    if "provide the nodes and edges" in content:
+        return json.dumps({"nodes": nodes, "edges": edges})
+    return json.dumps({"edges": edges})
+
+
+def reply_chunks(reply: str) -> list[str]:
+    """Split a reply into word-sized stream chunks that join back into the reply."""
+    return re.findall(r"\S+\s*|\s+", reply)
+
+
+def error_response(status_code: int, message: str, headers: dict | None = None) -> JSONResponse:
+    """Return an error in the API's format."""
+    body = {"error": {"message": message, "type": "mock_error", "code": status_code}}
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+def create_app(settings: MockServerSettings | None = None) -> FastAPI:
+    """Create the mock server app."""
+    settings = settings or MockServerSettings()
+    rng = random.Random(settings.seed)  # nosec: B311
+    app = FastAPI(title="Mock OpenAI API")
+    app.state.settings = settings
+    app.state.requests = 0
+
+    async def delay_or_fail() -> JSONResponse | None:
+        """Wait the sampled latency, returning an error response if one is injected."""
+        app.state.requests += 1
+        roll = rng.random()
+        if roll < settings.rate_limit_rate:
+            headers = {"retry-after-ms": str(int(settings.retry_after * 1000))}
+            return error_response(429, "Mock rate limit reached.", headers)
+        roll -= settings.rate_limit_rate
+        if roll < settings.server_error_rate:
+            return error_response(500, "Mock server error.")
+        roll -= settings.server_error_rate
+        if roll < settings.timeout_rate:
+            await asyncio.sleep(settings.timeout_seconds)
+            return error_response(504, "Mock timeout.")
+        await asyncio.sleep(sample_latency(settings, rng))
+        return None
+
+    @app.post("/v1/chat/completions", response_model=None)
+    async def chat_completions(request: Request) -> JSONResponse | StreamingResponse:
+        """Reply to a chat completion, with canned JSON for graph extraction requests."""
+        body = await request.json()
+        error = await delay_or_fail()
+        if error is not None:
+            return error
+        tokens = extraction_tokens(body.get("messages", []))
+        content = settings.reply if tokens is None else canned_extraction(body["messages"], tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4")
+        if not body.get("stream"):
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }
+            )
+
+        async def stream() -> AsyncIterator[str]:
+            """Send the reply as server-sent chunks."""
+            deltas = [{"role": "assistant", "content": ""}] + [{"content": chunk} for chunk in reply_chunks(content)]
+            for i, delta in enumerate([*deltas, {}]):
+                if i > 1:
+                    await asyncio.sleep(settings.token_delay)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None if delta else "stop"}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request) -> JSONResponse:
+        """Return deterministic embeddings of the inputs."""
+        body = await request.json()
+        error = await delay_or_fail()
+        if error is not None:
+            return error
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        dimensions = body.get("dimensions") or settings.embedding_dimensions
+        data = []
+        for i, text in enumerate(texts):
+            embedding = mock_embedding(str(text), dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{dimensions}f", *embedding)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-ada-002"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+    return app
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Run the mock server from the command line."""
+    defaults = MockServerSettings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default=defaults.latency)
+    parser.add_argument("--latency-mean", type=float, default=defaults.latency_mean, help="Mean seconds to respond")
+    parser.add_argument(
+        "--latency-spread",
+        type=float,
+        default=defaults.latency_spread,
+        help="Half-width as a fraction of the mean for uniform, sigma for lognormal",
+    )
+    parser.add_argument("--token-delay", type=float, default=defaults.token_delay, help="Seconds between chunks")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Chance of a 429")
+    parser.add_argument("--server-error-rate", type=float, default=defaults.server_error_rate, help="Chance of a 500")
+    parser.add_argument("--timeout-rate", type=float, default=defaults.timeout_rate, help="Chance of hanging")
+    parser.add_argument("--timeout-seconds", type=float, default=defaults.timeout_seconds)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After of 429s")
+    parser.add_argument("--reply", default=defaults.reply, help="Reply to chat completions")
+    parser.add_argument("--embedding-dimensions", type=int, default=defaults.embedding_dimensions)
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed for repeatable latencies and errors")
+    args = vars(parser.parse_args(argv))
+    host, port = args.pop("host"), args.pop("port")
+    uvicorn.run(create_app(MockServerSettings(**args)), host=host, port=port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 """Functions to build prompts for the LLM model."""
-from typing import List
+from typing import List, Optional
 
 from app.schemas.pydantic_chats import ChatListOut
 from app.schemas.pydantic_therapists import TherapistOut
@@ -53,9 +53,30 @@ def build_first_message_prompt() -> str:
     return "[Provide a message to the user to start the therapy session.]"
 
 
-def build_recent_session_history(history: ChatListOut) -> str:
-    """Build the recent session history prompt."""
-    return f"[Here is a summary of your recent session history:\n\n {ChatListOut.as_string}"
+def build_recent_session_history(history: ChatListOut, summary: Optional[str] = None) -> str:
+    """Build the recent session history prompt from a summary of earlier messages and the latest messages."""
+    if summary:
+        return (
+            f"[Here is a summary of the earlier part of this session:\n\n{summary}\n\n"
+            f"Here are the latest messages:\n\n{history.as_string()}]"
+        )
+    return f"[Here is your recent session history:\n\n{history.as_string()}]"
+
+
+SESSION_SUMMARY_SYSTEM_PROMPT = (
+    "You summarise therapy sessions for the therapist's notes. Keep the facts about the user, their feelings, "
+    "problems and goals, and anything agreed in the session. Be concise and write in the third person."
+)
+
+
+def build_session_summary_prompt(previous_summary: Optional[str], new_messages: ChatListOut) -> str:
+    """Build the prompt to fold new messages into the rolling summary of a session."""
+    previous = previous_summary or "(No summary yet - this is the start of the session.)"
+    return (
+        f"Here is the summary of the session so far:\n\n{previous}\n\n"
+        f"Here are the messages that followed:\n\n{new_messages.as_string()}\n\n"
+        "Rewrite the summary to include the new messages. Reply with the summary only."
+    )
 
 
 def build_next_message_prompt(user_input: str) -> str:
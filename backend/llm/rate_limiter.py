@@ -0,0 +1,244 @@
+"""Client-side rate limiting and priority scheduling of LLM requests.
+
+Each configured model has token buckets for requests and tokens per minute. Requests wait in one queue per
+model ordered by priority then arrival, and only the head of the queue may take from the buckets, so queued
+interactive requests always go before background work and a large request cannot be starved by small ones.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+from typing import NamedTuple
+
+from config import LLM_RATE_LIMITS, logger
+
+from llm.token_counter import count_tokens_batch
+
+# Tokens added per chat message for the role and formatting
+TOKENS_PER_MESSAGE = 4
+# Longest an async waiter sleeps before checking its place in the queue again
+ASYNC_POLL_SECONDS = 0.05
+
+
+class Priority(IntEnum):
+    """Scheduling class of a request - lower values go first."""
+
+    INTERACTIVE = 0
+    EMBEDDING = 1
+    BACKGROUND = 2
+
+
+def estimate_tokens(
+    model: str,
+    texts: list[str] | None = None,
+    messages: list[dict] | None = None,
+    token_counts: list[int] | None = None,
+) -> int:
+    """Estimate the prompt tokens of a request to a model by counting the tokens of its text.
+
+    Token counts the caller already has for the texts are used instead of counting them again.
+    """
+    text_tokens = sum(token_counts) if token_counts is not None else sum(count_tokens_batch(list(texts or []), model))
+    contents = [str(message.get("content", "")) for message in messages or []]
+    return text_tokens + sum(count_tokens_batch(contents, model)) + TOKENS_PER_MESSAGE * len(contents) + 1
+
+
+class TokenBucket:
+    """Bucket holding up to capacity units, refilled continuously over a minute. Not thread safe."""
+
+    def __init__(self, per_minute: float) -> None:
+        """Create a full bucket."""
+        self.capacity = per_minute
+        self.refill_per_second = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """Add the units refilled since the last update."""
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Return the seconds until the amount is available - requests over capacity wait for a full bucket."""
+        shortfall = min(amount, self.capacity) - self.available
+        return max(shortfall, 0) / self.refill_per_second
+
+    def take(self, amount: float) -> None:
+        """Remove the amount, which may leave the bucket in debt for requests over capacity."""
+        self.available -= amount
+
+
+class PriorityMetrics(NamedTuple):
+    """Scheduling metrics of one priority class."""
+
+    queue_depth: int
+    granted: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        """Return the mean wait of the granted requests."""
+        return self.total_wait_seconds / self.granted if self.granted else 0.0
+
+
+class ModelRateLimiter:
+    """Requests and tokens per minute limits of one model, shared by threads and event loops."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float) -> None:
+        """Create the limiter with full buckets."""
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._queue: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._depths = dict.fromkeys(Priority, 0)
+        self._granted = dict.fromkeys(Priority, 0)
+        self._total_wait = dict.fromkeys(Priority, 0.0)
+        self._max_wait = dict.fromkeys(Priority, 0.0)
+
+    def _enqueue(self, priority: Priority) -> tuple[int, int]:
+        """Add a waiter to the queue. Call with the lock held."""
+        ticket = (int(priority), next(self._counter))
+        heapq.heappush(self._queue, ticket)
+        self._depths[priority] += 1
+        return ticket
+
+    def _try_grant(self, ticket: tuple[int, int], n_tokens: int) -> float:
+        """Take from the buckets if the waiter is at the head of the queue, returning 0 or the time to wait.
+
+        Call with the lock held.
+        """
+        if self._queue[0] != ticket:
+            return ASYNC_POLL_SECONDS
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        wait_time = max(self.requests.wait_time(1), self.tokens.wait_time(n_tokens))
+        if wait_time > 0:
+            return wait_time
+        self.requests.take(1)
+        self.tokens.take(n_tokens)
+        heapq.heappop(self._queue)
+        return 0.0
+
+    def _record(self, priority: Priority, waited: float) -> None:
+        """Record a granted request. Call with the lock held."""
+        self._depths[priority] -= 1
+        self._granted[priority] += 1
+        self._total_wait[priority] += waited
+        self._max_wait[priority] = max(self._max_wait[priority], waited)
+        if waited > 1:
+            logger.debug(f"Rate limited {priority.name.lower()} request waited {waited:.2f}s")
+
+    def acquire(self, n_tokens: int, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Block until the request may be sent, returning the seconds waited."""
+        start_time = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(priority)
+            while (wait_time := self._try_grant(ticket, n_tokens)) > 0:
+                self._condition.wait(wait_time)
+            waited = time.monotonic() - start_time
+            self._record(priority, waited)
+            # The next waiter is now at the head of the queue
+            self._condition.notify_all()
+        return waited
+
+    async def async_acquire(self, n_tokens: int, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Wait without blocking the event loop until the request may be sent, returning the seconds waited."""
+        start_time = time.monotonic()
+        with self._lock:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    wait_time = self._try_grant(ticket, n_tokens)
+                    if wait_time == 0:
+                        waited = time.monotonic() - start_time
+                        self._record(priority, waited)
+                        self._condition.notify_all()
+                        return waited
+                await asyncio.sleep(min(wait_time, ASYNC_POLL_SECONDS))
+        except asyncio.CancelledError:
+            # Leave the queue so a cancelled request does not block the ones behind it
+            with self._condition:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._depths[priority] -= 1
+                    self._condition.notify_all()
+            raise
+
+    def metrics(self) -> dict[Priority, PriorityMetrics]:
+        """Return the queue depth and wait times of each priority class."""
+        with self._lock:
+            return {
+                priority: PriorityMetrics(
+                    self._depths[priority],
+                    self._granted[priority],
+                    self._total_wait[priority],
+                    self._max_wait[priority],
+                )
+                for priority in Priority
+            }
+
+
+class RateLimiter:
+    """Rate limiters of the configured models - requests to other models are not limited."""
+
+    def __init__(self, limits: dict[str, dict[str, float]] | None = None) -> None:
+        """Create a limiter per model from {model: {"rpm": requests per minute, "tpm": tokens per minute}}."""
+        self.limiters = {
+            model: ModelRateLimiter(model_limits["rpm"], model_limits["tpm"])
+            for model, model_limits in (limits or {}).items()
+        }
+
+    def acquire(self, model: str, n_tokens: int, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Block until a request to the model may be sent, returning the seconds waited."""
+        limiter = self.limiters.get(model)
+        return limiter.acquire(n_tokens, priority) if limiter is not None else 0.0
+
+    async def async_acquire(self, model: str, n_tokens: int, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Wait without blocking the event loop until a request to the model may be sent."""
+        limiter = self.limiters.get(model)
+        return await limiter.async_acquire(n_tokens, priority) if limiter is not None else 0.0
+
+    def acquire_request(
+        self,
+        model: str,
+        priority: Priority = Priority.INTERACTIVE,
+        texts: list[str] | None = None,
+        messages: list[dict] | None = None,
+        token_counts: list[int] | None = None,
+    ) -> float:
+        """Block until a request with the texts or messages may be sent, only estimating its tokens if limited."""
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            return 0.0
+        return limiter.acquire(estimate_tokens(model, texts, messages, token_counts), priority)
+
+    async def async_acquire_request(
+        self,
+        model: str,
+        priority: Priority = Priority.INTERACTIVE,
+        texts: list[str] | None = None,
+        messages: list[dict] | None = None,
+        token_counts: list[int] | None = None,
+    ) -> float:
+        """Wait without blocking the event loop until a request with the texts or messages may be sent."""
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            return 0.0
+        return await limiter.async_acquire(estimate_tokens(model, texts, messages, token_counts), priority)
+
+    def metrics(self) -> dict[str, dict[Priority, PriorityMetrics]]:
+        """Return the queue depth and wait time metrics of each limited model."""
+        return {model: limiter.metrics() for model, limiter in self.limiters.items()}
+
+
+rate_limiter = RateLimiter(LLM_RATE_LIMITS)
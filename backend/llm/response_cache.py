@@ -0,0 +1,75 @@
+"""Persistent cache of deterministic LLM responses."""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL_SECONDS
+
+from llm.sqlite_lru import SQLiteLRUCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used INTEGER NOT NULL
+)
+"""
+
+
+def request_key(model: str, messages: list[dict], temperature: float) -> str:
+    """Return the cache key of a chat completion request."""
+    request = json.dumps([model, messages, temperature], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class ResponseCache(SQLiteLRUCache):
+    """SQLite cache of chat completion responses keyed by a hash of the model, messages and temperature.
+
+    Only suitable for requests whose response is effectively determined by the request, such as low temperature
+    extraction. Entries older than ttl_seconds are treated as misses, and once the cache holds more than
+    max_entries responses the least recently used ones are evicted.
+    """
+
+    table = "responses"
+    schema = SCHEMA
+    value_columns = ("response", "created_at")
+
+    def __init__(
+        self,
+        path: Path | str,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+    ) -> None:
+        """Open the cache, creating the database if needed."""
+        super().__init__(path, max_entries)
+        self.ttl_seconds = ttl_seconds
+
+    def _is_expired(self, row: tuple) -> bool:
+        """Check if the response was cached more than ttl_seconds ago."""
+        return time.time() - row[1] > self.ttl_seconds
+
+    def get(self, model: str, messages: list[dict], temperature: float) -> str | None:
+        """Return the cached response to the request, or None on a miss or if it has expired."""
+        row = self._get_row(request_key(model, messages, temperature))
+        return None if row is None else row[0]
+
+    def put(self, model: str, messages: list[dict], temperature: float, response: str) -> None:
+        """Cache the response to the request, evicting the least recently used if over the limit."""
+        # Replace any existing entry, which may have expired, so the TTL restarts
+        self._put_row(request_key(model, messages, temperature), (response, time.time()), replace=True)
+
+
+@lru_cache(maxsize=1)
+def get_response_cache() -> ResponseCache | None:
+    """Return the process-wide response cache, or None if it is not configured."""
+    if RESPONSE_CACHE_PATH is None:
+        return None
+    return ResponseCache(RESPONSE_CACHE_PATH)
@@ -0,0 +1,98 @@
+"""Base of the persistent SQLite caches with least recently used eviction."""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import ClassVar
+
+from config import logger
+
+
+class SQLiteLRUCache:
+    """Thread-safe SQLite table of rows keyed by a hash, evicting the least recently used rows.
+
+    Subclasses give the table, its schema with a key and last_used column, and the value columns, and build
+    their get and put on _get_row and _put_row. Once the table holds more than max_entries rows the least
+    recently used ones are evicted.
+    """
+
+    table: ClassVar[str]
+    schema: ClassVar[str]
+    value_columns: ClassVar[tuple[str, ...]]
+
+    def __init__(self, path: Path | str, max_entries: int) -> None:
+        """Open the cache, creating the database if needed."""
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(self.schema)
+        self._lock = threading.Lock()
+        # Table and column names are class constants, so building the queries from them is safe
+        columns = ", ".join(self.value_columns)
+        placeholders = ", ".join("?" * (len(self.value_columns) + 2))
+        self._select_query = f"SELECT {columns} FROM {self.table} WHERE key = ?"  # noqa: S608
+        self._insert_query = f"INTO {self.table} (key, {columns}, last_used) VALUES ({placeholders})"
+        self._touch_query = f"UPDATE {self.table} SET last_used = ? WHERE key = ?"  # noqa: S608
+        self._delete_query = f"DELETE FROM {self.table} WHERE key = ?"  # noqa: S608
+        self._evict_query = (
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)"  # noqa: S608
+        )
+        self._size = self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]  # noqa: S608
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached rows."""
+        return self._size
+
+    def _is_expired(self, row: tuple) -> bool:  # noqa: ARG002
+        """Check if a cached row should be treated as a miss - rows never expire unless a subclass says so."""
+        return False
+
+    def _get_row(self, key: str) -> tuple | None:
+        """Return the value columns of the key's row, or None on a miss, marking the row as used."""
+        with self._lock:
+            row = self._connection.execute(self._select_query, (key,)).fetchone()
+            if row is not None and self._is_expired(row):
+                self._connection.execute(self._delete_query, (key,))
+                self._size -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute(self._touch_query, (time.time_ns(), key))
+        return row
+
+    def _put_row(self, key: str, values: tuple, *, replace: bool = False) -> None:
+        """Cache the values under the key, keeping any existing row unless replacing it, and evict if over the limit."""
+        with self._lock:
+            if replace:
+                exists = self._connection.execute(self._select_query, (key,)).fetchone() is not None
+                self._connection.execute(f"INSERT OR REPLACE {self._insert_query}", (key, *values, time.time_ns()))
+                self._size += not exists
+            else:
+                cursor = self._connection.execute(
+                    f"INSERT OR IGNORE {self._insert_query}", (key, *values, time.time_ns())
+                )
+                self._size += cursor.rowcount
+            if self._size > self.max_entries:
+                n_evict = self._size - self.max_entries
+                self._connection.execute(self._evict_query, (n_evict,))
+                self._size -= n_evict
+                logger.debug(f"Evicted {n_evict} rows from the {self.table} cache")
+
+    def clear(self) -> None:
+        """Remove all cached rows and reset the counters."""
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table}")  # noqa: S608
+            self._size = 0
+            self.hits = self.misses = 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._connection.close()
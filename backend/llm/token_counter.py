@@ -0,0 +1,145 @@
+"""Fast token counting for chat models with memoised encoders and counts."""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple
+
+import tiktoken
+from config import logger
+
+# Encoding of models tiktoken does not know
+DEFAULT_ENCODING = "cl100k_base"
+# Rough characters per token, used when the tokeniser cannot be loaded
+CHARS_PER_TOKEN = 4
+# Distinct strings whose counts are remembered, such as system prompts sent every turn
+COUNT_CACHE_SIZE = 4096
+
+
+class MessageOverhead(NamedTuple):
+    """Tokens a chat model adds around the message contents."""
+
+    per_message: int
+    per_name: int
+    per_reply: int
+
+
+# Longest matching prefix wins, so dated snapshots such as gpt-4o-2024-08-06 use their family's overhead
+MESSAGE_OVERHEADS = {
+    "gpt-3.5-turbo-0301": MessageOverhead(per_message=4, per_name=-1, per_reply=2),
+    "gpt-3.5-turbo": MessageOverhead(per_message=3, per_name=1, per_reply=3),
+    "gpt-4": MessageOverhead(per_message=3, per_name=1, per_reply=3),
+    "gpt-4o": MessageOverhead(per_message=3, per_name=1, per_reply=3),
+}
+
+
+def message_overhead(model: str) -> MessageOverhead:
+    """Return the message overhead of a chat model, raising NotImplementedError for unknown models."""
+    prefixes = [prefix for prefix in MESSAGE_OVERHEADS if model.startswith(prefix)]
+    if not prefixes:
+        msg = f"num_tokens_from_messages() is not presently implemented for model {model}."
+        raise NotImplementedError(msg)
+    return MESSAGE_OVERHEADS[max(prefixes, key=len)]
+
+
+@lru_cache(maxsize=None)
+def load_encoding(encoding_name: str) -> tiktoken.Encoding | None:
+    """Return the named tokeniser, or None if it cannot be loaded."""
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except OSError:
+        logger.warning(f"Could not load the {encoding_name} tokeniser - estimating token counts from text length")
+        return None
+
+
+@lru_cache(maxsize=None)
+def encoding_name_for_model(model: str) -> str:
+    """Return the name of the tokeniser a model uses."""
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        return DEFAULT_ENCODING
+
+
+def get_encoding(model: str) -> tiktoken.Encoding | None:
+    """Return the tokeniser of a model, or None if it cannot be loaded."""
+    return load_encoding(encoding_name_for_model(model))
+
+
+class TokenCountCache:
+    """Thread-safe LRU of token counts keyed by tokeniser and text."""
+
+    def __init__(self, max_entries: int = COUNT_CACHE_SIZE) -> None:
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self._counts: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, encoding_name: str, text: str) -> int | None:
+        """Return the cached count of the text, or None on a miss."""
+        key = (encoding_name, text)
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def put(self, encoding_name: str, text: str, count: int) -> None:
+        """Cache the count of the text, evicting the least recently used count if over the limit."""
+        with self._lock:
+            self._counts[(encoding_name, text)] = count
+            self._counts.move_to_end((encoding_name, text))
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all counts."""
+        with self._lock:
+            self._counts.clear()
+
+
+token_count_cache = TokenCountCache()
+
+
+def count_tokens_batch(texts: list[str], model: str = "gpt-3.5-turbo") -> list[int]:
+    """Count the tokens of each text, encoding the uncached texts together in one batch."""
+    encoding_name = encoding_name_for_model(model)
+    encoding = load_encoding(encoding_name)
+    if encoding is None:
+        return [len(text) // CHARS_PER_TOKEN + 1 for text in texts]
+    counts = [token_count_cache.get(encoding_name, text) for text in texts]
+    # Encode each distinct uncached text once
+    missing = list(dict.fromkeys(text for text, count in zip(texts, counts) if count is None))
+    if missing:
+        encoded = dict(zip(missing, encoding.encode_batch(missing, disallowed_special=())))
+        for text, tokens in encoded.items():
+            token_count_cache.put(encoding_name, text, len(tokens))
+        counts = [len(encoded[text]) if count is None else count for text, count in zip(texts, counts)]
+    return counts
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count the tokens of a text."""
+    return count_tokens_batch([text], model)[0]
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """Cut a text down to its first max_tokens tokens."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def num_tokens_from_messages(messages: list[dict], model: str = "gpt-3.5-turbo") -> int:
+    """Return the number of prompt tokens used by a list of chat messages, including the reply priming."""
+    overhead = message_overhead(model)
+    values = [value for message in messages for value in message.values()]
+    num_tokens = sum(count_tokens_batch(values, model)) + overhead.per_reply
+    for message in messages:
+        num_tokens += overhead.per_message
+        if "name" in message:
+            num_tokens += overhead.per_name
+    return num_tokens
@@ -0,0 +1,16 @@
+"""Formats of the token indexes in graph extraction prompts.
+
+Kept apart from llm.graph_processing, which creates the API client on import, so the mock server can recognise
+the formats without an API key.
+"""
+
+# How the input text and the index of each token are given to the model - see graph_processing.format_input_text
+TOKEN_INDEX_FORMATS = ("tuples", "inline", "offsets")
+TUPLES_INPUT_PROMPT = "Input Text: \n{}\n\nToken Indexes: {}"
+INLINE_INPUT_PROMPT = "Input Text, with the index of each token in square brackets after it: \n{}"
+OFFSETS_INPUT_PROMPT = (
+    "Input Text, as lines of tokens separated by spaces, with the index of the first token of each line in square "
+    "brackets at its start: \n{}"
+)
+# Tokens per line of the offsets format, so no token is far from an index to count from
+OFFSETS_LINE_TOKENS = 8
@@ -0,0 +1,21 @@
+"""Initiate the chat memory module."""
+
+from .chat_memory_cache import ChatMemoryCache, chat_memory_cache
+from .chat_memory_store import ChatMemoryStore
+from .embedding_shard import EmbeddingShard
+from .index_factory import create_vector_index
+from .ivf_vector_index import IVFVectorIndex
+from .vector_index import MISSING_ID, VectorIndex
+from .vector_loader import load_vector_store
+
+__all__ = [
+    "ChatMemoryCache",
+    "ChatMemoryStore",
+    "EmbeddingShard",
+    "IVFVectorIndex",
+    "MISSING_ID",
+    "VectorIndex",
+    "chat_memory_cache",
+    "create_vector_index",
+    "load_vector_store",
+]
@@ -0,0 +1,145 @@
+"""Process-wide cache of chat memory stores shared across therapy session instances."""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable
+
+from config import CHAT_MEMORY_CACHE_MAX_BYTES, logger
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from logic.chat_memory.vector_index import VectorIndex
+
+# Stores are keyed by (user_id, therapist_id)
+ChatMemoryKey = tuple[int, int]
+
+
+class ChatMemoryCache:
+    """LRU cache of chat memory indexes under a memory budget.
+
+    Each websocket connection and new session builds its own TherapySessionLogic, so the stores are held
+    here instead to let reconnects and parallel sessions for the same user reuse a warm index. The least
+    recently used stores are evicted once the total allocated bytes exceed the budget, although the most
+    recently used store is always kept.
+    """
+
+    def __init__(self, max_bytes: int = CHAT_MEMORY_CACHE_MAX_BYTES) -> None:
+        """Create an empty cache."""
+        self.max_bytes = max_bytes
+        self._stores: OrderedDict[ChatMemoryKey, VectorIndex] = OrderedDict()
+        self._sizes: dict[ChatMemoryKey, int] = {}
+        self._total_bytes = 0
+        # Chats added to keys while they load, one list per running load, applied once the store is cached
+        self._pending: dict[ChatMemoryKey, list[list[tuple[int, np.ndarray | None]]]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached stores."""
+        return len(self._stores)
+
+    def __contains__(self, key: ChatMemoryKey) -> bool:
+        """Check if a store is cached for the key."""
+        return key in self._stores
+
+    @property
+    def total_bytes(self) -> int:
+        """Return the bytes allocated by all cached stores."""
+        return self._total_bytes
+
+    def _resize(self, key: ChatMemoryKey) -> None:
+        """Update the recorded size of a store and evict down to the budget."""
+        size = self._stores[key].nbytes
+        self._total_bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        while self._total_bytes > self.max_bytes and len(self._stores) > 1:
+            evicted_key, _ = self._stores.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(evicted_key)
+            self.evictions += 1
+            logger.debug(f"Evicted chat memory for {evicted_key} from cache")
+
+    def get(self, key: ChatMemoryKey) -> VectorIndex | None:
+        """Return the cached store for the key, marking it as recently used."""
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._stores.move_to_end(key)
+            return store
+
+    def put(self, key: ChatMemoryKey, store: VectorIndex) -> None:
+        """Cache a store for the key, replacing any existing one."""
+        with self._lock:
+            self._stores[key] = store
+            self._stores.move_to_end(key)
+            self._resize(key)
+
+    def get_or_load(self, key: ChatMemoryKey, loader: Callable[[], VectorIndex]) -> VectorIndex:
+        """Return the cached store for the key, building and caching it with the loader on a miss.
+
+        Chats added for the key while it loads may be missing from what the loader read, so they are added to
+        the store once it is cached.
+        """
+        with self._lock:
+            store = self.get(key)
+            if store is not None:
+                return store
+            pending = []
+            self._pending.setdefault(key, []).append(pending)
+        try:
+            # Load outside the lock so one slow load does not block every other user
+            store = loader()
+        finally:
+            with self._lock:
+                self._pending[key].remove(pending)
+                if not self._pending[key]:
+                    del self._pending[key]
+        with self._lock:
+            existing = self._stores.get(key)
+            if existing is not None:
+                # Another session loaded the same store in the meantime and added the pending chats to it
+                return existing
+            for chat_id, vector in pending:
+                store.add(chat_id, vector)
+            self.put(key, store)
+        return store
+
+    def add_chat(self, key: ChatMemoryKey, chat_id: int, vector: np.ndarray | None) -> bool:
+        """Append a chat vector to the cached store in place - returns False if nothing was added.
+
+        Stores that are not cached are left alone as they will pick up the chat when next loaded, and stores that
+        are loading add the chat once they are cached.
+        """
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                for pending in self._pending.get(key, []):
+                    pending.append((chat_id, vector))
+                return False
+            if not store.add(chat_id, vector):
+                return False
+            self._resize(key)
+            return True
+
+    def invalidate(self, key: ChatMemoryKey) -> None:
+        """Drop the cached store for the key."""
+        with self._lock:
+            if self._stores.pop(key, None) is not None:
+                self._total_bytes -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        """Drop all cached stores and reset the counters."""
+        with self._lock:
+            self._stores.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+chat_memory_cache = ChatMemoryCache()
@@ -0,0 +1,189 @@
+"""In-memory store of chat embeddings used for similarity search over past chats."""
+from __future__ import annotations
+
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+
+from logic.chat_memory.vector_index import (
+    VectorIndex,
+    empty_top_k,
+    finalise_top_k,
+    normalise_queries,
+    rank_top_k,
+)
+
+DEFAULT_INITIAL_CAPACITY = 64
+
+
+def normalise_rows_in_place(rows: np.ndarray) -> np.ndarray:
+    """Scale the float rows to unit length in place, returning their original norms - zero rows stay zero."""
+    norms = np.linalg.norm(rows, axis=1)
+    np.divide(rows, norms[:, None], out=rows, where=norms[:, None] > 0)
+    return norms
+
+
+def normalise_rows(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return float32 unit-length copies of the rows with their original norms - zero rows stay zero."""
+    rows = np.array(np.atleast_2d(vectors), dtype=np.float32)
+    return rows, normalise_rows_in_place(rows)
+
+
+class ChatMemoryStore(VectorIndex):
+    """Growable matrix of pre-normalised chat embeddings with an aligned array of chat ids.
+
+    Vectors are stored as float32 rows that are normalised once on insert, so a cosine similarity
+    query is a single matrix-vector product. The buffer doubles in capacity when full, which keeps
+    appends amortised O(1) rather than copying the whole matrix on every new message. Searches scan
+    every row, which makes this the exact baseline for the other vector indexes.
+    """
+
+    def __init__(self, dim: int | None = None, initial_capacity: int = DEFAULT_INITIAL_CAPACITY) -> None:
+        """Create an empty store - the dimension is taken from the first vector if not given."""
+        if initial_capacity < 1:
+            msg = "Initial capacity must be at least 1."
+            raise ValueError(msg)
+        self.dim = dim
+        self._size = 0
+        self._capacity = initial_capacity
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._norms = np.empty(initial_capacity, dtype=np.float32)
+        self._vectors = None if dim is None else np.empty((initial_capacity, dim), dtype=np.float32)
+        self._id_set = set()
+
+    @classmethod
+    def from_arrays(cls, chat_ids: np.ndarray, vectors: np.ndarray, norms: np.ndarray) -> ChatMemoryStore:
+        """Wrap already normalised float32 arrays, such as memory-mapped shards, without copying them.
+
+        The arrays are only copied into a growable buffer when the first new vector is added.
+        """
+        if not (len(chat_ids) == len(vectors) == len(norms)):
+            msg = "Chat ids, vectors and norms must have the same length."
+            raise ValueError(msg)
+        store = cls(dim=vectors.shape[1], initial_capacity=max(len(vectors), 1))
+        store._vectors, store._ids, store._norms = vectors, chat_ids, norms
+        store._size = len(vectors)
+        store._id_set.update(chat_ids.tolist())
+        return store
+
+    def __len__(self) -> int:
+        """Return the number of stored vectors."""
+        return self._size
+
+    def __contains__(self, chat_id: int) -> bool:
+        """Check if a chat id is already in the store."""
+        return chat_id in self._id_set
+
+    @property
+    def capacity(self) -> int:
+        """Return the number of rows the buffers can hold before growing."""
+        return self._capacity
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Return the chat ids aligned with the rows of the vector matrix."""
+        return self._ids[: self._size]
+
+    @property
+    def norms(self) -> np.ndarray:
+        """Return the original norms of the stored vectors."""
+        return self._norms[: self._size]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Return the normalised vector matrix as a view of the used part of the buffer."""
+        if self._vectors is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._vectors[: self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Return the number of bytes allocated by the buffers - memory-mapped buffers live in the shared page cache."""
+        buffers = (self._vectors, self._ids, self._norms)
+        return sum(buffer.nbytes for buffer in buffers if buffer is not None and not isinstance(buffer, np.memmap))
+
+    def _validate(self, vectors: np.ndarray) -> np.ndarray:
+        """Check the vectors are a 2D numeric matrix matching the store dimension."""
+        if not np.issubdtype(vectors.dtype, np.number):
+            msg = f"Vector elements must be numbers, not {vectors.dtype}."
+            raise ValueError(msg)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            msg = f"Vector dimension {vectors.shape[1]} does not match store dimension {self.dim}."
+            raise ValueError(msg)
+        return vectors
+
+    def _reserve(self, required: int) -> None:
+        """Grow the buffers by doubling until they can hold the required number of rows."""
+        if self._vectors is None:
+            self._vectors = np.empty((self._capacity, self.dim), dtype=np.float32)
+        if required <= self._capacity and self._vectors.flags.writeable:
+            return
+        # Adopted read-only arrays are copied into memory here on the first append
+        new_capacity = self._capacity
+        while new_capacity < required:
+            new_capacity *= 2
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        vectors[: self._size] = self._vectors[: self._size]
+        ids = np.empty(new_capacity, dtype=np.int64)
+        ids[: self._size] = self._ids[: self._size]
+        norms = np.empty(new_capacity, dtype=np.float32)
+        norms[: self._size] = self._norms[: self._size]
+        self._vectors, self._ids, self._norms = vectors, ids, norms
+        self._capacity = new_capacity
+
+    def add(self, chat_id: int, vector: np.ndarray | None) -> bool:
+        """Add a single chat vector - returns False if the vector is missing or the chat is already stored."""
+        if vector is None or len(vector) == 0 or chat_id in self._id_set:
+            return False
+        self.extend([chat_id], np.asarray(vector).reshape(1, -1))
+        return True
+
+    def extend(self, chat_ids: Iterable[int], vectors: np.ndarray) -> None:
+        """Add a batch of chat vectors in one copy."""
+        chat_ids = np.fromiter(chat_ids, dtype=np.int64)
+        if len(chat_ids) == 0:
+            return
+        vectors = self._validate(np.atleast_2d(vectors))
+        if len(chat_ids) != len(vectors):
+            msg = f"Got {len(chat_ids)} chat ids for {len(vectors)} vectors."
+            raise ValueError(msg)
+        start, end = self._size, self._size + len(chat_ids)
+        self._reserve(end)
+        # Normalise in the store's own rows so the batch is copied only once. Zero vectors are left as zeros
+        # so they score 0 against any query
+        rows = self._vectors[start:end]
+        rows[...] = vectors
+        self._norms[start:end] = normalise_rows_in_place(rows)
+        self._ids[start:end] = chat_ids
+        self._id_set.update(chat_ids.tolist())
+        self._size = end
+
+    def top_k(
+        self, query_vectors: np.ndarray, k: int | None = None, min_score: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the chat ids and scores of the k most similar stored vectors by an exact scan, best first."""
+        queries, single = normalise_queries(query_vectors)
+        k = self._size if k is None else min(k, self._size)
+        if k <= 0:
+            return empty_top_k(len(queries), single)
+        rows, scores = rank_top_k(queries @ self.vectors.T, k)
+        return finalise_top_k(self.ids[rows], scores, min_score, single)
+
+    def clear(self) -> None:
+        """Remove all vectors while keeping the allocated buffers."""
+        self._size = 0
+        self._id_set.clear()
+
+    def save(self, path: Path | str) -> None:
+        """Save the store to an uncompressed numpy archive."""
+        with Path(path).open("wb") as file:
+            np.savez(file, ids=self.ids, vectors=self.vectors, norms=self.norms)
+
+    @classmethod
+    def load(cls, path: Path | str) -> ChatMemoryStore:
+        """Load a store saved with save."""
+        with np.load(path, allow_pickle=False) as archive:
+            return cls.from_arrays(archive["ids"], archive["vectors"], archive["norms"])
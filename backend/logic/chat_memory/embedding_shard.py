@@ -0,0 +1,173 @@
+"""Append-only on-disk shards of chat embeddings that can be memory-mapped for search."""
+from __future__ import annotations
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from config import logger
+
+from logic.chat_memory.chat_memory_store import ChatMemoryStore, normalise_rows
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - file locking is not available on Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+SHARD_VERSION = 2
+# Each chat has one index record, written after its vector row so it acts as the commit marker
+INDEX_DTYPE = np.dtype([("id", "<i8"), ("norm", "<f4")])
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+class EmbeddingShard:
+    """Chat embeddings for one user and therapist stored as raw files on disk.
+
+    A shard is three files: a JSON header recording the embedding model and dimension, a raw float32
+    matrix of normalised vectors and a sidecar of (chat id, norm) records. Search maps the files with
+    np.memmap, so the rows are never copied into process memory and the OS page cache is shared between
+    workers. The chat rows in the database remain the source of truth, and shards are rebuilt from them
+    when missing or stale, such as after the embedding model changes.
+    """
+
+    def __init__(self, root: Path | str, user_id: int, therapist_id: int, model: str) -> None:
+        """Point at the shard of a model's embeddings for a user and therapist - no files are touched until used."""
+        self.root = Path(root)
+        self.model = model
+        stem = f"user_{user_id}_therapist_{therapist_id}"
+        self.header_path = self.root / f"{stem}.json"
+        self.vectors_path = self.root / f"{stem}.f32"
+        self.index_path = self.root / f"{stem}.idx"
+
+    def exists(self) -> bool:
+        """Check if the shard has been written."""
+        return self.header_path.exists() and self.vectors_path.exists() and self.index_path.exists()
+
+    def __len__(self) -> int:
+        """Return the number of committed rows."""
+        if not self.index_path.exists():
+            return 0
+        return self.index_path.stat().st_size // INDEX_DTYPE.itemsize
+
+    @property
+    def dim(self) -> int:
+        """Return the vector dimension recorded in the header."""
+        header = json.loads(self.header_path.read_text())
+        if header.get("version") != SHARD_VERSION:
+            msg = f"Unsupported embedding shard version {header.get('version')} in {self.header_path}."
+            raise ValueError(msg)
+        return header["dim"]
+
+    def is_stale(self, dim: int | None = None) -> bool:
+        """Check if the shard was written in an older format, by another model or with another dimension."""
+        header = json.loads(self.header_path.read_text())
+        return (
+            header.get("version") != SHARD_VERSION
+            or header.get("model") != self.model
+            or (dim is not None and header.get("dim") != dim)
+        )
+
+    @property
+    def lock_path(self) -> Path:
+        """Return the path of the lock file shared by all workers."""
+        return self.index_path.with_suffix(".lock")
+
+    @contextmanager
+    def _locked(self, *, shared: bool = False) -> Iterator[None]:
+        """Lock the shard so workers do not interleave rows or map a half-replaced shard."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self.lock_path.open("a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def open_store(self) -> ChatMemoryStore:
+        """Return a chat memory store backed by read-only memory maps of the shard."""
+        with self._locked(shared=True):
+            dim = self.dim
+            count = len(self)
+            if count == 0:
+                return ChatMemoryStore(dim=dim)
+            index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+            vectors = np.memmap(self.vectors_path, dtype=VECTOR_DTYPE, mode="r", shape=(count, dim))
+        return ChatMemoryStore.from_arrays(index["id"], vectors, index["norm"])
+
+    def write(self, store: ChatMemoryStore) -> None:
+        """Replace the shard with the contents of a chat memory store."""
+        if store.dim is None:
+            msg = "Cannot write an embedding shard without a vector dimension."
+            raise ValueError(msg)
+        with self._locked():
+            for path, data in (
+                (self.vectors_path, store.vectors.astype(VECTOR_DTYPE, copy=False)),
+                (self.index_path, self._index_records(store.ids, store.norms)),
+            ):
+                temp_path = path.with_suffix(f"{path.suffix}.tmp")
+                data.tofile(temp_path)
+                os.replace(temp_path, path)
+            temp_path = self.header_path.with_suffix(".json.tmp")
+            header = {"version": SHARD_VERSION, "model": self.model, "dim": store.dim, "dtype": VECTOR_DTYPE.str}
+            temp_path.write_text(json.dumps(header))
+            os.replace(temp_path, self.header_path)
+        logger.debug(f"Wrote {len(store)} chat embeddings to {self.vectors_path}")
+
+    def append(self, chat_ids: list[int], vectors: np.ndarray) -> None:
+        """Append chat vectors to the end of the shard, skipping chats it already holds.
+
+        A worker may rebuild the shard from the chat rows between another worker saving a chat and appending it,
+        so the ids are checked under the lock. Nothing is appended if the shard was deleted in the meantime, as it
+        is rebuilt with the chats on the next load.
+        """
+        if len(chat_ids) == 0:
+            return
+        rows, norms = normalise_rows(vectors)
+        with self._locked():
+            if not self.exists():
+                return
+            dim = self.dim
+            if rows.shape[1] != dim:
+                msg = f"Vector dimension {rows.shape[1]} does not match shard dimension {dim}."
+                raise ValueError(msg)
+            count = len(self)
+            new = ~np.isin(chat_ids, np.fromfile(self.index_path, dtype=INDEX_DTYPE, count=count)["id"])
+            if not new.any():
+                return
+            chat_ids, rows, norms = np.asarray(chat_ids)[new], rows[new], norms[new]
+            committed_bytes = count * dim * VECTOR_DTYPE.itemsize
+            with self.vectors_path.open("r+b") as vectors_file:
+                # Drop any rows left behind by a write that crashed before its index records
+                vectors_file.truncate(committed_bytes)
+                vectors_file.seek(committed_bytes)
+                vectors_file.write(rows.astype(VECTOR_DTYPE, copy=False).tobytes())
+                vectors_file.flush()
+                os.fsync(vectors_file.fileno())
+            with self.index_path.open("ab") as index_file:
+                index_file.write(self._index_records(chat_ids, norms).tobytes())
+
+    def delete(self) -> None:
+        """Remove the shard files under the lock.
+
+        The lock file is kept, since a worker waiting on it would otherwise lock a file that no longer exists
+        while another creates and locks a new one.
+        """
+        with self._locked():
+            for path in (self.header_path, self.vectors_path, self.index_path):
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _index_records(chat_ids: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """Pack chat ids and norms into index records."""
+        records = np.empty(len(chat_ids), dtype=INDEX_DTYPE)
+        records["id"] = chat_ids
+        records["norm"] = norms
+        return records
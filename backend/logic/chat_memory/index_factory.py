@@ -0,0 +1,21 @@
+"""Factory to build the configured type of vector index."""
+from __future__ import annotations
+
+from config import IVF_N_LISTS, IVF_N_PROBE, VECTOR_INDEX_TYPE
+
+from logic.chat_memory.chat_memory_store import ChatMemoryStore
+from logic.chat_memory.ivf_vector_index import IVFVectorIndex
+from logic.chat_memory.vector_index import VectorIndex
+
+VECTOR_INDEX_TYPES = ("exact", "ivf")
+
+
+def create_vector_index(store: ChatMemoryStore | None = None, index_type: str = VECTOR_INDEX_TYPE) -> VectorIndex:
+    """Wrap a store of vectors in the requested type of index - an exact index is the store itself."""
+    store = store if store is not None else ChatMemoryStore()
+    if index_type == "exact":
+        return store
+    if index_type == "ivf":
+        return IVFVectorIndex(store=store, n_lists=IVF_N_LISTS, n_probe=IVF_N_PROBE)
+    msg = f"Unknown vector index type {index_type} - must be one of {VECTOR_INDEX_TYPES}."
+    raise ValueError(msg)
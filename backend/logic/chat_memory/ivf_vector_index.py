@@ -0,0 +1,234 @@
+"""Inverted file (IVF) approximate nearest neighbour index over normalised embeddings."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from config import logger
+
+from logic.chat_memory.chat_memory_store import ChatMemoryStore
+from logic.chat_memory.vector_index import (
+    MISSING_ID,
+    VectorIndex,
+    empty_top_k,
+    finalise_top_k,
+    normalise_queries,
+    rank_top_k,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+DEFAULT_N_LISTS = 64
+DEFAULT_N_PROBE = 8
+# Train the coarse quantiser once there are this many vectors per list on average
+TRAIN_POINTS_PER_LIST = 8
+# Cap on the number of vectors sampled to train the coarse quantiser
+MAX_TRAIN_POINTS_PER_LIST = 256
+KMEANS_ITERATIONS = 10
+# Rows assigned to centroids per matrix product, to bound temporary memory
+ASSIGN_CHUNK_SIZE = 4096
+
+
+class IVFVectorIndex(VectorIndex):
+    """Approximate nearest neighbour index using a spherical k-means coarse quantiser.
+
+    Vectors are grouped into n_lists clusters and a query only scores the vectors in the n_probe clusters
+    whose centroids are closest to it. Raising n_probe trades latency for recall, and n_probe equal to
+    n_lists gives exact results. The vectors themselves live in a ChatMemoryStore, which may be memory
+    mapped from an embedding shard. Until there are enough vectors to train the quantiser searches fall
+    back to an exact scan.
+    """
+
+    def __init__(
+        self,
+        store: ChatMemoryStore | None = None,
+        n_lists: int = DEFAULT_N_LISTS,
+        n_probe: int = DEFAULT_N_PROBE,
+        seed: int = 0,
+    ) -> None:
+        """Create an index over a store, training it straight away if the store is big enough."""
+        if n_lists < 1 or n_probe < 1:
+            msg = "n_lists and n_probe must be at least 1."
+            raise ValueError(msg)
+        self.store = store if store is not None else ChatMemoryStore()
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids: np.ndarray | None = None
+        self._assignments: list[int] = []
+        self._lists: list[list[int]] = []
+        self._list_arrays: list[np.ndarray | None] = []
+        if len(self.store) >= self.train_threshold:
+            self.train()
+
+    @property
+    def dim(self) -> int | None:
+        """Return the vector dimension."""
+        return self.store.dim
+
+    @property
+    def train_threshold(self) -> int:
+        """Return the number of vectors needed before the quantiser is trained."""
+        return self.n_lists * TRAIN_POINTS_PER_LIST
+
+    @property
+    def is_trained(self) -> bool:
+        """Check if the coarse quantiser has been trained."""
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        """Return the number of stored vectors."""
+        return len(self.store)
+
+    def __contains__(self, item_id: int) -> bool:
+        """Check if an id is already in the index."""
+        return item_id in self.store
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Return the ids of the stored vectors in insertion order."""
+        return self.store.ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Return the normalised vectors aligned with the ids."""
+        return self.store.vectors
+
+    @property
+    def nbytes(self) -> int:
+        """Return the bytes held by the store, centroids and inverted lists."""
+        centroid_bytes = 0 if self.centroids is None else self.centroids.nbytes
+        # Each row appears once in the assignments and once in an inverted list
+        return self.store.nbytes + centroid_bytes + 2 * np.dtype(np.int64).itemsize * len(self._assignments)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Return the nearest centroid for each normalised vector."""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+            chunk = vectors[start : start + ASSIGN_CHUNK_SIZE]
+            assignments[start : start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assignments
+
+    def _index_rows(self, first_row: int) -> None:
+        """Assign the rows from first_row onwards to inverted lists."""
+        assignments = self._assign(self.store.vectors[first_row:])
+        for row, list_number in enumerate(assignments.tolist(), start=first_row):
+            self._lists[list_number].append(row)
+            self._list_arrays[list_number] = None
+        self._assignments.extend(assignments.tolist())
+
+    def train(self) -> None:
+        """Fit the coarse quantiser with spherical k-means and rebuild the inverted lists."""
+        vectors = self.store.vectors
+        if len(vectors) < self.n_lists:
+            msg = f"Need at least {self.n_lists} vectors to train, got {len(vectors)}."
+            raise ValueError(msg)
+        rng = np.random.default_rng(self.seed)
+        n_train = min(len(vectors), self.n_lists * MAX_TRAIN_POINTS_PER_LIST)
+        sample = vectors[np.sort(rng.choice(len(vectors), n_train, replace=False))]
+        centroids = sample[rng.choice(n_train, self.n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Re-seed empty clusters with random sample points
+            empty = norms[:, 0] == 0
+            sums[empty] = sample[rng.choice(n_train, int(empty.sum()))]
+            norms[empty] = 1
+            centroids = (sums / norms).astype(np.float32)
+        self.centroids = centroids
+        self._assignments = []
+        self._lists = [[] for _ in range(self.n_lists)]
+        self._list_arrays = [None] * self.n_lists
+        self._index_rows(0)
+        logger.debug(f"Trained IVF index with {self.n_lists} lists on {n_train} vectors")
+
+    def add(self, item_id: int, vector: np.ndarray | None) -> bool:
+        """Add a single vector - returns False if the vector is missing or the id is already stored."""
+        if vector is None or len(vector) == 0 or item_id in self.store:
+            return False
+        self.extend([item_id], np.asarray(vector).reshape(1, -1))
+        return True
+
+    def extend(self, item_ids: Iterable[int], vectors: np.ndarray) -> None:
+        """Add a batch of vectors, assigning them to lists or training once there are enough."""
+        first_row = len(self.store)
+        self.store.extend(item_ids, vectors)
+        if self.is_trained:
+            self._index_rows(first_row)
+        elif len(self.store) >= self.train_threshold:
+            self.train()
+
+    def _list_rows(self, list_number: int) -> np.ndarray:
+        """Return the rows in an inverted list as an array, caching it until the list changes."""
+        rows = self._list_arrays[list_number]
+        if rows is None:
+            rows = np.fromiter(self._lists[list_number], dtype=np.int64, count=len(self._lists[list_number]))
+            self._list_arrays[list_number] = rows
+        return rows
+
+    def top_k(
+        self, query_vectors: np.ndarray, k: int | None = None, min_score: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the ids and scores of the approximate k most similar vectors, best first."""
+        if not self.is_trained:
+            return self.store.top_k(query_vectors, k=k, min_score=min_score)
+        queries, single = normalise_queries(query_vectors)
+        k = len(self.store) if k is None else min(k, len(self.store))
+        if k <= 0:
+            return empty_top_k(len(queries), single)
+        n_probe = min(self.n_probe, self.n_lists)
+        probed_lists, _ = rank_top_k(queries @ self.centroids.T, n_probe)
+        ids = np.full((len(queries), k), MISSING_ID, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        vectors = self.store.vectors
+        for query_number, query in enumerate(queries):
+            candidates = np.concatenate([self._list_rows(list_number) for list_number in probed_lists[query_number]])
+            if len(candidates) == 0:
+                continue
+            candidate_scores = vectors[candidates] @ query
+            positions, top_scores = rank_top_k(candidate_scores[None, :], min(k, len(candidates)))
+            ids[query_number, : positions.shape[1]] = self.store.ids[candidates[positions[0]]]
+            scores[query_number, : positions.shape[1]] = top_scores[0]
+        if single:
+            found = ids[0] != MISSING_ID
+            ids, scores = ids[:, found], scores[:, found]
+        return finalise_top_k(ids, scores, min_score, single)
+
+    def clear(self) -> None:
+        """Remove all vectors, keeping the trained centroids."""
+        self.store.clear()
+        self._assignments = []
+        self._lists = [[] for _ in range(self.n_lists)] if self.is_trained else []
+        self._list_arrays = [None] * len(self._lists)
+
+    def save(self, path: Path | str) -> None:
+        """Save the index, including its vectors, to an uncompressed numpy archive."""
+        params = {"n_lists": self.n_lists, "n_probe": self.n_probe, "seed": self.seed}
+        arrays = {"ids": self.store.ids, "vectors": self.store.vectors, "norms": self.store.norms}
+        if self.is_trained:
+            arrays["centroids"] = self.centroids
+            arrays["assignments"] = np.asarray(self._assignments, dtype=np.int64)
+        with Path(path).open("wb") as file:
+            np.savez(file, params=np.array(json.dumps(params)), **arrays)
+
+    @classmethod
+    def load(cls, path: Path | str) -> IVFVectorIndex:
+        """Load an index saved with save without retraining it."""
+        with np.load(path, allow_pickle=False) as archive:
+            params = json.loads(str(archive["params"]))
+            store = ChatMemoryStore.from_arrays(archive["ids"], archive["vectors"], archive["norms"])
+            index = cls(n_lists=params["n_lists"], n_probe=params["n_probe"], seed=params["seed"])
+            index.store = store
+            if "centroids" in archive:
+                index.centroids = archive["centroids"]
+                index._assignments = archive["assignments"].tolist()
+                index._lists = [[] for _ in range(index.n_lists)]
+                for row, list_number in enumerate(index._assignments):
+                    index._lists[list_number].append(row)
+                index._list_arrays = [None] * index.n_lists
+        return index
@@ -0,0 +1,125 @@
+"""Interface for searchable indexes of embeddings and helpers shared by the implementations."""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+# Padding used in batched top-k results when fewer than k stored vectors pass the minimum score
+MISSING_ID = -1
+
+
+class VectorIndex(ABC):
+    """Searchable collection of embeddings keyed by integer ids, scored by cosine similarity."""
+
+    dim: int | None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Return the number of stored vectors."""
+
+    @abstractmethod
+    def __contains__(self, item_id: int) -> bool:
+        """Check if an id is already in the index."""
+
+    @property
+    @abstractmethod
+    def ids(self) -> np.ndarray:
+        """Return the ids of the stored vectors in insertion order."""
+
+    @property
+    @abstractmethod
+    def vectors(self) -> np.ndarray:
+        """Return the normalised vectors aligned with the ids."""
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Return the number of bytes of process memory held by the index."""
+
+    @abstractmethod
+    def add(self, item_id: int, vector: np.ndarray | None) -> bool:
+        """Add a single vector - returns False if the vector is missing or the id is already stored."""
+
+    @abstractmethod
+    def extend(self, item_ids: Iterable[int], vectors: np.ndarray) -> None:
+        """Add a batch of vectors."""
+
+    @abstractmethod
+    def top_k(
+        self, query_vectors: np.ndarray, k: int | None = None, min_score: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the ids and scores of the k most similar stored vectors, best first.
+
+        A single 1D query returns 1D arrays holding at most k results at or above min_score. A 2D batch of
+        queries returns (n_queries, k) arrays, where slots that fail min_score hold MISSING_ID and -inf.
+        If k is None all stored vectors are ranked.
+        """
+
+    def similarities(self, query_vector: np.ndarray) -> np.ndarray:
+        """Return the exact cosine similarity of the query against every stored vector."""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float32)
+        queries, _ = normalise_queries(query_vector)
+        return self.vectors @ queries[0]
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all vectors."""
+
+    @abstractmethod
+    def save(self, path: Path | str) -> None:
+        """Save the index to a file."""
+
+    @classmethod
+    @abstractmethod
+    def load(cls, path: Path | str) -> VectorIndex:
+        """Load an index saved with save."""
+
+
+def normalise_queries(query_vectors: np.ndarray) -> tuple[np.ndarray, bool]:
+    """Return the queries as unit-length float32 rows and whether a single 1D query was given."""
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    single = queries.ndim == 1
+    queries = np.atleast_2d(queries)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0), single
+
+
+def rank_top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the column positions and values of the k best scores in each row, best first."""
+    n_columns = scores.shape[1]
+    if k < n_columns:
+        # Partition so the k best are in front, then only sort those
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_columns), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def empty_top_k(n_queries: int, single: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Return an empty top-k result."""
+    ids = np.empty((n_queries, 0), dtype=np.int64)
+    scores = np.empty((n_queries, 0), dtype=np.float32)
+    return (ids[0], scores[0]) if single else (ids, scores)
+
+
+def finalise_top_k(
+    ids: np.ndarray, scores: np.ndarray, min_score: float | None, single: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """Apply the minimum score to ranked (n_queries, k) results and unwrap single queries."""
+    if single:
+        keep = slice(None) if min_score is None else scores[0] >= min_score
+        return ids[0][keep], scores[0][keep]
+    if min_score is not None:
+        below = scores < min_score
+        ids[below] = MISSING_ID
+        scores[below] = -np.inf
+    return ids, scores
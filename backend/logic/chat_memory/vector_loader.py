@@ -0,0 +1,46 @@
+"""Streamed loading of stored embeddings into chat memory stores."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+from models.bytes_vector_mixin import BytesVectorMixin
+from sqlalchemy import func, select
+
+from logic.chat_memory.chat_memory_store import ChatMemoryStore
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from sqlalchemy.sql import Select
+
+# Rows fetched from the database cursor per batch
+DEFAULT_BATCH_SIZE = 1000
+
+
+def load_vector_store(session: Session, statement: Select, batch_size: int = DEFAULT_BATCH_SIZE) -> ChatMemoryStore:
+    """Load the (id, vector bytes) rows selected by the statement into a store.
+
+    Only the two selected columns are fetched, and they are streamed in batches, so no ORM objects are built.
+    The store is sized from a count of the rows up front, so each batch is decoded into a reused buffer and
+    copied once into its final rows, where it is normalised in place. Rows without a vector are skipped.
+    """
+    n_rows = session.scalar(select(func.count()).select_from(statement.order_by(None).subquery()))
+    store = ChatMemoryStore(initial_capacity=max(n_rows, 1))
+    batch = None
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        row_ids = []
+        for row_id, data in rows:
+            vector = BytesVectorMixin.decode_vector(data)
+            if vector is None:
+                continue
+            if batch is None:
+                batch = np.empty((batch_size, len(vector)), dtype=np.float32)
+            if len(vector) != batch.shape[1]:
+                msg = f"Vector dimension {len(vector)} of row {row_id} does not match dimension {batch.shape[1]}."
+                raise ValueError(msg)
+            batch[len(row_ids)] = vector
+            row_ids.append(row_id)
+        if row_ids:
+            store.extend(row_ids, batch[: len(row_ids)])
+    return store
@@ -0,0 +1,248 @@
+"""Resumable job to embed the chats, nodes and edges that lack an up-to-date vector.
+
+Chats are backfilled when they have no embedding from the model, for example because the embedding request
+failed, and nodes and edges when their vector is missing or was made by a different model. Rows are scanned
+in keyset-paginated chunks and the last id of each finished chunk is checkpointed, so an interrupted run
+resumes where it stopped. The checkpoint is cleared once a target is finished. Run from the backend folder with:
+
+    python -m logic.embedding_backfill --targets chats nodes edges
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple, Union
+
+from config import EMBEDDING_MODEL, EMBEDDING_SHARD_DIR, VECTOR_STORAGE_DTYPE, logger
+from database.db_engine import DBSessionManager
+from llm.embeddings import get_embeddings
+from llm.rate_limiter import Priority
+from models import Chat, ChatEmbedding, Edge, Node, User
+from models.vector_codec import LEGACY_EMBEDDING_MODEL, MAX_HEADER_SIZE, encode_vector, read_header
+from sqlalchemy import delete, func, insert, or_, select, update
+from utils.text_crypto import decrypt_string
+
+from logic.chat_memory import EmbeddingShard
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    import numpy as np
+    from sqlalchemy.orm import InstrumentedAttribute, Session
+
+BACKFILL_TARGETS = ("chats", "nodes", "edges")
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent.parent / "database" / "embedding_backfill.json"
+
+GraphModel = Union[type[Node], type[Edge]]
+
+
+class BackfillReport(NamedTuple):
+    """Summary of a backfill run over one target."""
+
+    target: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        """Return the throughput of the run."""
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class BackfillCheckpoint:
+    """Last processed id per target and model, saved to a JSON file after every chunk."""
+
+    def __init__(self, path: Path | str = DEFAULT_CHECKPOINT_PATH) -> None:
+        """Load the checkpoint file if it exists."""
+        self.path = Path(path)
+        self._positions: dict[str, int] = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    @staticmethod
+    def _key(target: str, model: str) -> str:
+        """Return the checkpoint key of a target and model."""
+        return f"{target}:{model}"
+
+    def get(self, target: str, model: str) -> int:
+        """Return the last processed id, or 0 to start from the beginning."""
+        return self._positions.get(self._key(target, model), 0)
+
+    def set(self, target: str, model: str, last_id: int) -> None:
+        """Record the last processed id."""
+        self._positions[self._key(target, model)] = last_id
+        self._write()
+
+    def clear(self, target: str, model: str) -> None:
+        """Forget the progress of a target so it is scanned from the beginning."""
+        if self._positions.pop(self._key(target, model), None) is not None:
+            self._write()
+
+    def _write(self) -> None:
+        """Replace the file atomically so a crash cannot corrupt it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(self._positions, indent=2))
+        os.replace(temporary_path, self.path)
+
+
+def encode(vector: np.ndarray, model: str) -> bytes:
+    """Encode a vector for storage with the configured dtype."""
+    return encode_vector(vector, dtype=VECTOR_STORAGE_DTYPE, model=model)
+
+
+def backfill_chats(
+    session: Session, model: str, checkpoint: BackfillCheckpoint, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> BackfillReport:
+    """Embed the chats without an embedding from the model.
+
+    The backfill runs in its own process, so web workers keep any chat memory they have already loaded and pick
+    up the new embeddings on their next cold load. Embedding shards of the affected users are deleted so that
+    load rebuilds them from the chat rows.
+    """
+    start_time = time.perf_counter()
+    n_rows = 0
+    existing_embedding = (ChatEmbedding.chat_id == Chat.id) & (ChatEmbedding.model_name == model)
+    while True:
+        # Select only the columns needed, with the user's key, so the chats are decrypted without ORM loads
+        rows = session.execute(
+            select(Chat.id, Chat.user_id, Chat.therapist_id, Chat._encrypted_text, User.encryption_key)
+            .join(User, User.id == Chat.user_id)
+            .outerjoin(ChatEmbedding, existing_embedding)
+            .where(Chat.id > checkpoint.get("chats", model), Chat._encrypted_text.is_not(None))
+            .where(or_(ChatEmbedding.chat_id.is_(None), func.length(ChatEmbedding._vector) == 0))
+            .order_by(Chat.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            # Finished, so the next run scans from the beginning again
+            checkpoint.clear("chats", model)
+            break
+        texts = [decrypt_string(row.encryption_key.encode(), row._encrypted_text) for row in rows]
+        embeddings = get_embeddings(texts, model=model, priority=Priority.BACKGROUND)
+        chat_ids = [row.id for row in rows]
+        # Replace any empty rows left by failed embeddings
+        session.execute(
+            delete(ChatEmbedding).where(ChatEmbedding.chat_id.in_(chat_ids), ChatEmbedding.model_name == model)
+        )
+        session.execute(
+            insert(ChatEmbedding),
+            [
+                {"chat_id": chat_id, "model_name": model, "_vector": encode(vector, model)}
+                for chat_id, vector in zip(chat_ids, embeddings)
+            ],
+        )
+        session.commit()
+        # Rebuild the shards of the users whose chats were embedded the next time they are loaded. This runs before
+        # the checkpoint moves on, so a crash cannot leave a shard missing committed embeddings.
+        if EMBEDDING_SHARD_DIR is not None:
+            for key in {(row.user_id, row.therapist_id) for row in rows}:
+                EmbeddingShard(EMBEDDING_SHARD_DIR, *key, model=model).delete()
+        checkpoint.set("chats", model, chat_ids[-1])
+        n_rows += len(rows)
+        logger.info(f"Backfilled {n_rows} chats at {n_rows / (time.perf_counter() - start_time):.1f} rows/s")
+    return BackfillReport("chats", n_rows, time.perf_counter() - start_time)
+
+
+def graph_text_column(graph_model: GraphModel) -> InstrumentedAttribute:
+    """Return the column whose text is embedded for nodes or edges."""
+    return Node.label if graph_model is Node else Edge.description
+
+
+def is_stale(data: bytes | None, model: str) -> bool:
+    """Check if a stored vector, or the header prefix of it, is missing or was made by another model.
+
+    Legacy headerless vectors were made by the legacy model, so they are only stale when backfilling another model.
+    """
+    if not data:
+        return True
+    header = read_header(data)
+    return (LEGACY_EMBEDDING_MODEL if header is None else header.model) != model
+
+
+def backfill_graph(
+    session: Session,
+    graph_model: GraphModel,
+    model: str,
+    checkpoint: BackfillCheckpoint,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> BackfillReport:
+    """Embed the nodes or edges whose vector is missing or was made by another model."""
+    target = graph_model.__tablename__
+    start_time = time.perf_counter()
+    n_rows = 0
+    while True:
+        rows = session.execute(
+            select(
+                graph_model.id,
+                graph_text_column(graph_model),
+                # Only the header prefix of each vector is needed to tell if it is stale
+                func.substr(graph_model._vector, 1, MAX_HEADER_SIZE, type_=graph_model._vector.type),
+            )
+            .where(graph_model.id > checkpoint.get(target, model))
+            .order_by(graph_model.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            checkpoint.clear(target, model)
+            break
+        stale_rows = [row for row in rows if row[1] and is_stale(row[2], model)]
+        if stale_rows:
+            embeddings = get_embeddings([row[1] for row in stale_rows], model=model, priority=Priority.BACKGROUND)
+            # Bulk UPDATE by primary key
+            session.execute(
+                update(graph_model),
+                [{"id": row[0], "_vector": encode(vector, model)} for row, vector in zip(stale_rows, embeddings)],
+            )
+            session.commit()
+        checkpoint.set(target, model, rows[-1][0])
+        n_rows += len(stale_rows)
+        logger.info(f"Backfilled {n_rows} {target} at {n_rows / (time.perf_counter() - start_time):.1f} rows/s")
+    return BackfillReport(target, n_rows, time.perf_counter() - start_time)
+
+
+def run_backfill(
+    targets: Sequence[str] = BACKFILL_TARGETS,
+    model: str = EMBEDDING_MODEL,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint_path: Path | str = DEFAULT_CHECKPOINT_PATH,
+    restart: bool = False,
+    db_session_manager: DBSessionManager | None = None,
+) -> list[BackfillReport]:
+    """Backfill embeddings for the targets, resuming from the checkpoint unless restarting."""
+    db_session_manager = db_session_manager or DBSessionManager()
+    checkpoint = BackfillCheckpoint(checkpoint_path)
+    reports = []
+    for target in targets:
+        if target not in BACKFILL_TARGETS:
+            msg = f"Unknown backfill target {target}, expected one of {BACKFILL_TARGETS}."
+            raise ValueError(msg)
+        if restart:
+            checkpoint.clear(target, model)
+        with db_session_manager.get_session() as session:
+            if target == "chats":
+                report = backfill_chats(session, model, checkpoint, chunk_size)
+            else:
+                report = backfill_graph(session, Node if target == "nodes" else Edge, model, checkpoint, chunk_size)
+        logger.info(f"Backfilled {report.rows} {target} in {report.seconds:.1f}s ({report.rows_per_second:.1f} rows/s)")
+        reports.append(report)
+    return reports
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Run the backfill from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", nargs="+", choices=BACKFILL_TARGETS, default=list(BACKFILL_TARGETS))
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Embedding model to backfill")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and scan from the start")
+    args = parser.parse_args(argv)
+    for report in run_backfill(args.targets, args.model, args.chunk_size, args.checkpoint, args.restart):
+        print(f"{report.target}: {report.rows} rows in {report.seconds:.1f}s ({report.rows_per_second:.1f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
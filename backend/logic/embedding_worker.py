@@ -0,0 +1,88 @@
+"""Background worker that embeds chats after they have been saved and returned to the user."""
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+from config import EMBEDDING_MODEL, logger
+from database.db_engine import DBSessionManager
+from llm.embeddings import get_embeddings
+from llm.rate_limiter import Priority
+from models import Chat
+
+# Called with the chat id and its stored vector once a chat has been embedded
+EmbeddedCallback = Callable[[int, np.ndarray], None]
+# Most chats embedded in one request when several are waiting
+DEFAULT_BATCH_SIZE = 64
+
+
+class EmbeddingWorker:
+    """Daemon thread that embeds queued chats in batches.
+
+    Waiting chats are drained from the queue and embedded with one request, the vectors are saved, and each
+    chat's callback is run so in-memory similarity indexes can be patched. Failures are logged and leave the
+    chats without a vector for the backfill job to pick up.
+    """
+
+    def __init__(
+        self, db_session_manager: Optional[DBSessionManager] = None, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> None:
+        """Create a worker - the thread starts when the first chat is submitted."""
+        self.db_session_manager = db_session_manager or DBSessionManager()
+        self.batch_size = batch_size
+        self._queue: queue.Queue[tuple[int, Optional[EmbeddedCallback]]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, chat_id: int, on_embedded: Optional[EmbeddedCallback] = None) -> None:
+        """Queue a saved chat to be embedded."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                self._thread.start()
+        self._queue.put((chat_id, on_embedded))
+
+    def join(self) -> None:
+        """Block until every queued chat has been processed."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        """Embed queued chats until the process exits."""
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.embed_chats(jobs)
+            except Exception:
+                logger.exception(f"Failed to embed chats {[chat_id for chat_id, _ in jobs]}")
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    def embed_chats(self, jobs: list[tuple[int, Optional[EmbeddedCallback]]]) -> None:
+        """Embed and save a batch of chats, then run their callbacks."""
+        callbacks = dict(jobs)
+        with self.db_session_manager.get_session() as session:
+            chats = [chat for chat in session.query(Chat).filter(Chat.id.in_(callbacks)).all() if chat.text]
+            if not chats:
+                return
+            vectors = get_embeddings([chat.text for chat in chats], model=EMBEDDING_MODEL, priority=Priority.BACKGROUND)
+            for chat, vector in zip(chats, vectors):
+                chat.vector = vector
+            session.commit()
+            # Pass on the stored vectors so patched indexes match ones loaded from the database
+            stored = [(chat.id, chat.vector) for chat in chats]
+        logger.debug(f"Embedded {len(stored)} chats in the background")
+        for chat_id, vector in stored:
+            callback = callbacks[chat_id]
+            if callback is not None:
+                callback(chat_id, vector)
+
+
+embedding_worker = EmbeddingWorker()
@@ -0,0 +1,52 @@
+"""Similarity search over the vectors of knowledge graph nodes and edges."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Union
+
+from config import VECTOR_INDEX_TYPE
+from models.graph.edge import Edge
+from models.graph.node import Node
+from sqlalchemy import select
+
+from logic.chat_memory import VectorIndex, create_vector_index, load_vector_store
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sqlalchemy.orm import Session
+
+GraphModel = Union[type[Node], type[Edge]]
+
+
+def build_graph_vector_index(
+    db: Session, model: GraphModel, user_id: int, index_type: str = VECTOR_INDEX_TYPE
+) -> VectorIndex:
+    """Build a vector index over the vectorised nodes or edges belonging to a user."""
+    statement = (
+        select(model.id, model._vector)
+        .where(model.user_id == user_id, model._vector.is_not(None))
+        .order_by(model.id)
+    )
+    store = load_vector_store(db, statement)
+    return create_vector_index(store, index_type=index_type)
+
+
+def find_similar(
+    db: Session,
+    model: GraphModel,
+    user_id: int,
+    query_vector: np.ndarray,
+    k: int = 10,
+    min_score: float | None = None,
+    index: VectorIndex | None = None,
+) -> list[tuple[Node | Edge, float]]:
+    """Return the user's nodes or edges most similar to the query vector with their scores, best first.
+
+    Pass a prebuilt index to avoid rebuilding it for every query.
+    """
+    if index is None:
+        index = build_graph_vector_index(db, model, user_id)
+    item_ids, scores = index.top_k(query_vector, k=k, min_score=min_score)
+    if len(item_ids) == 0:
+        return []
+    items = {item.id: item for item in db.query(model).filter(model.id.in_(item_ids.tolist())).all()}
+    return [(items[item_id], score) for item_id, score in zip(item_ids.tolist(), scores.tolist()) if item_id in items]
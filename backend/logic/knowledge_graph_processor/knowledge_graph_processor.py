@@ -1,13 +1,15 @@
 """Class to process Chat objects and create/update a knowledge graph."""
 
 import asyncio
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 import spacy
-from llm.graph_processing import get_edges, get_nodes
+from config import GRAPH_EXTRACTION_MODE
+from llm.graph_processing import async_get_edges, async_get_graph, async_get_nodes, get_nodes
 from models.chat import Chat
 from models.graph.edge import Edge
 from models.graph.node import Node
+from spacy.tokens import Doc
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
@@ -21,9 +23,21 @@ class KnowledgeGraphProcessor:
 
     async def process_chat(self, chat: Chat) -> None:
         """Process a Chat object and update the knowledge graph asynchronously."""
-        entities = self.extract_entities(chat.text)
+        # Parse the text once for both nodes and edges
+        doc = self.nlp(chat.text)
+        if GRAPH_EXTRACTION_MODE == "combined":
+            entities, edge_candidates = await async_get_graph(doc)
+        else:
+            entities, edge_candidates = await async_get_nodes(doc), None
         nodes = await self.create_or_update_nodes(entities, chat.user_id)
-        edges = await self.create_edges(nodes, chat)
+        if edge_candidates is not None:
+            # Point the edges at the database ids of the nodes they connect
+            node_ids = {entity["id"]: node.id for entity, node in zip(entities, nodes)}
+            edge_candidates = [
+                {**edge, "source": node_ids[edge["source"]], "target": node_ids[edge["target"]]}
+                for edge in edge_candidates
+            ]
+        edges = await self.create_edges(nodes, chat, doc, edge_candidates)
         await self.update_graph(nodes, edges)
 
     def extract_entities(self, text: str) -> List[Dict]:
@@ -57,16 +71,24 @@ class KnowledgeGraphProcessor:
         await self.db.commit()
         return nodes
 
-    async def create_edges(self, nodes: List[Node], chat: Chat) -> List[Edge]:
-        """Create edges between nodes based on their relationships in the chat."""
-        # Convert nodes to the format expected by get_edges
-        node_dicts = [{"label": node.label, "id": node.id} for node in nodes]
-
-        # Create doc - is this needed?
-        doc = self.nlp(chat.text)
-
-        # Get edge candidates using the get_edges function
-        edge_candidates = get_edges(doc, node_dicts)
+    async def create_edges(
+        self,
+        nodes: List[Node],
+        chat: Chat,
+        doc: Optional[Doc] = None,
+        edge_candidates: Optional[List[Dict]] = None,
+    ) -> List[Edge]:
+        """Create edges between nodes based on their relationships in the chat.
+
+        Edge candidates already extracted with the nodes are used as they are, otherwise they are requested.
+        """
+        if edge_candidates is None:
+            # Convert nodes to the format expected by get_edges
+            node_dicts = [{"label": node.label, "id": node.id} for node in nodes]
+            if doc is None:
+                doc = self.nlp(chat.text)
+            # Get edge candidates without blocking the event loop while the model responds
+            edge_candidates = await async_get_edges(doc, node_dicts)
 
         edges = []
         for edge_data in edge_candidates:
@@ -3,7 +3,9 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from llm.graph_processing import get_nodes
+from config import STREAM_GRAPH_EXTRACTION, logger
+from llm.errors import LLMError
+from llm.graph_processing import get_nodes, stream_nodes
 from models.chat_reference import ChatReference
 from models.graph.node import Node
 from sqlalchemy.exc import SQLAlchemyError
@@ -16,40 +18,47 @@ if TYPE_CHECKING:
 def process_text_and_create_references(
     text: str, chat_id: int, user_id: int, db: Session, nlp: spacy.language.Language
 ) -> list[ChatReference]:
-    """Process the text and create ChatReferences and Nodes in the database."""
+    """Process the text and create ChatReferences and Nodes in the database.
+
+    If a streamed extraction fails partway, the references to the nodes that arrived are saved and returned.
+    """
     # Generate Spacy doc
     doc = nlp(text)
 
-    # Get nodes from the doc
-    node_data = get_nodes(doc)
+    # Get nodes from the doc - streamed nodes are saved as they arrive, before the response has ended
+    node_data = stream_nodes(doc) if STREAM_GRAPH_EXTRACTION else get_nodes(doc)
 
     chat_references = []
 
-    for node in node_data:
-        try:
-            # Try to find an existing node or create a new one
-            db_node = db.query(Node).filter_by(label=node["label"], user_id=user_id).first()
-            if not db_node:
-                db_node = Node(label=node["label"], user_id=user_id)
-                db.add(db_node)
-                db.flush()  # This will populate the id of the new node
-
-            # Create ChatReference
-            for span in node["spans"]:
-                chat_ref = ChatReference(
-                    chat_id=chat_id,
-                    node_id=db_node.id,
-                    span_idx_start=span[0],
-                    span_idx_end=span[-1],
-                    character_idx_start=doc[span[0]].idx,
-                    character_idx_end=doc[span[-1]].idx + len(doc[span[-1]]),
-                )
-                db.add(chat_ref)
-                chat_references.append(chat_ref)
-
-        except SQLAlchemyError:
-            db.rollback()
-            raise
+    try:
+        for node in node_data:
+            try:
+                # Try to find an existing node or create a new one
+                db_node = db.query(Node).filter_by(label=node["label"], user_id=user_id).first()
+                if not db_node:
+                    db_node = Node(label=node["label"], user_id=user_id)
+                    db.add(db_node)
+                    db.flush()  # This will populate the id of the new node
+
+                # Create ChatReference
+                for span in node["spans"]:
+                    chat_ref = ChatReference(
+                        chat_id=chat_id,
+                        node_id=db_node.id,
+                        span_idx_start=span[0],
+                        span_idx_end=span[-1],
+                        character_idx_start=doc[span[0]].idx,
+                        character_idx_end=doc[span[-1]].idx + len(doc[span[-1]]),
+                    )
+                    db.add(chat_ref)
+                    chat_references.append(chat_ref)
+
+            except SQLAlchemyError:
+                db.rollback()
+                raise
+    except LLMError:
+        # A streamed response can fail partway - keep the nodes that arrived rather than leave them uncommitted
+        logger.exception(f"Node extraction for chat {chat_id} failed after {len(chat_references)} references")
 
     try:
         db.commit()
@@ -0,0 +1,247 @@
+"""Rolling session summaries that keep the history sent with each turn to a roughly constant size.
+
+The history of a turn is the session's summary plus the latest messages that fit within the message limit and
+token budget. After each turn a background worker folds the messages that no longer fit into the summary with
+one small completion, so the summary is updated incrementally rather than rebuilt from the whole session.
+Messages the worker has not folded in yet stay in the history while they fit the token budget, and are folded
+in before the turn if they no longer do, so no message drops out of the history before it is in the summary.
+Summaries are persisted on the session row and capped in length.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+from app.schemas import ChatListOut, ChatOut
+from config import (
+    SESSION_HISTORY_MAX_MESSAGES,
+    SESSION_HISTORY_TOKEN_BUDGET,
+    SESSION_SUMMARY_MAX_ENTRIES,
+    SESSION_SUMMARY_MAX_TOKENS,
+    SESSION_SUMMARY_MODEL,
+    logger,
+)
+from database.db_engine import DBSessionManager
+from llm import prompt_builder
+from llm.common import api_request
+from llm.errors import LLMError
+from llm.rate_limiter import Priority
+from llm.token_counter import count_tokens_batch, truncate_tokens
+from models import Chat, TherapySession
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+
+class SessionSummary(NamedTuple):
+    """Summary of a session's messages up to and including a chat."""
+
+    text: str
+    through_chat_id: int
+
+
+class SessionSummaryStore:
+    """Process-wide LRU of session summaries keyed by therapy session id.
+
+    This caches the summaries persisted on the session rows, so a summary survives restarts and evictions.
+    """
+
+    def __init__(self, max_entries: int = SESSION_SUMMARY_MAX_ENTRIES) -> None:
+        """Create an empty store."""
+        self.max_entries = max_entries
+        self._summaries: OrderedDict[int, SessionSummary] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of stored summaries."""
+        return len(self._summaries)
+
+    def get(self, therapy_session_id: int) -> Optional[SessionSummary]:
+        """Return the summary of the session, if there is one."""
+        with self._lock:
+            summary = self._summaries.get(therapy_session_id)
+            if summary is not None:
+                self._summaries.move_to_end(therapy_session_id)
+            return summary
+
+    def put(self, therapy_session_id: int, summary: SessionSummary) -> None:
+        """Store the summary of the session, evicting the least recently used if over the limit."""
+        with self._lock:
+            current = self._summaries.get(therapy_session_id)
+            # Never replace a summary with one covering fewer messages
+            if current is not None and current.through_chat_id >= summary.through_chat_id:
+                return
+            self._summaries[therapy_session_id] = summary
+            self._summaries.move_to_end(therapy_session_id)
+            if len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all summaries."""
+        with self._lock:
+            self._summaries.clear()
+
+
+session_summary_store = SessionSummaryStore()
+
+
+def recent_window_start(
+    token_counts: list[int],
+    max_messages: int = SESSION_HISTORY_MAX_MESSAGES,
+    token_budget: int = SESSION_HISTORY_TOKEN_BUDGET,
+) -> int:
+    """Return the index of the first message of the latest messages that fit the message limit and token budget.
+
+    The last message is always kept even if it is over the budget on its own.
+    """
+    start, n_tokens = len(token_counts), 0
+    while start > 0 and len(token_counts) - start < max_messages:
+        if n_tokens + token_counts[start - 1] > token_budget and start < len(token_counts):
+            break
+        start -= 1
+        n_tokens += token_counts[start]
+    return start
+
+
+def load_summary(session: Session, therapy_session_id: int) -> Optional[SessionSummary]:
+    """Return the summary of the session from the store, or from the session row if it is not stored."""
+    summary = session_summary_store.get(therapy_session_id)
+    if summary is not None:
+        return summary
+    therapy_session = session.get(TherapySession, therapy_session_id)
+    if therapy_session is None or therapy_session.summary_through_chat_id is None:
+        return None
+    summary = SessionSummary(therapy_session.summary or "", therapy_session.summary_through_chat_id)
+    session_summary_store.put(therapy_session_id, summary)
+    return summary
+
+
+def save_summary(session: Session, therapy_session_id: int, summary: SessionSummary) -> None:
+    """Persist the summary on the session row and store it, unless a summary covering more messages is saved."""
+    therapy_session = session.get(TherapySession, therapy_session_id)
+    if therapy_session is not None and (therapy_session.summary_through_chat_id or 0) < summary.through_chat_id:
+        therapy_session.summary = summary.text
+        therapy_session.summary_through_chat_id = summary.through_chat_id
+        session.commit()
+    session_summary_store.put(therapy_session_id, summary)
+
+
+def load_unsummarised_messages(session: Session, therapy_session_id: int) -> tuple[Optional[str], list[ChatOut]]:
+    """Return the session's summary text and the messages after it, oldest first."""
+    summary = load_summary(session, therapy_session_id)
+    through_chat_id = summary.through_chat_id if summary is not None else 0
+    chats = (
+        session.query(Chat)
+        .filter(Chat.therapy_session_id == therapy_session_id, Chat.id > through_chat_id)
+        .order_by(Chat.id)
+        .all()
+    )
+    return (summary.text if summary is not None else None), [ChatOut.model_validate(chat) for chat in chats]
+
+
+def message_token_counts(messages: list[ChatOut]) -> list[int]:
+    """Count the tokens of each message as it appears in the history."""
+    return count_tokens_batch([message.as_string() for message in messages], SESSION_SUMMARY_MODEL)
+
+
+def split_messages(messages: list[ChatOut]) -> tuple[list[ChatOut], list[ChatOut]]:
+    """Split messages into the older ones to fold into the summary and the latest ones sent as they are."""
+    start = recent_window_start(message_token_counts(messages))
+    return messages[:start], messages[start:]
+
+
+def fold_messages(previous_summary: Optional[str], messages: list[ChatOut], priority: Priority) -> SessionSummary:
+    """Fold messages into the summary with one completion, capping the length of the new summary."""
+    prompt = prompt_builder.build_session_summary_prompt(previous_summary, ChatListOut(messages=messages))
+    text = api_request(
+        messages=[
+            {"role": "system", "content": prompt_builder.SESSION_SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        model=SESSION_SUMMARY_MODEL,
+        temperature=0.3,
+        priority=priority,
+    )
+    return SessionSummary(truncate_tokens(text, SESSION_SUMMARY_MAX_TOKENS, SESSION_SUMMARY_MODEL), messages[-1].id)
+
+
+def build_session_history(session: Session, therapy_session_id: int) -> str:
+    """Build the history prompt of the next turn from the summary and the latest messages."""
+    summary, messages = load_unsummarised_messages(session, therapy_session_id)
+    token_counts = message_token_counts(messages)
+    start = recent_window_start(token_counts)
+    if start > 0:
+        # Messages the summariser has not folded in yet are kept while they fit the token budget
+        start = recent_window_start(token_counts, max_messages=len(token_counts))
+    if start > 0:
+        # The rest would drop out of the history, so fold them in now rather than wait for the summariser
+        try:
+            new_summary = fold_messages(summary, messages[:start], Priority.INTERACTIVE)
+        except LLMError:
+            logger.exception(f"Failed to fold messages into the summary of therapy session {therapy_session_id}")
+        else:
+            save_summary(session, therapy_session_id, new_summary)
+            summary = new_summary.text
+    return prompt_builder.build_recent_session_history(ChatListOut(messages=messages[start:]), summary)
+
+
+class SessionSummariser:
+    """Daemon thread that folds the older messages of sessions into their rolling summaries.
+
+    Failures are logged and leave the previous summary in place, so the messages are folded in on a later turn.
+    """
+
+    def __init__(self, db_session_manager: Optional[DBSessionManager] = None) -> None:
+        """Create a summariser - the thread starts when the first session is submitted."""
+        self.db_session_manager = db_session_manager or DBSessionManager()
+        self._queue: queue.Queue[int] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, therapy_session_id: int) -> None:
+        """Queue a session whose summary may need updating."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="session-summariser", daemon=True)
+                self._thread.start()
+        self._queue.put(therapy_session_id)
+
+    def join(self) -> None:
+        """Block until every queued session has been processed."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        """Update queued summaries until the process exits."""
+        while True:
+            therapy_session_ids = [self._queue.get()]
+            while True:
+                try:
+                    therapy_session_ids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # A session queued by several turns only needs updating once
+            for therapy_session_id in dict.fromkeys(therapy_session_ids):
+                try:
+                    self.summarise(therapy_session_id)
+                except Exception:
+                    logger.exception(f"Failed to update the summary of therapy session {therapy_session_id}")
+            for _ in therapy_session_ids:
+                self._queue.task_done()
+
+    def summarise(self, therapy_session_id: int) -> Optional[SessionSummary]:
+        """Fold the messages that no longer fit the recent history into the summary, returning any new summary."""
+        with self.db_session_manager.get_session() as session:
+            summary, messages = load_unsummarised_messages(session, therapy_session_id)
+        older, _ = split_messages(messages)
+        if not older:
+            return None
+        new_summary = fold_messages(summary, older, Priority.BACKGROUND)
+        with self.db_session_manager.get_session() as session:
+            save_summary(session, therapy_session_id, new_summary)
+        logger.debug(f"Folded {len(older)} messages into the summary of therapy session {therapy_session_id}")
+        return new_summary
+
+
+session_summariser = SessionSummariser()
@@ -0,0 +1,140 @@
+"""Process-wide cache of rendered system prompts keyed by user and therapist."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from config import SYSTEM_PROMPT_CACHE_MAX_ENTRIES, SYSTEM_PROMPT_CACHE_TTL_SECONDS
+from models import Therapist, User
+from sqlalchemy import event, inspect
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.orm import Mapper
+
+# Prompts are keyed by (user_id, therapist_id)
+SystemPromptKey = tuple[int, int]
+
+
+class CachedPrompt(NamedTuple):
+    """A rendered prompt with the row versions it was built from."""
+
+    prompt: str
+    user_version: int
+    therapist_version: int
+    created: float
+
+
+class SystemPromptCache:
+    """LRU cache of system prompts, invalidated by version when the user or therapist row changes.
+
+    Every update or delete of a User or Therapist through the ORM in this process bumps the row's version, so
+    prompts built from the old row are rebuilt on their next use. Entries also expire after ttl_seconds, which
+    bounds how long updates made by other processes go unseen.
+    """
+
+    def __init__(
+        self, max_entries: int = SYSTEM_PROMPT_CACHE_MAX_ENTRIES, ttl_seconds: float = SYSTEM_PROMPT_CACHE_TTL_SECONDS
+    ) -> None:
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._prompts: OrderedDict[SystemPromptKey, CachedPrompt] = OrderedDict()
+        self._user_versions: dict[int, int] = {}
+        self._therapist_versions: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached prompts."""
+        return len(self._prompts)
+
+    def _versions(self, key: SystemPromptKey) -> tuple[int, int]:
+        """Return the current versions of the user and therapist rows. Call with the lock held."""
+        user_id, therapist_id = key
+        return self._user_versions.get(user_id, 0), self._therapist_versions.get(therapist_id, 0)
+
+    def get(self, key: SystemPromptKey) -> str | None:
+        """Return the cached prompt if it is current, marking it as recently used."""
+        with self._lock:
+            cached = self._prompts.get(key)
+            if (
+                cached is None
+                or (cached.user_version, cached.therapist_version) != self._versions(key)
+                or time.monotonic() - cached.created > self.ttl_seconds
+            ):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._prompts.move_to_end(key)
+            return cached.prompt
+
+    def get_or_build(self, key: SystemPromptKey, builder: Callable[[], str]) -> str:
+        """Return the cached prompt for the key, building and caching it with the builder if it is not current."""
+        prompt = self.get(key)
+        if prompt is not None:
+            return prompt
+        # Take the versions before building, so an update made while building invalidates the new entry
+        with self._lock:
+            versions = self._versions(key)
+        prompt = builder()
+        with self._lock:
+            self._prompts[key] = CachedPrompt(prompt, *versions, time.monotonic())
+            self._prompts.move_to_end(key)
+            if len(self._prompts) > self.max_entries:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    def bump_user(self, user_id: int) -> None:
+        """Mark the prompts of a user as out of date."""
+        with self._lock:
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+
+    def bump_therapist(self, therapist_id: int) -> None:
+        """Mark the prompts of a therapist as out of date."""
+        with self._lock:
+            self._therapist_versions[therapist_id] = self._therapist_versions.get(therapist_id, 0) + 1
+
+    def clear(self) -> None:
+        """Drop all cached prompts and reset the counters."""
+        with self._lock:
+            self._prompts.clear()
+            self.hits = self.misses = 0
+
+
+system_prompt_cache = SystemPromptCache()
+
+
+def _columns_changed(mapper: Mapper, target: User | Therapist) -> bool:
+    """Check if a flushed row had column changes, as relationship changes alone also trigger update events."""
+    state = inspect(target)
+    return any(state.attrs[column.key].history.has_changes() for column in mapper.column_attrs)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper: Mapper, _connection: Connection, user: User) -> None:
+    """Invalidate the prompts of an updated user."""
+    if _columns_changed(mapper, user):
+        system_prompt_cache.bump_user(user.id)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(_mapper: Mapper, _connection: Connection, user: User) -> None:
+    """Invalidate the prompts of a deleted user."""
+    system_prompt_cache.bump_user(user.id)
+
+
+@event.listens_for(Therapist, "after_update")
+def _therapist_updated(mapper: Mapper, _connection: Connection, therapist: Therapist) -> None:
+    """Invalidate the prompts of an updated therapist."""
+    if _columns_changed(mapper, therapist):
+        system_prompt_cache.bump_therapist(therapist.id)
+
+
+@event.listens_for(Therapist, "after_delete")
+def _therapist_deleted(_mapper: Mapper, _connection: Connection, therapist: Therapist) -> None:
+    """Invalidate the prompts of a deleted therapist."""
+    system_prompt_cache.bump_therapist(therapist.id)
@@ -1,16 +1,30 @@
 """Therapy session class to model a therapy session."""
-from typing import Optional
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
 
 import numpy as np
 from app.schemas import ChatListOut, ChatOut, TherapistOut, UserOut
-from config import logger
+from config import DEFER_CHAT_EMBEDDINGS, EMBEDDING_MODEL, EMBEDDING_SHARD_DIR, logger
 from database.db_engine import DBSessionManager
 from llm import prompt_builder
-from llm.chat_completion import get_chat_completion
-from models import Chat, Therapist, TherapySession, User
+from llm.chat_completion import async_get_chat_completion, async_stream_chat_completion, get_chat_completion
+from models import Chat, ChatEmbedding, Therapist, TherapySession, User
 from spacy_nlp import nlp_service
+from sqlalchemy import select
 
+from logic.chat_memory import (
+    ChatMemoryStore,
+    EmbeddingShard,
+    VectorIndex,
+    chat_memory_cache,
+    create_vector_index,
+    load_vector_store,
+)
+from logic.embedding_worker import embedding_worker
 from logic.process_chat_create_nodes import process_text_and_create_references
+from logic.session_summary import build_session_history, session_summariser
+from logic.system_prompt_cache import system_prompt_cache
 
 
 # Define exceptions
@@ -40,8 +54,6 @@ class TherapySessionLogic:
     ) -> None:
         """Initialise the therapy session."""
         self.db_session_manager = db_session_manager or DBSessionManager()
-        self.chat_vectors = None
-        self.index_to_id = {}
         if pre_existing_session_id:
             logger.debug("Using pre-existing therapy session")
             therapy_session = self.get_therapy_session(pre_existing_session_id)
@@ -69,7 +81,10 @@ class TherapySessionLogic:
         else:
             msg = "Must provide either a user id or a pre-existing session id"
             raise ValueError(msg)
-        self.system_prompt = self.build_system_prompt()
+        # Reuse the prompt rendered for an earlier session unless the user or therapist has changed since
+        self.system_prompt = system_prompt_cache.get_or_build(
+            (self.user_id, self.therapist_id), self.build_system_prompt
+        )
         # Initialise Spacy
         try:
             self.nlp = nlp_service.get_nlp()
@@ -77,6 +92,30 @@ class TherapySessionLogic:
             logger.warning("Could not load NLP service")
             self.nlp = None
 
+    @property
+    def chat_memory_key(self) -> tuple[int, int]:
+        """Return the key of this user and therapist's chat memory in the process-wide cache."""
+        return self.user_id, self.therapist_id
+
+    @property
+    def chat_memory(self) -> VectorIndex:
+        """Return the chat memory shared by all sessions of this user and therapist, loading it if needed."""
+        return chat_memory_cache.get_or_load(self.chat_memory_key, self.build_chat_memory)
+
+    @property
+    def embedding_shard(self) -> Optional[EmbeddingShard]:
+        """Return the on-disk embedding shard for this user and therapist, if shards are enabled."""
+        if EMBEDDING_SHARD_DIR is None:
+            return None
+        return EmbeddingShard(EMBEDDING_SHARD_DIR, self.user_id, self.therapist_id, EMBEDDING_MODEL)
+
+    @property
+    def chat_vectors(self) -> Optional[np.ndarray]:
+        """Return the normalised chat vector matrix, or None if past chats are not loaded."""
+        if self.chat_memory_key not in chat_memory_cache:
+            return None
+        return self.chat_memory.vectors
+
     @property
     def first_chat(self) -> bool:
         """Check if this is the first chat in the session."""
@@ -112,20 +151,45 @@ class TherapySessionLogic:
                 raise TherapistDoesNotExistError(msg)
             return therapist.id
 
-    def load_all_session_previous_chats(self) -> None:
-        """Load previous chats from the database and their vectors into memory."""
+    def build_chat_memory(self) -> VectorIndex:
+        """Build the chat memory index, mapping the embedding shard if there is an up to date one."""
+        shard = self.embedding_shard
+        if shard is not None and shard.exists() and not shard.is_stale():
+            return create_vector_index(shard.open_store())
+        chat_memory = self.build_chat_memory_from_database()
+        if shard is not None and len(chat_memory) > 0:
+            shard.write(chat_memory)
+        return create_vector_index(chat_memory)
+
+    def build_chat_memory_from_database(self) -> ChatMemoryStore:
+        """Build a chat memory store from the vectors of the previous chats in the database."""
+        statement = (
+            select(ChatEmbedding.chat_id, ChatEmbedding._vector)
+            .join(Chat, Chat.id == ChatEmbedding.chat_id)
+            .where((Chat.user_id == self.user_id) & (Chat.therapist_id == self.therapist_id))
+            .where(ChatEmbedding.model_name == EMBEDDING_MODEL)
+            .order_by(Chat.timestamp.asc(), Chat.id.asc())
+        )
         with self.db_session_manager.get_session() as session:
-            previous_chats = (
-                session.query(Chat)
-                .filter((Chat.user_id == self.user_id) & (Chat.therapist_id == self.therapist_id))
-                .order_by(Chat.timestamp.asc())
-                .all()
-            )
-            self.chat_vectors = np.vstack([chat.vector for chat in previous_chats if chat.vector is not None])
-            self.index_to_id = {index: chat.id for index, chat in enumerate(previous_chats)}
+            return load_vector_store(session, statement)
+
+    def load_all_session_previous_chats(self) -> None:
+        """Load previous chats from the database and their vectors into the shared chat memory."""
+        chat_memory = self.build_chat_memory_from_database()
+        # The database is the source of truth so rebuild any shard from it
+        shard = self.embedding_shard
+        if shard is not None and len(chat_memory) > 0:
+            shard.write(chat_memory)
+        chat_memory_cache.put(self.chat_memory_key, create_vector_index(chat_memory))
 
-    def add_chat_message(self, sender, text) -> ChatOut:
-        """Add a new chat message to the history and update the vector matrix."""
+    def add_chat_message(self, sender, text, defer_embedding: Optional[bool] = None) -> ChatOut:
+        """Add a new chat message to the history and update the vector matrix.
+
+        With deferred embedding the chat is saved and returned straight away and the background worker
+        adds its vector to the chat memory once it arrives. Defaults to the DEFER_CHAT_EMBEDDINGS setting.
+        """
+        if defer_embedding is None:
+            defer_embedding = DEFER_CHAT_EMBEDDINGS
         with self.db_session_manager.get_session() as session:
             new_chat = Chat(
                 user_id=self.user_id,
@@ -139,8 +203,8 @@ class TherapySessionLogic:
             session.refresh(new_chat)
             # Text needs to be added separately as it employs a setter for encryption
             new_chat.text = text
-            # TODO - split here to return message first?
-            new_chat.fetch_text_vector()
+            if not defer_embedding:
+                new_chat.fetch_text_vector()
             # Commit to save text and vector
             session.commit()
             # NEW: Extract entities only from user messages
@@ -153,34 +217,41 @@ class TherapySessionLogic:
                     logger.error(f"Entity extraction failed: {e}")
                     # Don't let entity extraction break the chat flow
             chat_out = ChatOut.model_validate(new_chat)
-            if new_chat.id not in self.index_to_id.values():
-                self.index_to_id[len(self.index_to_id)] = new_chat.id
-                # Add to chat vector stack
-                self.chat_vectors = (
-                    np.vstack((self.chat_vectors, new_chat.vector))
-                    if self.chat_vectors is not None
-                    else new_chat.vector
-                )
+            if defer_embedding:
+                embedding_worker.submit(new_chat.id, self.add_to_chat_memory)
+            else:
+                self.add_to_chat_memory(new_chat.id, new_chat.vector)
             return chat_out
 
+    def add_to_chat_memory(self, chat_id: int, vector: Optional[np.ndarray]) -> None:
+        """Add a chat vector to any warm chat memory and the embedding shard."""
+        # Update any warm chat memory in place - otherwise the chat is picked up when it is loaded
+        chat_memory_cache.add_chat(self.chat_memory_key, chat_id, vector)
+        shard = self.embedding_shard
+        if shard is None or not shard.exists() or vector is None:
+            return
+        if shard.is_stale(dim=np.shape(vector)[-1]):
+            # Left from another embedding model - drop it so the next load rebuilds it from the chat rows
+            logger.info(f"Deleting stale embedding shard {shard.header_path}")
+            shard.delete()
+            return
+        shard.append([chat_id], vector)
+
     def cosine_similarity_search(self, query_vector):
-        """Perform a cosine similarity search on the chat vectors."""
-        if self.chat_vectors is None:
-            self.load_all_session_previous_chats()
-        if self.chat_vectors is None:
+        """Perform an exact cosine similarity search on the chat vectors."""
+        chat_memory = self.chat_memory
+        if len(chat_memory) == 0:
             return []
-        return (self.chat_vectors @ query_vector) / (
-            np.linalg.norm(self.chat_vectors, axis=1) * np.linalg.norm(query_vector)
-        )
+        return chat_memory.similarities(query_vector)
 
-    def get_relevant_past_chat_ids(self, user_input_vector, threshold: int = 0.75):
-        """Fetch relevant past chats based on cosine similarity."""
-        similarity_scores = self.cosine_similarity_search(user_input_vector)
-        relevant_chat_ids = []
-        for index, score in enumerate(similarity_scores):
-            if score > threshold:
-                relevant_chat_ids.append((self.index_to_id[index], score))
-        return relevant_chat_ids
+    def get_relevant_past_chat_ids(
+        self, user_input_vector, threshold: float = 0.75, k: Optional[int] = None
+    ) -> list[tuple[int, float]]:
+        """Fetch relevant past chats based on cosine similarity, most similar first."""
+        chat_ids, scores = self.chat_memory.top_k(user_input_vector, k=k, min_score=threshold)
+        # Only chats strictly more similar than the threshold are relevant
+        above = scores > threshold
+        return list(zip(chat_ids[above].tolist(), scores[above].tolist()))
 
     def build_system_prompt(self):
         """Build the system prompt."""
@@ -197,6 +268,11 @@ class TherapySessionLogic:
             messages = session.query(Chat).filter(Chat.therapy_session_id == self.therapy_session_id).all()
             return ChatListOut(messages=messages)
 
+    def get_session_history(self) -> str:
+        """Build the history prompt from the session's rolling summary and latest messages."""
+        with self.db_session_manager.get_session() as session:
+            return build_session_history(session, self.therapy_session_id)
+
     def start_session(self) -> ChatListOut:
         """Start a new therapy session and return initial messages."""
         # Build briefing messages for first session
@@ -211,14 +287,16 @@ class TherapySessionLogic:
 
     def generate_response(self, user_input) -> ChatListOut:
         """Generate a response using the ChatCompletion API."""
-        # Get the history
-        history = prompt_builder.build_recent_session_history(self.get_therapy_session_messages())
+        # Get the history as the session summary and latest messages
+        history = self.get_session_history()
         # Add the user input to the chat history
         self.add_chat_message("user", user_input)
         next_message_prompt = prompt_builder.build_next_message_prompt(user_input)
         # This needs to use the history to prevent "Hello [User]" being repeated
         response = get_chat_completion(next_message_prompt, self.system_prompt, history=history)
         chat_out = self.add_chat_message("therapist", response)
+        # Fold messages that no longer fit the history into the summary before the next turn
+        session_summariser.submit(self.therapy_session_id)
         return ChatListOut(messages=[chat_out])
 
     def get_messages(self) -> ChatListOut:
@@ -227,3 +305,58 @@ class TherapySessionLogic:
             return self.start_session()
         else:
             return self.get_therapy_session_messages()
+
+    async def async_start_session(self) -> ChatListOut:
+        """Start a new therapy session, awaiting the first message so other sessions can run meanwhile."""
+        briefing_messages = [
+            prompt_builder.build_new_session_prompt(),
+        ]
+        first_message = prompt_builder.build_first_message_prompt()
+        response = await async_get_chat_completion(
+            first_message, self.system_prompt, briefing_messages=briefing_messages
+        )
+        # Database work stays synchronous, so run it in a thread to keep the event loop free
+        await asyncio.to_thread(self.add_chat_message, "therapist", response)
+        return await asyncio.to_thread(self.get_therapy_session_messages)
+
+    async def async_generate_response(self, user_input) -> ChatListOut:
+        """Generate a response, awaiting the completion so other sessions can run meanwhile."""
+        history = await asyncio.to_thread(self.get_session_history)
+        await asyncio.to_thread(self.add_chat_message, "user", user_input)
+        next_message_prompt = prompt_builder.build_next_message_prompt(user_input)
+        response = await async_get_chat_completion(next_message_prompt, self.system_prompt, history=history)
+        chat_out = await asyncio.to_thread(self.add_chat_message, "therapist", response)
+        session_summariser.submit(self.therapy_session_id)
+        return ChatListOut(messages=[chat_out])
+
+    async def async_stream_response(self, user_input, on_delta: Callable[[str], Awaitable[None]]) -> ChatListOut:
+        """Generate a response, passing each piece of text to on_delta as it arrives and saving the full reply.
+
+        If the stream fails part way the text received so far is saved, and if nothing was received the LLMError is
+        raised without saving a reply.
+        """
+        history = await asyncio.to_thread(self.get_session_history)
+        await asyncio.to_thread(self.add_chat_message, "user", user_input)
+        next_message_prompt = prompt_builder.build_next_message_prompt(user_input)
+        start_time = time.perf_counter()
+        deltas = []
+        try:
+            async for delta in async_stream_chat_completion(next_message_prompt, self.system_prompt, history=history):
+                if not deltas:
+                    logger.debug(f"Time to first token {time.perf_counter() - start_time:.3f}s")
+                deltas.append(delta)
+                await on_delta(delta)
+        except Exception:
+            if not deltas:
+                raise
+            logger.exception(f"Streaming the response failed after {len(deltas)} deltas")
+        chat_out = await asyncio.to_thread(self.add_chat_message, "therapist", "".join(deltas))
+        session_summariser.submit(self.therapy_session_id)
+        return ChatListOut(messages=[chat_out])
+
+    async def async_get_messages(self) -> ChatListOut:
+        """Get existing messages or start a new session without blocking the event loop."""
+        if await asyncio.to_thread(lambda: self.first_chat):
+            return await self.async_start_session()
+        else:
+            return await asyncio.to_thread(self.get_therapy_session_messages)
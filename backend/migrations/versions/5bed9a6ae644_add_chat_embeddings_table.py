@@ -0,0 +1,53 @@
+"""Add chat embeddings table.
+
+Revision ID: 5bed9a6ae644
+Revises: 61241831366c
+Create Date: 2026-10-18 09:12:41.306118
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5bed9a6ae644"
+down_revision: Union[str, None] = "61241831366c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every chat embedding stored before this migration came from the default embedding model
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def upgrade() -> None:
+    op.create_table("chat_embeddings",
+    sa.Column("chat_id", sa.Integer(), nullable=False),
+    sa.Column("model_name", sa.String(length=255), nullable=False),
+    sa.Column("created_at", sa.DateTime(), nullable=False),
+    sa.Column("_vector", sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+    sa.PrimaryKeyConstraint("chat_id", "model_name")
+    )
+    # Move the existing vectors out of the chats table
+    op.execute(
+        sa.text(
+            "INSERT INTO chat_embeddings (chat_id, model_name, created_at, _vector) "
+            "SELECT id, :model_name, timestamp, _vector FROM chats "
+            "WHERE _vector IS NOT NULL AND length(_vector) > 0"
+        ).bindparams(model_name=LEGACY_EMBEDDING_MODEL)
+    )
+    with op.batch_alter_table("chats") as batch_op:
+        batch_op.drop_column("_vector")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("chats") as batch_op:
+        batch_op.add_column(sa.Column("_vector", sa.LargeBinary(), nullable=True))
+    op.execute(
+        sa.text(
+            "UPDATE chats SET _vector = (SELECT _vector FROM chat_embeddings "
+            "WHERE chat_embeddings.chat_id = chats.id AND chat_embeddings.model_name = :model_name)"
+        ).bindparams(model_name=LEGACY_EMBEDDING_MODEL)
+    )
+    op.drop_table("chat_embeddings")
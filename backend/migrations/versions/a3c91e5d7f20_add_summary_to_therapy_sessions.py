@@ -0,0 +1,28 @@
+"""Add summary to therapy sessions.
+
+Revision ID: a3c91e5d7f20
+Revises: 5bed9a6ae644
+Create Date: 2026-10-18 15:02:17.482913
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3c91e5d7f20"
+down_revision: Union[str, None] = "5bed9a6ae644"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("therapy_sessions", sa.Column("_encrypted_summary", sa.String(), nullable=True))
+    op.add_column("therapy_sessions", sa.Column("summary_through_chat_id", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("therapy_sessions") as batch_op:
+        batch_op.drop_column("summary_through_chat_id")
+        batch_op.drop_column("_encrypted_summary")
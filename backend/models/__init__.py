@@ -1,5 +1,6 @@
 """Initialise the models package."""
 from models.chat import Chat
+from models.chat_embedding import ChatEmbedding
 from models.chat_reference import ChatReference
 from models.graph import Edge, Node
 from models.therapist import Therapist
@@ -10,6 +11,7 @@ __all__ = [
     "User",
     "Therapist",
     "Chat",
+    "ChatEmbedding",
     "TherapySession",
     "RoleEnum",
     "Node",
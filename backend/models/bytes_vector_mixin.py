@@ -1,10 +1,12 @@
 """Defines a mixin for models that have a bytes vector field."""
 import numpy as np
-from config import logger
+from config import EMBEDDING_MODEL, VECTOR_STORAGE_DTYPE, logger
 from sqlalchemy import LargeBinary
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column
 
+from models import vector_codec
+
 
 class BytesVectorMixin:
     """Abstract class to store a vector as bytes."""
@@ -19,19 +21,42 @@ class BytesVectorMixin:
         """Check if the object has a vector."""
         return self._vector is not None and len(self._vector) > 0
 
+    @staticmethod
+    def decode_vector(data: bytes | None) -> np.array:
+        """Convert stored vector bytes into a numpy array, or None if there is no vector."""
+        if data is None:
+            return None
+        if len(data) == 0:
+            return None
+        # Convert to numpy array - handles both the versioned format and legacy float64 bytes
+        return vector_codec.decode_vector(data)
+
+    @property
+    def vector_header(self) -> vector_codec.VectorHeader | None:
+        """Return the format header of the stored vector, or None if it is missing or in the legacy format."""
+        if not self.is_vectorised:
+            return None
+        return vector_codec.read_header(self._vector)
+
     @hybrid_property
     def vector(self) -> np.array:
         """Convert the bytes vector into a numpy array."""
-        if self._vector is None:
-            return None
-        if len(self._vector) == 0:
-            return None
-        # Convert to numpy array
-        return np.frombuffer(self._vector)
+        return self.decode_vector(self._vector)
 
     @vector.setter
     def vector(self, vector: np.array) -> None:
         """Convert the numpy array into a bytes vector."""
+        self.set_vector(vector)
+
+    @vector.expression
+    def vector(cls):  # noqa: N805
+        """Use the stored bytes in SQL expressions, such as bulk updates that inspect the class attributes."""
+        return cls._vector
+
+    def set_vector(
+        self, vector: np.array, model: str = EMBEDDING_MODEL, dtype: str | None = VECTOR_STORAGE_DTYPE
+    ) -> None:
+        """Store the numpy array as bytes in the given storage dtype, or exactly if None, recording the model."""
         if vector is None:
             self._vector = b""
         else:
@@ -47,11 +72,12 @@ class BytesVectorMixin:
             if not np.issubdtype(vector.dtype, np.number):
                 msg = f"Vector elements must be numbers, not {vector.dtype}."
                 raise ValueError(msg)
-            # If entries are ints convert to floats
-            if np.issubdtype(vector.dtype, np.integer):
-                vector = vector.astype(float)
+            # Empty vectors are treated as missing
+            if len(vector) == 0:
+                self._vector = b""
+                return
             # Convert to bytes
-            self._vector = vector.tobytes()
+            self._vector = vector_codec.encode_vector(vector, dtype=dtype, model=model)
 
     def fetch_text_vector(self) -> np.array:
         """Fetch the embedding for the text."""
@@ -2,18 +2,19 @@
 import datetime
 
 import numpy as np
-from config import logger
+from config import EMBEDDING_MODEL, logger
 from database import Base
 from llm.embeddings import get_embedding
+from llm.errors import LLMError
 from sqlalchemy import DateTime, ForeignKey, Integer, String, func
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from utils.text_crypto import decrypt_string, encrypt_string
 
-from models.bytes_vector_mixin import BytesVectorMixin
+from models.chat_embedding import ChatEmbedding
 
 
-class Chat(Base, BytesVectorMixin):
+class Chat(Base):
     """Class model for chats between a user and a therapist."""
 
     __tablename__ = "chats"
@@ -28,13 +29,14 @@ class Chat(Base, BytesVectorMixin):
     sender: Mapped[str] = mapped_column(String(10), nullable=False)
     # This is the text of the chat, to be encrypted with the user's encryption key as below
     _encrypted_text: Mapped[str] = mapped_column(String, nullable=True)
-    # Vector field provided by BytesVectorMixin as _vector
 
     # Relationships
     user = relationship("User", back_populates="chats")
     therapist = relationship("Therapist", back_populates="chats")
     therapy_session = relationship("TherapySession", back_populates="chats")
     nodes = relationship("ChatReference", back_populates="chat")
+    # Embeddings live in their own table so listing chats does not read the vectors
+    embeddings = relationship("ChatEmbedding", back_populates="chat", cascade="all, delete-orphan")
 
     @hybrid_property
     def text(self) -> str:
@@ -62,11 +64,45 @@ class Chat(Base, BytesVectorMixin):
         """
         self._encrypted_text = encrypt_string(self.user.encryption_key.encode(), plaintext)
 
+    def get_embedding_row(self, model_name: str = EMBEDDING_MODEL) -> ChatEmbedding | None:
+        """Return the stored embedding of the chat by the given model, if there is one."""
+        return next((embedding for embedding in self.embeddings if embedding.model_name == model_name), None)
+
+    @property
+    def is_vectorised(self) -> bool:
+        """Check if the chat has an embedding from the configured model."""
+        embedding = self.get_embedding_row()
+        return embedding is not None and embedding.is_vectorised
+
+    @property
+    def vector(self) -> np.array:
+        """Return the chat embedding from the configured model as a numpy array."""
+        embedding = self.get_embedding_row()
+        return None if embedding is None else embedding.vector
+
+    @vector.setter
+    def vector(self, vector: np.array) -> None:
+        """Store the chat embedding from the configured model, replacing any existing one."""
+        embedding = self.get_embedding_row()
+        if vector is None or len(vector) == 0:
+            if embedding is not None:
+                self.embeddings.remove(embedding)
+            return
+        if embedding is None:
+            embedding = ChatEmbedding(model_name=EMBEDDING_MODEL)
+            self.embeddings.append(embedding)
+        embedding.vector = vector
+
     def fetch_text_vector(self) -> np.array:
         """Fetch the embedding for the text."""
         logger.debug(f"Fetching embedding for chat {self.id}")
         if self._encrypted_text:
-            self.vector = get_embedding(self.text)
+            try:
+                self.vector = get_embedding(self.text)
+            except LLMError:
+                # Leave the chat without a vector for the backfill job to pick up
+                logger.exception(f"Failed to embed chat {self.id}")
+                self.vector = None
         else:
             self.vector = None
         return self.vector
@@ -0,0 +1,39 @@
+"""Model for the chat_embeddings table."""
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING
+
+import numpy as np
+from config import VECTOR_STORAGE_DTYPE
+from database import Base
+from sqlalchemy import DateTime, ForeignKey, String, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from models.bytes_vector_mixin import BytesVectorMixin
+
+if TYPE_CHECKING:
+    from models.chat import Chat
+
+
+class ChatEmbedding(Base, BytesVectorMixin):
+    """Embedding of a chat's text by one embedding model.
+
+    Embeddings are kept out of the chats table so queries that list chats only read narrow rows, and so
+    re-embedding with a new model adds rows here instead of rewriting the chats.
+    """
+
+    __tablename__ = "chat_embeddings"
+    chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    model_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=func.now())
+    # Vector field provided by BytesVectorMixin as _vector
+
+    # Relationships
+    chat: Mapped[Chat] = relationship(back_populates="embeddings")
+
+    def set_vector(
+        self, vector: np.array, model: str | None = None, dtype: str | None = VECTOR_STORAGE_DTYPE
+    ) -> None:
+        """Store the vector, recording this row's model name in its header."""
+        super().set_vector(vector, model=model or self.model_name, dtype=dtype)
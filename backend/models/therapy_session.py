@@ -1,8 +1,10 @@
 """Model for a therapy session."""
+from typing import Optional
 
 from database import Base
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, func
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, func
 from sqlalchemy.orm import relationship
+from utils.text_crypto import decrypt_string, encrypt_string
 
 
 class TherapySession(Base):
@@ -12,8 +14,23 @@ class TherapySession(Base):
     therapist_id = Column(Integer, ForeignKey("therapists.id"), nullable=False)
     start_time = Column(DateTime, default=func.now())
     end_time = Column(DateTime, nullable=True)
+    # Rolling summary of the session's messages up to and including a chat, encrypted like the chat texts
+    _encrypted_summary = Column(String, nullable=True)
+    summary_through_chat_id = Column(Integer, nullable=True)
 
     # Relationships
     user = relationship("User", back_populates="therapy_sessions")
     therapist = relationship("Therapist", back_populates="therapy_sessions")
     chats = relationship("Chat", back_populates="therapy_session")
+
+    @property
+    def summary(self) -> Optional[str]:
+        """Return the decrypted session summary, if there is one."""
+        if self._encrypted_summary:
+            return decrypt_string(self.user.encryption_key.encode(), self._encrypted_summary)
+        return None
+
+    @summary.setter
+    def summary(self, plaintext: str) -> None:
+        """Encrypt and store the session summary."""
+        self._encrypted_summary = encrypt_string(self.user.encryption_key.encode(), plaintext)
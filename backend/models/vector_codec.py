@@ -0,0 +1,107 @@
+"""Versioned binary encoding of embedding vectors with optional scalar quantisation.
+
+Encoded vectors start with a fixed header recording the format version, storage dtype, dimension and the
+length of the embedding model name, followed by the model name, a float32 scale for int8 vectors and the
+vector data itself. All values are little endian. Without a storage dtype vectors are stored exactly, at
+their own float precision. Vectors stored before the format was introduced are headerless float64 bytes and
+are still decoded.
+"""
+from __future__ import annotations
+
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+VECTOR_FORMAT_MAGIC = b"\x93VEC"
+VECTOR_FORMAT_VERSION = 1
+# Magic, version, dtype code, model name length, padding byte, dimension
+HEADER_STRUCT = struct.Struct("<4sBBBxI")
+SCALE_STRUCT = struct.Struct("<f")
+# The model name length is stored in one byte, so a header with its model name is at most this long
+MAX_MODEL_NAME_BYTES = 255
+MAX_HEADER_SIZE = HEADER_STRUCT.size + MAX_MODEL_NAME_BYTES
+# Model of the legacy headerless vectors, as recorded for them by the chat embeddings migration
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Largest magnitude used by symmetric int8 quantisation
+INT8_MAX = 127
+
+# Storage dtype names mapped to their header codes and numpy dtypes
+DTYPE_CODES = {"float32": 1, "float16": 2, "int8": 3, "float64": 4}
+NUMPY_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+    "int8": np.dtype("i1"),
+    "float64": np.dtype("<f8"),
+}
+DTYPE_NAMES = {code: name for name, code in DTYPE_CODES.items()}
+
+
+class VectorHeader(NamedTuple):
+    """Metadata stored in front of an encoded vector."""
+
+    version: int
+    dtype: str
+    dim: int
+    model: str
+
+
+def exact_dtype(vector: np.ndarray) -> str:
+    """Return the storage dtype that keeps every value of the vector exactly."""
+    return "float32" if np.asarray(vector).dtype == np.float32 else "float64"
+
+
+def encode_vector(vector: np.ndarray, dtype: str | None = "float32", model: str = "") -> bytes:
+    """Encode a 1D vector in the versioned format, quantising it to the storage dtype, or exactly if it is None."""
+    if dtype is None:
+        dtype = exact_dtype(vector)
+    if dtype not in DTYPE_CODES:
+        msg = f"Unknown vector storage dtype {dtype!r}, expected one of {sorted(DTYPE_CODES)}."
+        raise ValueError(msg)
+    model_bytes = model.encode()
+    if len(model_bytes) > MAX_MODEL_NAME_BYTES:
+        msg = f"Model name must be at most {MAX_MODEL_NAME_BYTES} bytes."
+        raise ValueError(msg)
+    vector = np.asarray(vector, dtype=np.float64 if dtype == "float64" else np.float32)
+    header = HEADER_STRUCT.pack(
+        VECTOR_FORMAT_MAGIC, VECTOR_FORMAT_VERSION, DTYPE_CODES[dtype], len(model_bytes), len(vector)
+    )
+    if dtype == "int8":
+        # Symmetric quantisation with a per-vector scale so the largest component maps to +/-127
+        max_abs = float(np.max(np.abs(vector))) if len(vector) else 0.0
+        scale = max_abs / INT8_MAX if max_abs > 0 else 1.0
+        data = np.clip(np.rint(vector / scale), -INT8_MAX, INT8_MAX).astype(NUMPY_DTYPES[dtype])
+        return header + model_bytes + SCALE_STRUCT.pack(scale) + data.tobytes()
+    return header + model_bytes + vector.astype(NUMPY_DTYPES[dtype]).tobytes()
+
+
+def is_versioned(data: bytes) -> bool:
+    """Check if the bytes hold a vector in the versioned format rather than legacy float64 bytes."""
+    return len(data) >= HEADER_STRUCT.size and data[: len(VECTOR_FORMAT_MAGIC)] == VECTOR_FORMAT_MAGIC
+
+
+def read_header(data: bytes) -> VectorHeader | None:
+    """Return the header of an encoded vector, or None for legacy headerless bytes."""
+    if not is_versioned(data):
+        return None
+    _, version, dtype_code, model_length, dim = HEADER_STRUCT.unpack_from(data)
+    if version != VECTOR_FORMAT_VERSION or dtype_code not in DTYPE_NAMES:
+        msg = f"Unsupported vector format version {version} with dtype code {dtype_code}."
+        raise ValueError(msg)
+    model = data[HEADER_STRUCT.size : HEADER_STRUCT.size + model_length].decode()
+    return VectorHeader(version, DTYPE_NAMES[dtype_code], dim, model)
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Decode encoded or legacy vector bytes, dequantising them to float32 (float64 and legacy vectors stay float64)."""
+    header = read_header(data)
+    if header is None:
+        return np.frombuffer(data)
+    offset = HEADER_STRUCT.size + len(header.model.encode())
+    if header.dtype == "int8":
+        (scale,) = SCALE_STRUCT.unpack_from(data, offset)
+        offset += SCALE_STRUCT.size
+        quantised = np.frombuffer(data, dtype=NUMPY_DTYPES["int8"], count=header.dim, offset=offset)
+        return quantised.astype(np.float32) * np.float32(scale)
+    stored = np.frombuffer(data, dtype=NUMPY_DTYPES[header.dtype], count=header.dim, offset=offset)
+    return stored if header.dtype == "float64" else stored.astype(np.float32)
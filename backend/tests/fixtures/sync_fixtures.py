@@ -7,6 +7,9 @@ from typing import TYPE_CHECKING
 import pytest
 from config import TZ_INFO, TestConfig
 from database import Base, DBSessionManager
+from logic.chat_memory import chat_memory_cache
+from logic.session_summary import session_summary_store
+from logic.system_prompt_cache import system_prompt_cache
 from logic.therapy_session_logic import TherapySessionLogic
 from models import Chat, Therapist, TherapySession, User
 from sqlalchemy.orm import Session, sessionmaker
@@ -27,6 +30,10 @@ def sync_db_setup() -> Engine:
 
     # Reset the DBSessionManager to ensure the test engine is used
     DBSessionManager.reset()
+    # Drop chat memory, prompts and summaries cached against a previous test database
+    chat_memory_cache.clear()
+    system_prompt_cache.clear()
+    session_summary_store.clear()
 
     test_engine = DBSessionManager.get_sync_engine(config=TestConfig)
     test_session = DBSessionManager.get_session_factory()
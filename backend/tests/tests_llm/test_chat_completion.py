@@ -1,6 +1,8 @@
 """Tests for the chat completion."""
+from unittest.mock import AsyncMock
+
 import pytest
-from llm.chat_completion import get_chat_completion
+from llm.chat_completion import async_get_chat_completion, get_chat_completion
 
 
 @pytest.fixture()
@@ -60,3 +62,23 @@ def test_get_chat_completion_with_history_and_briefing(mock_api_request):
         model="gpt-3.5-turbo",
         temperature=0.3,
     )
+
+
+@pytest.mark.asyncio()
+async def test_async_get_chat_completion(mocker):
+    """Test the async_get_chat_completion function sends the same messages as get_chat_completion."""
+    mock_async_api_request = mocker.patch("llm.chat_completion.async_api_request", new_callable=AsyncMock)
+    mock_async_api_request.return_value = "Hello, how can I help you?"
+
+    result = await async_get_chat_completion("Tell me a joke.", "You are a helpful assistant.", history="Hi")
+
+    assert result == "Hello, how can I help you?"
+    mock_async_api_request.assert_awaited_once_with(
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Hi"},
+            {"role": "user", "content": "Tell me a joke."},
+        ],
+        model="gpt-3.5-turbo",
+        temperature=0.3,
+    )
@@ -1,8 +1,25 @@
 """Tests for common llm functions."""
 
-from unittest.mock import patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from llm.common import api_request  # Import your function from your actual module
+import httpx
+import openai
+import pytest
+from llm.common import (
+    api_request,
+    async_api_request,
+    async_stream_request,
+    request_with_retries,
+    retry_delay,
+    stream_request,
+)
+from llm.errors import LLMDeadlineExceededError, LLMRateLimitError, LLMRequestError, LLMUnavailableError
+
+
+def connection_error() -> openai.APIConnectionError:
+    """Return the retryable error of a request that could not reach the API."""
+    return openai.APIConnectionError(message="API Error", request=httpx.Request("POST", "https://api.openai.com/v1"))
 
 
 # Mocking the necessary methods and classes
@@ -34,6 +51,167 @@ def test_api_request(mock_chat_completion, monkeypatch, mocked_embedding_client)
     mocked_embedding_client.embeddings.create.assert_not_called()
 
 
+@pytest.mark.asyncio()
+async def test_async_api_request_chat_completion():
+    """Test the async_api_request function awaits the async chat completion."""
+    with patch("llm.common.async_chat_completion_wrapper", new_callable=AsyncMock) as mock_chat_completion:
+        mock_chat_completion.return_value = "Some value"
+        response = await async_api_request(messages=[{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo")
+    assert response == "Some value"
+    mock_chat_completion.assert_awaited_once()
+
+
+@pytest.mark.asyncio()
+async def test_async_api_request_embedding():
+    """Test the async_api_request function returns the embedding from the async client."""
+    mock_client = MagicMock()
+    mock_client.embeddings.create = AsyncMock(return_value=MagicMock(data=[MagicMock(embedding=[0.1, 0.2, 0.3])]))
+    with patch("llm.common.async_client", mock_client):
+        response = await async_api_request(text="some text", model="text-embedding-1234")
+    assert response == [0.1, 0.2, 0.3]
+    mock_client.embeddings.create.assert_awaited_once_with(input=["some text"], model="text-embedding-1234")
+
+
+@pytest.mark.asyncio()
+async def test_async_api_request_retries_without_blocking():
+    """Test failed async requests back off with asyncio.sleep and raise LLMUnavailableError after the last attempt."""
+    with (
+        patch("llm.common.async_chat_completion_wrapper", new_callable=AsyncMock) as mock_chat_completion,
+        patch("llm.common.asyncio.sleep", new_callable=AsyncMock) as mock_sleep,
+        patch("llm.common.time.sleep") as mock_time_sleep,
+    ):
+        mock_chat_completion.side_effect = [connection_error(), "Some value"]
+        response = await async_api_request(messages=[{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo")
+        assert response == "Some value"
+        mock_sleep.assert_awaited_once()
+        mock_time_sleep.assert_not_called()
+
+        mock_chat_completion.side_effect = connection_error()
+        with pytest.raises(LLMUnavailableError, match="API Error"):
+            await async_api_request(messages=[{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo")
+
+
+@pytest.mark.asyncio()
+async def test_async_stream_request_retries_until_first_delta():
+    """Test the stream is retried if it fails before the first delta, and the deltas are yielded in order."""
+    attempts = []
+
+    async def stream_wrapper(model, messages, temperature):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise connection_error()
+        for delta in ["Hello", ", ", "user"]:
+            yield delta
+
+    with (
+        patch("llm.common.async_chat_completion_stream_wrapper", stream_wrapper),
+        patch("llm.common.asyncio.sleep", new_callable=AsyncMock) as mock_sleep,
+    ):
+        deltas = [delta async for delta in async_stream_request(messages=[{"role": "user", "content": "Hi"}])]
+    assert deltas == ["Hello", ", ", "user"]
+    assert len(attempts) == 2
+    mock_sleep.assert_awaited_once()
+
+
+@pytest.mark.asyncio()
+async def test_async_stream_request_raises_after_first_delta():
+    """Test a failure part way through the stream is raised rather than replaying it."""
+
+    async def stream_wrapper(model, messages, temperature):
+        yield "Hello"
+        raise Exception("API Error")  # noqa: TRY002
+
+    with patch("llm.common.async_chat_completion_stream_wrapper", stream_wrapper):
+        deltas = []
+        with pytest.raises(Exception, match="API Error"):
+            async for delta in async_stream_request(messages=[{"role": "user", "content": "Hi"}]):
+                deltas.append(delta)
+    assert deltas == ["Hello"]
+
+
+def test_stream_request_retries_until_first_delta():
+    """Test the sync stream is retried if it fails before the first delta."""
+    attempts = []
+
+    def stream_wrapper(model, messages, temperature):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise connection_error()
+        yield from ["Hello", ", ", "user"]
+
+    with (
+        patch("llm.common.chat_completion_stream_wrapper", stream_wrapper),
+        patch("llm.common.time.sleep") as mock_sleep,
+    ):
+        deltas = list(stream_request(messages=[{"role": "user", "content": "Hi"}]))
+    assert deltas == ["Hello", ", ", "user"]
+    assert len(attempts) == 2
+    mock_sleep.assert_called_once()
+
+
+def status_error(status_code: int, headers: dict | None = None) -> openai.APIStatusError:
+    """Create the error the openai client raises for an HTTP status."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return openai.APIStatusError(f"Error code: {status_code}", response=response, body=None)
+
+
+def test_non_retryable_errors_are_not_retried():
+    """Test a rejected request raises straight away without sleeping."""
+    request = MagicMock(side_effect=status_error(401))
+    with patch("llm.common.time.sleep") as mock_sleep, pytest.raises(LLMRequestError) as excinfo:
+        request_with_retries(request)
+    assert excinfo.value.status_code == 401
+    request.assert_called_once()
+    mock_sleep.assert_not_called()
+
+
+def test_retry_after_is_respected():
+    """Test the wait before retrying a rate limited request follows the Retry-After header."""
+    request = MagicMock(side_effect=[status_error(429, {"retry-after": "7"}), "Some value"])
+    with patch("llm.common.time.sleep") as mock_sleep:
+        assert request_with_retries(request) == "Some value"
+    sleep_time = mock_sleep.call_args[0][0]
+    assert 7 <= sleep_time <= 7 * 1.25
+
+
+def test_retry_stops_at_the_deadline():
+    """Test a retry that would pass the deadline raises rather than sleeping."""
+    request = MagicMock(side_effect=status_error(429, {"retry-after": "30"}))
+    with patch("llm.common.time.sleep") as mock_sleep, pytest.raises(LLMDeadlineExceededError) as excinfo:
+        request_with_retries(request, deadline=10)
+    assert isinstance(excinfo.value.__cause__, LLMRateLimitError)
+    mock_sleep.assert_not_called()
+
+
+def test_retry_delay_jitter_is_proportional():
+    """Test the jitter scales with the backoff delay."""
+    for attempt, delay in [(1, 1), (3, 4), (10, 16)]:
+        assert delay <= retry_delay(attempt) <= delay * 1.25
+
+
+def test_api_request_raises_after_retries(monkeypatch):
+    """Test a failing chat request raises a typed error rather than returning an empty list."""
+    monkeypatch.setattr("llm.common.chat_completion_wrapper", MagicMock(side_effect=status_error(503)))
+    with patch("llm.common.time.sleep") as mock_sleep, pytest.raises(LLMUnavailableError):
+        api_request(messages=[{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo")
+    assert mock_sleep.call_count == 4
+
+
+@pytest.mark.asyncio()
+async def test_async_request_deadline_cancels_slow_attempts():
+    """Test an async attempt still running at the deadline is cancelled."""
+
+    async def slow_completion(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    with (
+        patch("llm.common.async_chat_completion_wrapper", slow_completion),
+        pytest.raises(LLMDeadlineExceededError),
+    ):
+        await async_api_request(messages=[{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo", deadline=0.05)
+
+
 # Usage
 # Save this test in a file named test_your_module.py
 # Run the test using the command: pytest test_your_module.py
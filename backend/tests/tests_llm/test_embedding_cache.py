@@ -0,0 +1,61 @@
+"""Tests for the on-disk embedding cache."""
+import numpy as np
+import pytest
+from llm.embedding_cache import EmbeddingCache
+from llm.embeddings import get_embedding, get_embeddings
+from numpy.testing import assert_array_equal
+
+
+@pytest.fixture()
+def embedding_cache(tmp_path, mocker):
+    """Enable an embedding cache in a temporary directory."""
+    cache = EmbeddingCache(tmp_path / "embeddings.db")
+    mocker.patch("llm.embeddings.get_embedding_cache", return_value=cache)
+    yield cache
+    cache.close()
+
+
+def test_cache_is_keyed_by_model_and_normalised_text(tmp_path):
+    """Test whitespace differences hit the same entry but other models do not."""
+    cache = EmbeddingCache(tmp_path / "embeddings.db")
+    cache.put("model-a", "Hello  there\n", np.array([1.0, 2.0]))
+    assert_array_equal(cache.get("model-a", "Hello there"), [1.0, 2.0])
+    assert cache.get("model-b", "Hello there") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_persists_between_instances(tmp_path):
+    """Test embeddings are still cached after reopening the file."""
+    EmbeddingCache(tmp_path / "embeddings.db").put("model", "Hi", np.array([0.5]))
+    cache = EmbeddingCache(tmp_path / "embeddings.db")
+    assert len(cache) == 1
+    assert_array_equal(cache.get("model", "Hi"), [0.5])
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    """Test the cache evicts the least recently used embeddings over the limit."""
+    cache = EmbeddingCache(tmp_path / "embeddings.db", max_entries=2)
+    cache.put("model", "first", np.array([1.0]))
+    cache.put("model", "second", np.array([2.0]))
+    cache.get("model", "first")
+    cache.put("model", "third", np.array([3.0]))
+    assert len(cache) == 2
+    assert cache.get("model", "second") is None
+    assert cache.get("model", "first") is not None
+
+
+def test_get_embedding_uses_cache(embedding_cache, mocked_embedding_client):
+    """Test repeated texts are only sent to the API once."""
+    first = get_embedding("Hello")
+    second = get_embedding("Hello")
+    assert_array_equal(first, second)
+    mocked_embedding_client.embeddings.create.assert_called_once()
+    assert embedding_cache.hits == 1
+
+
+def test_get_embeddings_only_requests_misses(embedding_cache, mocked_embedding_client):
+    """Test batched requests skip cached texts."""
+    embedding_cache.put("text-embedding-ada-002", "cached", np.array([0.4, 0.5, 0.6]))
+    embeddings = get_embeddings(["cached", "new"], model="text-embedding-ada-002")
+    assert mocked_embedding_client.embeddings.create.call_args.kwargs["input"] == ["new"]
+    np.testing.assert_allclose(embeddings, [[0.4, 0.5, 0.6], [0.1, 0.2, 0.3]])
@@ -1,6 +1,8 @@
 """Test embedding functions."""
+from typing import NamedTuple
+
 import numpy as np
-from llm.embeddings import get_embedding
+from llm.embeddings import batch_by_token_budget, get_embedding, get_embeddings
 from numpy.testing import assert_array_equal
 
 
@@ -8,6 +10,45 @@ def test_get_embedding(mocked_embedding_client):
     """Test the get_embedding function."""
     # Call the get_embedding function
     embedding = get_embedding("Some text")
+    # The text is sent as one input rather than split into characters
+    assert mocked_embedding_client.embeddings.create.call_args.kwargs["input"] == ["Some text"]
+
+    # Check the result is float32 like the rows of get_embeddings
+    assert embedding.dtype == np.float32
+    assert_array_equal(embedding, np.array([0.1, 0.2, 0.3], dtype=np.float32))
+
+
+def test_get_embeddings_batches_in_input_order(mocker):
+    """Test get_embeddings packs texts into batches and keeps them in input order."""
+
+    class EmbeddingData(NamedTuple):
+        embedding: list[float]
+
+    class EmbeddingResponse(NamedTuple):
+        data: list[EmbeddingData]
+
+    def create(input, model):  # noqa: A002, ARG001
+        return EmbeddingResponse(data=[EmbeddingData(embedding=[float(len(text)), 1.0]) for text in input])
+
+    mocked_client = mocker.patch("llm.common.client")
+    mocked_client.embeddings.create.side_effect = create
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    embeddings = get_embeddings(texts, max_inputs=2)
+
+    assert embeddings.dtype == np.float32
+    assert_array_equal(embeddings[:, 0], [1, 2, 3, 4, 5])
+    assert mocked_client.embeddings.create.call_count == 3
+    assert mocked_client.embeddings.create.call_args_list[0].kwargs["input"] == ["a", "bb"]
+
+
+def test_get_embeddings_with_no_texts(mocked_embedding_client):
+    """Test get_embeddings makes no request for an empty list."""
+    assert get_embeddings([]).shape == (0, 0)
+    mocked_embedding_client.embeddings.create.assert_not_called()
+
 
-    # Check the result
-    assert_array_equal(embedding, np.array([0.1, 0.2, 0.3]))
+def test_batch_by_token_budget():
+    """Test batches respect both the input and token limits."""
+    batches = list(batch_by_token_budget([5, 5, 5, 20, 1, 1, 1], max_inputs=3, max_tokens=12))
+    assert batches == [(0, 2), (2, 3), (3, 4), (4, 7)]
@@ -0,0 +1,67 @@
+"""Tests for the classification of LLM request errors."""
+import httpx
+import openai
+import pytest
+from llm.errors import (
+    LLMRateLimitError,
+    LLMRequestError,
+    LLMUnavailableError,
+    classify_error,
+    parse_retry_after,
+)
+
+
+def status_error(status_code: int, headers: dict | None = None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return openai.APIStatusError(f"Error code: {status_code}", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    ("status_code", "error_type", "retryable"),
+    [
+        (400, LLMRequestError, False),
+        (401, LLMRequestError, False),
+        (404, LLMRequestError, False),
+        (408, LLMUnavailableError, True),
+        (429, LLMRateLimitError, True),
+        (500, LLMUnavailableError, True),
+        (503, LLMUnavailableError, True),
+    ],
+)
+def test_classify_status_errors(status_code, error_type, retryable):
+    error = classify_error(status_error(status_code))
+    assert type(error) is error_type
+    assert error.retryable is retryable
+    assert error.status_code == status_code
+    assert isinstance(error.__cause__, openai.APIStatusError)
+
+
+def test_classify_connection_errors_as_retryable():
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    assert isinstance(classify_error(openai.APIConnectionError(request=request)), LLMUnavailableError)
+    assert isinstance(classify_error(openai.APITimeoutError(request=request)), LLMUnavailableError)
+
+
+def test_classify_other_errors_as_not_retryable():
+    error = classify_error(TypeError("unsupported operand type(s)"))
+    assert type(error) is LLMRequestError
+    assert not error.retryable
+
+
+def test_classify_keeps_typed_errors():
+    error = LLMRequestError("Bad request", 400)
+    assert classify_error(error) is error
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"retry-after": "3"}) == 3
+    assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_rate_limit_error_keeps_retry_after():
+    error = classify_error(status_error(429, {"retry-after": "20"}))
+    assert error.retry_after == 20
@@ -0,0 +1,72 @@
+"""Test the combined node and edge extraction."""
+
+import pytest
+from llm.graph_processing import async_get_graph, get_graph
+from spacy.lang.en import English
+
+COMBINED_RESPONSE = """{
+    "nodes": [
+        {"id": 1, "label": "Alice", "spans": [[0]], "type": "person"},
+        {"id": 2, "label": "London", "spans": [[3]], "type": "place"}
+    ],
+    "edges": [
+        {"label": "went to", "spans": [[1, 2]], "source": 1, "target": 2},
+        {"label": "likes", "spans": [[1]], "source": 1, "target": 7}
+    ]
+}"""
+
+
+@pytest.fixture()
+def nlp():
+    return English()
+
+
+@pytest.fixture()
+def mock_api_request(mocker):
+    return mocker.patch("llm.graph_processing.api_request")
+
+
+def test_single_request(mock_api_request, nlp):
+    mock_api_request.return_value = COMBINED_RESPONSE
+    nodes, edges = get_graph(nlp("Alice went to London."))
+    assert [node["label"] for node in nodes] == ["Alice", "London"]
+    # The edge to a node that was not extracted is dropped
+    assert edges == [{"label": "went to", "spans": [[1, 2]], "source": 1, "target": 2}]
+    mock_api_request.assert_called_once()
+    content = mock_api_request.call_args.kwargs["messages"][1]["content"]
+    assert "Please provide the nodes and edges" in content
+    assert "Alice went to London." in content
+
+
+def test_falls_back_to_separate_requests(mock_api_request, nlp):
+    mock_api_request.side_effect = [
+        "Sorry, I cannot help with that.",
+        '{"nodes": [{"label": "Alice", "spans": [[0]]}, {"label": "London", "spans": [[3]]}]}',
+        '{"edges": [{"label": "went to", "spans": [[1, 2]], "source": 1, "target": 2}]}',
+    ]
+    nodes, edges = get_graph(nlp("Alice went to London."))
+    assert nodes == [{"label": "Alice", "spans": [[0]], "id": 1}, {"label": "London", "spans": [[3]], "id": 2}]
+    assert edges == [{"label": "went to", "spans": [[1, 2]], "source": 1, "target": 2}]
+    assert mock_api_request.call_count == 3
+    # The edge request refers to the nodes by the ids they were given
+    assert str(nodes) in mock_api_request.call_args.kwargs["messages"][3]["content"]
+
+
+def test_requests_missing_edges(mock_api_request, nlp):
+    mock_api_request.side_effect = [
+        '{"nodes": [{"label": "Alice", "spans": [[0]]}]}',
+        '{"edges": []}',
+    ]
+    nodes, edges = get_graph(nlp("Alice went to London."))
+    assert nodes == [{"label": "Alice", "spans": [[0]], "id": 1}]
+    assert edges == []
+    assert mock_api_request.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_async_single_request(mocker, nlp):
+    async_api_request = mocker.patch("llm.graph_processing.async_api_request", return_value=COMBINED_RESPONSE)
+    nodes, edges = await async_get_graph(nlp("Alice went to London."))
+    assert len(nodes) == 2
+    assert len(edges) == 1
+    async_api_request.assert_awaited_once()
@@ -0,0 +1,64 @@
+"""Tests for the streaming extraction response parser."""
+
+import pytest
+from llm.graph_processing import parse_graph_response, stream_nodes
+from llm.json_stream import ExtractionStreamParser, parse_objects
+from spacy.lang.en import English
+
+RESPONSE = """```json
+{
+    "nodes": [
+        {"label": "Alice \\"Al\\" {Smith}", "spans": [[0]], "type": "person",},
+        {"label": "London", "spans": [[3]], "type": "place"}
+    ],
+    "edges": [{"label": "went to", "source": 1, "target": 2, "spans": [[1, 2]]}]
+}
+```"""
+
+
+def chunks(text: str, size: int) -> list[str]:
+    """Split the text into deltas of the given size."""
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_objects_are_parsed_whatever_the_delta_size(size):
+    nodes = list(parse_objects(chunks(RESPONSE, size), "nodes"))
+    assert [node["label"] for node in nodes] == ['Alice "Al" {Smith}', "London"]
+    edges = list(parse_objects(chunks(RESPONSE, size), "edges"))
+    assert edges == [{"label": "went to", "source": 1, "target": 2, "spans": [[1, 2]]}]
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = ExtractionStreamParser()
+    assert parser.feed('{"nodes": [{"label": "Alice"') == []
+    assert parser.feed('}, {"label"') == [("nodes", {"label": "Alice"})]
+    assert parser.feed(': "London"}]}') == [("nodes", {"label": "London"})]
+    # Anything after the JSON is ignored
+    assert parser.feed('{"label": "Extra"}') == []
+
+
+def test_bare_list_and_nested_objects():
+    objects = list(parse_objects(['[{"label": "A", "meta": {"x": 1}}, {"label": "B"}]'], "nodes"))
+    assert objects == [{"label": "A", "meta": {"x": 1}}, {"label": "B"}]
+
+
+def test_malformed_and_truncated_objects_are_dropped():
+    parser = ExtractionStreamParser()
+    objects = parser.feed('{"nodes": [{"label": A}, {"label": "B"}, {"label": "C", "spa')
+    assert objects == [("nodes", {"label": "B"})]
+    assert parser.dropped == 1
+
+
+def test_parse_graph_response_salvages_truncated_response():
+    response = '{"nodes": [{"label": "Alice", "spans": [[0]]}, {"label": "Lon'
+    assert parse_graph_response(response, "nodes") == [{"label": "Alice", "spans": [[0]]}]
+    assert parse_graph_response("Invalid JSON", "nodes") == {}
+
+
+def test_stream_nodes(mocker):
+    stream_request = mocker.patch("llm.graph_processing.stream_request", return_value=iter(chunks(RESPONSE, 7)))
+    nodes = stream_nodes(English()("Alice went to London."))
+    assert next(nodes)["type"] == "person"
+    assert [node["label"] for node in nodes] == ["London"]
+    assert "Alice went to London." in stream_request.call_args.args[0][1]["content"]
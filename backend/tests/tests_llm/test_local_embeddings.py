@@ -0,0 +1,48 @@
+"""Tests for the local embedding backends."""
+import numpy as np
+import pytest
+from llm.embeddings import get_embedding, get_embeddings
+from llm.local_embeddings import get_local_embeddings, is_local_model
+
+
+def test_is_local_model():
+    """Test local models are told apart from API models."""
+    assert is_local_model("hashing-256")
+    assert is_local_model("spacy-en_core_web_sm")
+    assert not is_local_model("text-embedding-ada-002")
+
+
+def test_hashing_embeddings_are_normalised_and_deterministic():
+    """Test hashing embeddings have unit length and repeat exactly."""
+    texts = ["I feel anxious about work", "", "Work makes me anxious"]
+    embeddings = get_local_embeddings(texts, "hashing-256")
+    assert embeddings.shape == (3, 256)
+    assert embeddings.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(embeddings[[0, 2]], axis=1), 1.0, rtol=1e-6)
+    # Empty texts embed to zeros
+    assert not embeddings[1].any()
+    np.testing.assert_array_equal(embeddings, get_local_embeddings(texts, "hashing-256"))
+
+
+def test_hashing_embeddings_rank_related_text_higher():
+    """Test texts sharing words score higher than unrelated ones."""
+    query, related, unrelated = get_local_embeddings(
+        ["my sister is visiting", "visiting my sister", "the weather is cold"], "hashing-512"
+    )
+    assert query @ related > query @ unrelated
+
+
+def test_embedding_functions_skip_the_api_for_local_models(mocked_embedding_client):
+    """Test get_embedding and get_embeddings use the local backend for local models."""
+    single = get_embedding("Hello there", model="hashing-64")
+    batch = get_embeddings(["Hello there", "Goodbye"], model="hashing-64")
+    np.testing.assert_array_equal(single, batch[0])
+    mocked_embedding_client.embeddings.create.assert_not_called()
+
+
+def test_invalid_local_models():
+    """Test malformed local model names raise errors."""
+    with pytest.raises(ValueError, match="dimension"):
+        get_local_embeddings(["text"], "hashing-big")
+    with pytest.raises(ValueError, match="loaded model"):
+        get_local_embeddings(["text"], "spacy-not_a_model")
@@ -0,0 +1,98 @@
+"""Tests for the mock OpenAI server."""
+import json
+import random
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from llm.errors import LLMRateLimitError, LLMUnavailableError, classify_error
+from llm.graph_processing import build_edge_messages, build_node_messages, parse_graph_response
+from llm.mock_server import MockServerSettings, create_app, sample_latency
+from spacy.lang.en import English
+
+
+def mock_client(settings: MockServerSettings | None = None) -> openai.OpenAI:
+    """Return an OpenAI client that sends its requests to a mock server app."""
+    return openai.OpenAI(
+        api_key="test", base_url="http://testserver/v1", http_client=TestClient(create_app(settings)), max_retries=0
+    )
+
+
+def test_chat_completion_and_embeddings():
+    """Test the mock server answers chat completions and returns deterministic unit embeddings."""
+    client = mock_client(MockServerSettings(reply="Hello there.", embedding_dimensions=8))
+    response = client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+    assert response.choices[0].message.content == "Hello there."
+
+    response = client.embeddings.create(model="text-embedding-ada-002", input=["one", "two", "one"])
+    first, second, third = (item.embedding for item in response.data)
+    assert len(first) == 8
+    assert first == third
+    assert first != second
+    assert sum(value * value for value in first) == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio()
+async def test_streamed_chat_completion():
+    """Test a streamed reply arrives in chunks that join back into the reply."""
+    app = create_app(MockServerSettings(reply="One two three."))
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    client = openai.AsyncOpenAI(api_key="test", base_url="http://testserver/v1", http_client=http_client)
+    stream = await client.chat.completions.create(
+        model="gpt-4", messages=[{"role": "user", "content": "Hi"}], stream=True
+    )
+    deltas = [chunk.choices[0].delta.content async for chunk in stream if chunk.choices[0].delta.content]
+    assert deltas == ["One ", "two ", "three."]
+
+
+def test_canned_extraction():
+    """Test extraction requests get nodes and edges the graph parsers accept."""
+    client = mock_client()
+    doc = English()("Alice visited London with Robert")
+
+    def extract(messages: list[dict], key: str) -> list[dict]:
+        response = client.chat.completions.create(model="gpt-4o", messages=messages)
+        return parse_graph_response(response.choices[0].message.content, key)
+
+    nodes = extract(build_node_messages(doc), "nodes")
+    assert [node["label"] for node in nodes] == ["visited", "London", "Robert"]
+    assert nodes[0]["spans"] == [[1]]
+    edges = extract(build_edge_messages(doc, nodes), "edges")
+    assert edges == [
+        {"label": "relates to", "source": 1, "target": 2, "spans": []},
+        {"label": "with", "source": 2, "target": 3, "spans": [[3]]},
+    ]
+
+
+def test_injected_errors():
+    """Test injected rate limits carry a Retry-After and server errors are retryable."""
+    with pytest.raises(openai.RateLimitError) as exc_info:
+        mock_client(MockServerSettings(rate_limit_rate=1.0, retry_after=0.25)).embeddings.create(
+            model="text-embedding-ada-002", input="text"
+        )
+    error = classify_error(exc_info.value)
+    assert isinstance(error, LLMRateLimitError)
+    assert error.retry_after == pytest.approx(0.25)
+
+    with pytest.raises(openai.InternalServerError) as exc_info:
+        mock_client(MockServerSettings(server_error_rate=1.0)).chat.completions.create(
+            model="gpt-4", messages=[{"role": "user", "content": "Hi"}]
+        )
+    assert isinstance(classify_error(exc_info.value), LLMUnavailableError)
+
+    client = mock_client(MockServerSettings(timeout_rate=1.0, timeout_seconds=0.0))
+    with pytest.raises(openai.APIStatusError) as exc_info:
+        client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+    assert exc_info.value.status_code == json.loads(exc_info.value.response.text)["error"]["code"] == 504
+
+
+def test_sample_latency():
+    """Test the latency distributions centre on the configured mean."""
+    rng = random.Random(0)
+    assert sample_latency(MockServerSettings(latency_mean=0.5), rng) == 0.5
+    uniform = [sample_latency(MockServerSettings(latency="uniform", latency_mean=1.0), rng) for _ in range(1000)]
+    assert min(uniform) >= 0.5
+    assert max(uniform) <= 1.5
+    lognormal = [sample_latency(MockServerSettings(latency="lognormal", latency_mean=1.0), rng) for _ in range(5000)]
+    assert sum(lognormal) / len(lognormal) == pytest.approx(1.0, rel=0.1)
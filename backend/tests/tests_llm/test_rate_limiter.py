@@ -0,0 +1,104 @@
+"""Tests for the LLM rate limiter."""
+import asyncio
+import threading
+import time
+
+import pytest
+from llm.rate_limiter import ModelRateLimiter, Priority, RateLimiter, TokenBucket, estimate_tokens
+from llm.token_counter import count_tokens, count_tokens_batch
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(60)
+    bucket.refill(bucket.updated + 0.5)
+    assert bucket.available == pytest.approx(0.5)
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    # Requests over capacity wait for a full bucket rather than forever
+    assert bucket.wait_time(120) == pytest.approx(59.5)
+
+
+def test_estimate_tokens():
+    messages = [{"role": "user", "content": "Hello there, how are you today?"}]
+    assert estimate_tokens("gpt-4", messages=messages) == count_tokens(messages[0]["content"], "gpt-4") + 4 + 1
+    texts = ["a" * 8, "b" * 8]
+    assert estimate_tokens("text-embedding-ada-002", texts=texts) == sum(count_tokens_batch(texts)) + 1
+    # Token counts the caller already has are used instead of counting the texts again
+    assert estimate_tokens("text-embedding-ada-002", texts=texts, token_counts=[3, 4]) == 3 + 4 + 1
+
+
+def test_unconfigured_model_is_not_limited():
+    rate_limiter = RateLimiter({"gpt-4o": {"rpm": 1, "tpm": 1}})
+    assert rate_limiter.acquire("gpt-3.5-turbo", 1_000_000) == 0.0
+    assert set(rate_limiter.metrics()) == {"gpt-4o"}
+
+
+def test_unconfigured_model_tokens_are_not_counted(mocker):
+    count_tokens_batch = mocker.patch("llm.rate_limiter.count_tokens_batch", return_value=[1])
+    rate_limiter = RateLimiter({"gpt-4o": {"rpm": 60, "tpm": 1000}})
+    messages = [{"role": "user", "content": "Hi"}]
+    assert rate_limiter.acquire_request("gpt-3.5-turbo", messages=messages) == 0.0
+    count_tokens_batch.assert_not_called()
+    rate_limiter.acquire_request("gpt-4o", messages=messages)
+    count_tokens_batch.assert_called()
+
+
+def test_interactive_requests_go_before_background():
+    # One request every 0.1 seconds once the bucket is empty
+    limiter = ModelRateLimiter(requests_per_minute=600, tokens_per_minute=1_000_000)
+    limiter.requests.available = 0
+    granted = []
+
+    def request(priority: Priority) -> None:
+        limiter.acquire(1, priority)
+        granted.append(priority)
+
+    background = threading.Thread(target=request, args=(Priority.BACKGROUND,))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=request, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    background.join()
+    interactive.join()
+
+    assert granted == [Priority.INTERACTIVE, Priority.BACKGROUND]
+    metrics = limiter.metrics()
+    assert metrics[Priority.INTERACTIVE].queue_depth == 0
+    assert metrics[Priority.BACKGROUND].queue_depth == 0
+    assert metrics[Priority.BACKGROUND].granted == 1
+    assert metrics[Priority.BACKGROUND].max_wait_seconds >= metrics[Priority.INTERACTIVE].max_wait_seconds
+
+
+def test_tokens_per_minute_limit_delays_requests():
+    limiter = ModelRateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+    assert limiter.acquire(600) < 0.05
+    # The bucket refills 10 tokens a second
+    assert limiter.acquire(2) == pytest.approx(0.2, abs=0.1)
+
+
+@pytest.mark.asyncio()
+async def test_async_acquire_orders_by_priority():
+    limiter = ModelRateLimiter(requests_per_minute=600, tokens_per_minute=1_000_000)
+    limiter.requests.available = 0
+    granted = []
+
+    async def request(priority: Priority, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await limiter.async_acquire(1, priority)
+        granted.append(priority)
+
+    await asyncio.gather(request(Priority.BACKGROUND, 0), request(Priority.INTERACTIVE, 0.02))
+    assert granted == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = ModelRateLimiter(requests_per_minute=6, tokens_per_minute=1_000_000)
+    limiter.requests.available = 0
+    waiter = asyncio.create_task(limiter.async_acquire(1, Priority.INTERACTIVE))
+    await asyncio.sleep(0.02)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.metrics()[Priority.INTERACTIVE].queue_depth == 0
+    assert not limiter._queue
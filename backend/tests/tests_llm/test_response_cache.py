@@ -0,0 +1,83 @@
+"""Tests for the on-disk response cache."""
+import pytest
+import spacy
+from llm.graph_processing import get_nodes, stream_nodes
+from llm.response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "Extract the nodes"}]
+
+
+@pytest.fixture()
+def response_cache(tmp_path, mocker):
+    """Enable a response cache in a temporary directory."""
+    cache = ResponseCache(tmp_path / "responses.db")
+    mocker.patch("llm.graph_processing.get_response_cache", return_value=cache)
+    yield cache
+    cache.close()
+
+
+def test_cache_is_keyed_by_the_whole_request(tmp_path):
+    """Test a different model, message or temperature misses the cache."""
+    cache = ResponseCache(tmp_path / "responses.db")
+    cache.put("gpt-4o", MESSAGES, 0.1, '{"nodes": []}')
+    assert cache.get("gpt-4o", MESSAGES, 0.1) == '{"nodes": []}'
+    assert cache.get("gpt-4", MESSAGES, 0.1) is None
+    assert cache.get("gpt-4o", MESSAGES, 0.2) is None
+    assert cache.get("gpt-4o", [{"role": "user", "content": "Extract the edges"}], 0.1) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_expired_responses_are_misses(tmp_path, mocker):
+    """Test responses older than the TTL are dropped."""
+    cache = ResponseCache(tmp_path / "responses.db", ttl_seconds=60)
+    time_mock = mocker.patch("llm.response_cache.time.time", return_value=1000.0)
+    cache.put("gpt-4o", MESSAGES, 0.1, "{}")
+    time_mock.return_value = 1059.0
+    assert cache.get("gpt-4o", MESSAGES, 0.1) == "{}"
+    time_mock.return_value = 1061.0
+    assert cache.get("gpt-4o", MESSAGES, 0.1) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    """Test the cache evicts the least recently used responses over the limit."""
+    cache = ResponseCache(tmp_path / "responses.db", max_entries=2)
+    for content in ["first", "second"]:
+        cache.put("gpt-4o", [{"role": "user", "content": content}], 0.1, content)
+    cache.get("gpt-4o", [{"role": "user", "content": "first"}], 0.1)
+    cache.put("gpt-4o", [{"role": "user", "content": "third"}], 0.1, "third")
+    assert len(cache) == 2
+    assert cache.get("gpt-4o", [{"role": "user", "content": "second"}], 0.1) is None
+    assert cache.get("gpt-4o", [{"role": "user", "content": "first"}], 0.1) == "first"
+
+
+def test_reprocessing_hits_the_cache(response_cache, mocker):
+    """Test extracting the same text twice only makes one request."""
+    api_request = mocker.patch(
+        "llm.graph_processing.api_request", return_value='{"nodes": [{"label": "Brian", "spans": [[0]]}]}'
+    )
+    doc = spacy.blank("en")("Brian has lots of fun!")
+    assert get_nodes(doc) == get_nodes(doc) == [{"label": "Brian", "spans": [[0]]}]
+    api_request.assert_called_once()
+    assert response_cache.hits == 1
+
+
+def test_unparseable_responses_are_not_cached(response_cache, mocker):
+    """Test responses that are not JSON are requested again."""
+    api_request = mocker.patch("llm.graph_processing.api_request", return_value="Sorry, I cannot help")
+    doc = spacy.blank("en")("Brian has lots of fun!")
+    get_nodes(doc)
+    get_nodes(doc)
+    assert api_request.call_count == 2
+    assert len(response_cache) == 0
+
+
+def test_streamed_responses_are_cached(response_cache, mocker):
+    """Test a streamed extraction is cached once it ends and replayed from the cache, also for get_nodes."""
+    deltas = ['{"nodes": [{"label": "Brian",', ' "spans": [[0]]}]}']
+    stream_request = mocker.patch("llm.graph_processing.stream_request", return_value=iter(deltas))
+    api_request = mocker.patch("llm.graph_processing.api_request")
+    doc = spacy.blank("en")("Brian has lots of fun!")
+    assert list(stream_nodes(doc)) == list(stream_nodes(doc)) == get_nodes(doc) == [{"label": "Brian", "spans": [[0]]}]
+    stream_request.assert_called_once()
+    api_request.assert_not_called()
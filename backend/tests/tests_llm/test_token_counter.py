@@ -0,0 +1,54 @@
+"""Tests for the token counter."""
+import pytest
+import tiktoken
+from llm import token_counter
+from llm.token_counter import count_tokens, count_tokens_batch, message_overhead, num_tokens_from_messages
+
+
+@pytest.fixture()
+def byte_encoding(mocker):
+    """Use a tokeniser with a token per byte, which needs no download."""
+    encoding = tiktoken.Encoding(
+        name="bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={}
+    )
+    mocker.patch("llm.token_counter.load_encoding", return_value=encoding)
+    token_counter.token_count_cache.clear()
+    yield encoding
+    token_counter.token_count_cache.clear()
+
+
+@pytest.mark.parametrize(
+    ("model", "overhead"),
+    [
+        ("gpt-3.5-turbo-0301", (4, -1, 2)),
+        ("gpt-3.5-turbo", (3, 1, 3)),
+        ("gpt-4", (3, 1, 3)),
+        ("gpt-4o", (3, 1, 3)),
+        ("gpt-4o-2024-08-06", (3, 1, 3)),
+    ],
+)
+def test_message_overhead(model, overhead):
+    assert message_overhead(model) == overhead
+
+
+def test_unknown_model_raises():
+    with pytest.raises(NotImplementedError):
+        message_overhead("invalid_model")
+
+
+def test_num_tokens_from_messages(byte_encoding):
+    messages = [{"role": "system", "content": "Be kind"}, {"role": "user", "name": "Al", "content": "Hi"}]
+    # Values are 6 + 7 + 4 + 2 + 2 bytes, plus 3 per message, 1 for the name and 3 for the reply
+    assert num_tokens_from_messages(messages, model="gpt-4o") == 21 + 6 + 1 + 3
+
+
+def test_counts_are_cached(byte_encoding, mocker):
+    encode_batch = mocker.spy(byte_encoding, "encode_batch")
+    assert count_tokens_batch(["system prompt", "hello", "system prompt"]) == [13, 5, 13]
+    assert count_tokens("system prompt") == 13
+    encode_batch.assert_called_once_with(["system prompt", "hello"], disallowed_special=())
+
+
+def test_estimates_without_tokeniser(mocker):
+    mocker.patch("llm.token_counter.load_encoding", return_value=None)
+    assert count_tokens("a" * 40) == 11
@@ -0,0 +1,69 @@
+"""Test the token index formats of extraction prompts and their benchmark."""
+
+import pytest
+from llm.extraction_benchmark import run_benchmark, score_spans
+from llm.graph_processing import build_node_messages, format_input_text
+from llm.mock_server import extraction_tokens
+from spacy.lang.en import English
+
+
+@pytest.fixture()
+def nlp():
+    return English()
+
+
+def test_tuples_format(nlp):
+    doc = nlp("Alice went to London.")
+    assert format_input_text(doc, "tuples") == (
+        "Input Text: \nAlice went to London.\n\n"
+        "Token Indexes: [('Alice', 0), ('went', 1), ('to', 2), ('London', 3), ('.', 4)]"
+    )
+
+
+def test_inline_format(nlp):
+    doc = nlp("Alice went to London.")
+    assert format_input_text(doc, "inline").endswith("\nAlice[0] went[1] to[2] London[3].[4]")
+
+
+def test_offsets_format(mocker, nlp):
+    mocker.patch("llm.graph_processing.OFFSETS_LINE_TOKENS", 3)
+    doc = nlp("Alice went to London.")
+    assert format_input_text(doc, "offsets").endswith("\n[0] Alice went to\n[3] London .")
+
+
+def test_unknown_format(nlp):
+    with pytest.raises(ValueError, match="Unknown token index format"):
+        format_input_text(nlp("Alice"), "json")
+
+
+@pytest.mark.parametrize("index_format", ["tuples", "inline", "offsets"])
+def test_formats_keep_token_indexes(nlp, index_format):
+    """Test the token indexes can be read back from the prompt in each format."""
+    doc = nlp("Alice went to London with Robert, and they loved it.")
+    tokens = extraction_tokens(build_node_messages(doc, index_format))
+    assert tokens == [(token.text, token.i) for token in doc]
+
+
+def test_score_spans(nlp):
+    doc = nlp("Alice went to New York.")
+    nodes = [
+        {"label": "Alice", "spans": [[0]]},
+        {"label": "New York", "spans": [[3, 4], [2, 3]]},
+        {"label": "Bob", "spans": [[10]]},
+    ]
+    assert score_spans(doc, nodes) == (2, 4)
+
+
+def test_run_benchmark(mocker, nlp):
+    get_nodes = mocker.patch(
+        "llm.extraction_benchmark.get_nodes", return_value=[{"label": "Alice", "spans": [[0]]}]
+    )
+    reports = run_benchmark(["Alice went to London."], nlp, ["tuples", "inline"])
+    assert [report.index_format for report in reports] == ["tuples", "inline"]
+    assert reports[0].input_tokens > reports[1].input_tokens > reports[0].text_tokens
+    assert reports[0].prompt_tokens > reports[0].input_tokens
+    assert all(report.span_accuracy == 1.0 for report in reports)
+    assert get_nodes.call_count == 2
+
+    reports = run_benchmark(["Alice went to London."], nlp, ["offsets"], extract=False)
+    assert reports[0].span_accuracy is None
@@ -0,0 +1,113 @@
+"""Test the embedding backfill job."""
+import numpy as np
+import pytest
+from llm.embeddings import get_embeddings
+from logic.chat_memory import ChatMemoryStore, EmbeddingShard
+from logic.embedding_backfill import BackfillCheckpoint, is_stale, run_backfill
+from models import Chat, ChatEmbedding, Edge, Node
+from models.vector_codec import LEGACY_EMBEDDING_MODEL, encode_vector
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+MODEL = "hashing-32"
+
+
+@pytest.fixture()
+def unembedded_chats(shared_session: Session, chat_instance: Chat) -> list[Chat]:
+    """Create chats with text but no embedding."""
+    chats = [chat_instance]
+    for text in ["I slept badly", "Work was better today"]:
+        chat = Chat(
+            user=chat_instance.user,
+            therapist=chat_instance.therapist,
+            therapy_session=chat_instance.therapy_session,
+            sender="user",
+        )
+        shared_session.add(chat)
+        chat.text = text
+        chats.append(chat)
+    shared_session.commit()
+    return chats
+
+
+def test_backfill_chats(shared_session: Session, unembedded_chats: list[Chat], tmp_path):
+    reports = run_backfill(["chats"], model=MODEL, chunk_size=2, checkpoint_path=tmp_path / "checkpoint.json")
+
+    assert reports[0].rows == 3
+    assert reports[0].rows_per_second > 0
+    shared_session.expire_all()
+    stored = shared_session.query(ChatEmbedding).filter_by(model_name=MODEL).order_by(ChatEmbedding.chat_id).all()
+    assert [embedding.chat_id for embedding in stored] == [chat.id for chat in unembedded_chats]
+    np.testing.assert_allclose(stored[1].vector, get_embeddings(["I slept badly"], model=MODEL)[0], atol=1e-3)
+    # A second run has nothing left to do
+    assert run_backfill(["chats"], model=MODEL, checkpoint_path=tmp_path / "checkpoint.json")[0].rows == 0
+
+
+def test_backfill_resumes_from_checkpoint(
+    shared_session: Session, unembedded_chats: list[Chat], tmp_path, mocker: MockerFixture
+):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    mocker.patch(
+        "logic.embedding_backfill.get_embeddings",
+        side_effect=[get_embeddings(["first"], model=MODEL), RuntimeError("API down")],
+    )
+    with pytest.raises(RuntimeError):
+        run_backfill(["chats"], model=MODEL, chunk_size=1, checkpoint_path=checkpoint_path)
+    assert BackfillCheckpoint(checkpoint_path).get("chats", MODEL) == unembedded_chats[0].id
+
+    mocker.stopall()
+    reports = run_backfill(["chats"], model=MODEL, chunk_size=1, checkpoint_path=checkpoint_path)
+    assert reports[0].rows == 2
+    # The checkpoint is cleared once the target is finished
+    assert BackfillCheckpoint(checkpoint_path).get("chats", MODEL) == 0
+
+
+def test_backfill_deletes_shards_before_checkpoint(
+    shared_session: Session, unembedded_chats: list[Chat], tmp_path, mocker: MockerFixture
+):
+    mocker.patch("logic.embedding_backfill.EMBEDDING_SHARD_DIR", tmp_path)
+    chat = unembedded_chats[0]
+    shard = EmbeddingShard(tmp_path, chat.user_id, chat.therapist_id, MODEL)
+    shard.write(ChatMemoryStore.from_arrays(np.array([99]), np.ones((1, 32), dtype=np.float32), np.ones(1)))
+    mocker.patch(
+        "logic.embedding_backfill.get_embeddings",
+        side_effect=[get_embeddings(["first"], model=MODEL), RuntimeError("API down")],
+    )
+    with pytest.raises(RuntimeError):
+        run_backfill(["chats"], model=MODEL, chunk_size=1, checkpoint_path=tmp_path / "checkpoint.json")
+    # The shard is rebuilt from the committed chunk even though the run did not finish
+    assert not shard.exists()
+
+
+def test_backfill_graph_replaces_stale_vectors(shared_session: Session, user_instance, tmp_path):
+    current = Node("Alice", user_id=user_instance.id, node_type="person")
+    current._vector = encode_vector(np.ones(32), model=MODEL)
+    stale = Node("London", user_id=user_instance.id, node_type="place")
+    stale.vector = np.ones(3)
+    missing = Node("Paris", user_id=user_instance.id, node_type="place")
+    shared_session.add_all([current, stale, missing])
+    shared_session.flush()
+    edge = Edge(
+        user_id=user_instance.id,
+        from_node_id=current.id,
+        to_node_id=stale.id,
+        type="visited",
+        description="Alice visited London",
+    )
+    shared_session.add(edge)
+    shared_session.commit()
+
+    reports = run_backfill(["nodes", "edges"], model=MODEL, checkpoint_path=tmp_path / "checkpoint.json")
+
+    assert [(report.target, report.rows) for report in reports] == [("nodes", 2), ("edges", 1)]
+    shared_session.expire_all()
+    assert {node.vector_header.model for node in (current, stale, missing)} == {MODEL}
+    assert len(edge.vector) == 32
+
+
+def test_is_stale_treats_headerless_vectors_as_legacy():
+    legacy = np.ones(3).tobytes()
+    assert not is_stale(legacy, LEGACY_EMBEDDING_MODEL)
+    assert is_stale(legacy, MODEL)
+    assert is_stale(b"", MODEL)
+    assert not is_stale(encode_vector(np.ones(3), model=MODEL), MODEL)
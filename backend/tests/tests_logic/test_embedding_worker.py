@@ -0,0 +1,43 @@
+"""Test deferred chat embedding."""
+import numpy as np
+from database import DBSessionManager
+from logic.embedding_worker import embedding_worker
+from logic.therapy_session_logic import TherapySessionLogic
+from models import Chat
+from pytest_mock import MockerFixture
+
+
+def fake_embeddings(texts, model, **kwargs):  # noqa: ARG001
+    return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+def test_deferred_embedding_patches_chat_memory(user_instance, therapist_instance, mocker: MockerFixture):
+    get_embeddings = mocker.patch("logic.embedding_worker.get_embeddings", side_effect=fake_embeddings)
+    session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    # Warm the chat memory so it has to be patched in place
+    assert len(session.chat_memory) == 0
+
+    chat_out = session.add_chat_message("therapist", "How are you feeling today?", defer_embedding=True)
+    embedding_worker.join()
+
+    get_embeddings.assert_called_once()
+    assert session.chat_memory.ids.tolist() == [chat_out.id]
+    with DBSessionManager().get_session() as db:
+        chat = db.query(Chat).filter(Chat.id == chat_out.id).one()
+        np.testing.assert_allclose(chat.vector, [26.0, 1.0, 0.0], rtol=1e-3)
+
+
+def test_failed_deferred_embedding_leaves_chat_unembedded(user_instance, therapist_instance, mocker: MockerFixture):
+    mocker.patch("logic.embedding_worker.get_embeddings", side_effect=RuntimeError("API down"))
+    session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+
+    chat_out = session.add_chat_message("therapist", "Hello again", defer_embedding=True)
+    embedding_worker.join()
+
+    with DBSessionManager().get_session() as db:
+        assert db.query(Chat).filter(Chat.id == chat_out.id).one().vector is None
+    # The worker keeps running after a failure
+    mocker.patch("logic.embedding_worker.get_embeddings", side_effect=fake_embeddings)
+    session.add_chat_message("therapist", "Hello once more", defer_embedding=True)
+    embedding_worker.join()
+    assert len(session.chat_memory) == 1
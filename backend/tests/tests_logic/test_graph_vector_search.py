@@ -0,0 +1,52 @@
+"""Tests for similarity search over graph nodes and edges."""
+import numpy as np
+from logic.graph_vector_search import build_graph_vector_index, find_similar
+from models import Edge, Node
+
+
+def test_find_similar_nodes(shared_session, user_instance):
+    labels_and_vectors = {
+        "Alice": np.array([1.0, 0.0, 0.0]),
+        "London": np.array([0.0, 1.0, 0.0]),
+        "Paris": np.array([0.0, 0.9, 0.1]),
+    }
+    for label, vector in labels_and_vectors.items():
+        node = Node(label, user_id=user_instance.id, node_type="place")
+        node.vector = vector
+        shared_session.add(node)
+    # Nodes without vectors are skipped
+    shared_session.add(Node("Unvectorised", user_id=user_instance.id, node_type="place"))
+    shared_session.commit()
+
+    index = build_graph_vector_index(shared_session, Node, user_instance.id)
+    assert len(index) == 3
+
+    results = find_similar(shared_session, Node, user_instance.id, np.array([0.0, 1.0, 0.0]), k=2)
+    assert [node.label for node, _ in results] == ["London", "Paris"]
+    assert results[0][1] > results[1][1]
+
+
+def test_find_similar_edges_with_prebuilt_index(shared_session, user_instance):
+    first_node = Node("Alice", user_id=user_instance.id, node_type="person")
+    second_node = Node("London", user_id=user_instance.id, node_type="place")
+    shared_session.add_all([first_node, second_node])
+    shared_session.flush()
+    edge = Edge(
+        user_id=user_instance.id,
+        from_node_id=first_node.id,
+        to_node_id=second_node.id,
+        type="lives in",
+        description="Alice lives in London",
+    )
+    edge.vector = np.array([0.5, 0.5])
+    shared_session.add(edge)
+    shared_session.commit()
+
+    index = build_graph_vector_index(shared_session, Edge, user_instance.id, index_type="ivf")
+    results = find_similar(shared_session, Edge, user_instance.id, np.array([1.0, 1.0]), min_score=0.9, index=index)
+    assert len(results) == 1
+    assert results[0][0].type == "lives in"
+
+
+def test_find_similar_with_no_vectors(shared_session, user_instance):
+    assert find_similar(shared_session, Node, user_instance.id, np.array([1.0, 0.0])) == []
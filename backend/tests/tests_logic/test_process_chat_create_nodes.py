@@ -1,11 +1,13 @@
 """Test creating chat references."""
 
 import pytest
+from llm.errors import LLMUnavailableError
 from logic.process_chat_create_nodes import (
     process_text_and_create_references,  # Replace 'your_module' with the actual module name
 )
 from models.chat_reference import ChatReference
 from models.graph.node import Node
+from spacy.lang.en import English
 
 
 def test_process_text_and_create_references_basic(test_nlp, user_instance, chat_instance, shared_session, mocker):
@@ -126,3 +128,28 @@ def test_process_text_and_create_references_error_handling(
     # Check that no nodes or chat references were created due to the rollback
     assert shared_session.query(Node).count() == 0
     assert shared_session.query(ChatReference).count() == 0
+
+
+def test_process_text_and_create_references_stream_error(user_instance, chat_instance, shared_session, mocker):
+    """Test the nodes streamed before an extraction error are saved."""
+
+    def failing_stream(_doc):
+        yield {"label": "Alice", "spans": [[0]]}
+        msg = "Connection dropped"
+        raise LLMUnavailableError(msg)
+
+    mocker.patch("logic.process_chat_create_nodes.STREAM_GRAPH_EXTRACTION", new=True)
+    mocker.patch("logic.process_chat_create_nodes.stream_nodes", side_effect=failing_stream)
+
+    result = process_text_and_create_references(
+        text="Alice went to London.",
+        chat_id=chat_instance.id,
+        user_id=user_instance.id,
+        db=shared_session,
+        nlp=English(),
+    )
+
+    assert len(result) == 1
+    shared_session.rollback()
+    assert [node.label for node in shared_session.query(Node).all()] == ["Alice"]
+    assert shared_session.query(ChatReference).count() == 1
@@ -0,0 +1,141 @@
+"""Tests for the rolling session summaries."""
+from llm.errors import LLMUnavailableError
+from logic.session_summary import (
+    SessionSummariser,
+    SessionSummary,
+    SessionSummaryStore,
+    build_session_history,
+    recent_window_start,
+    session_summary_store,
+)
+from models import Chat, TherapySession
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+
+def add_chats(session: Session, therapy_session: TherapySession, n_chats: int) -> list[Chat]:
+    """Add alternating user and therapist chats to the therapy session."""
+    chats = []
+    for i in range(n_chats):
+        chat = Chat(
+            user=therapy_session.user,
+            therapist=therapy_session.therapist,
+            therapy_session=therapy_session,
+            sender="user" if i % 2 == 0 else "therapist",
+        )
+        chat.text = f"Message number {i}"
+        session.add(chat)
+        chats.append(chat)
+    session.commit()
+    return chats
+
+
+def test_recent_window_start():
+    """Test the recent window is limited by both message count and token budget."""
+    assert recent_window_start([], max_messages=4, token_budget=100) == 0
+    assert recent_window_start([10] * 6, max_messages=4, token_budget=100) == 2
+    assert recent_window_start([10] * 6, max_messages=10, token_budget=25) == 4
+    # The last message is kept even if it alone is over the budget
+    assert recent_window_start([10, 500], max_messages=4, token_budget=100) == 1
+
+
+def test_store_keeps_latest_summary():
+    """Test a summary is never replaced by one covering fewer messages."""
+    store = SessionSummaryStore(max_entries=2)
+    store.put(1, SessionSummary("later", 10))
+    store.put(1, SessionSummary("earlier", 5))
+    assert store.get(1).text == "later"
+    store.put(2, SessionSummary("second", 1))
+    store.put(3, SessionSummary("third", 1))
+    assert len(store) == 2
+    assert store.get(1) is None
+
+
+def test_summarise_folds_older_messages(
+    mocker: MockerFixture, shared_session: Session, therapy_session_instance: TherapySession
+):
+    """Test older messages are folded into the summary and left out of the history."""
+    mocker.patch("logic.session_summary.recent_window_start", side_effect=lambda counts, **_: max(len(counts) - 2, 0))
+    api_request = mocker.patch("logic.session_summary.api_request", return_value="The user counted to three.")
+    chats = add_chats(shared_session, therapy_session_instance, 5)
+
+    summary = SessionSummariser().summarise(therapy_session_instance.id)
+    assert summary == SessionSummary("The user counted to three.", chats[2].id)
+    assert "Message number 2" in api_request.call_args.kwargs["messages"][1]["content"]
+    assert "Message number 3" not in api_request.call_args.kwargs["messages"][1]["content"]
+    assert session_summary_store.get(therapy_session_instance.id) == summary
+
+    history = build_session_history(shared_session, therapy_session_instance.id)
+    assert "The user counted to three." in history
+    assert "Message number 4" in history
+    assert "Message number 1" not in history
+    # Nothing more to fold until new messages arrive
+    assert SessionSummariser().summarise(therapy_session_instance.id) is None
+    api_request.assert_called_once()
+
+
+def test_summary_is_persisted(
+    mocker: MockerFixture, shared_session: Session, therapy_session_instance: TherapySession
+):
+    """Test a summary is saved on the session row and loaded from it once the store forgets it."""
+    mocker.patch("logic.session_summary.recent_window_start", side_effect=lambda counts, **_: max(len(counts) - 2, 0))
+    mocker.patch("logic.session_summary.api_request", return_value="The user counted to three.")
+    add_chats(shared_session, therapy_session_instance, 5)
+    SessionSummariser().summarise(therapy_session_instance.id)
+
+    session_summary_store.clear()
+    shared_session.refresh(therapy_session_instance)
+    assert therapy_session_instance.summary == "The user counted to three."
+    assert "The user counted to three." in build_session_history(shared_session, therapy_session_instance.id)
+
+
+def test_summary_length_is_capped(
+    mocker: MockerFixture, shared_session: Session, therapy_session_instance: TherapySession
+):
+    """Test a long completion is cut down to the summary token limit."""
+    mocker.patch("logic.session_summary.recent_window_start", side_effect=lambda counts, **_: max(len(counts) - 2, 0))
+    mocker.patch("logic.session_summary.SESSION_SUMMARY_MAX_TOKENS", 5)
+    mocker.patch("logic.session_summary.api_request", return_value="word " * 100)
+    add_chats(shared_session, therapy_session_instance, 5)
+    summary = SessionSummariser().summarise(therapy_session_instance.id)
+    assert 0 < len(summary.text) < len("word " * 20)
+
+
+def test_history_keeps_unsummarised_messages_within_budget(
+    mocker: MockerFixture, shared_session: Session, therapy_session_instance: TherapySession
+):
+    """Test messages out of the recent window are kept until summarised while they fit the token budget."""
+    mocker.patch(
+        "logic.session_summary.recent_window_start",
+        side_effect=lambda counts, max_messages=2: recent_window_start(counts, max_messages=max_messages),
+    )
+    api_request = mocker.patch("logic.session_summary.api_request")
+    add_chats(shared_session, therapy_session_instance, 5)
+    history = build_session_history(shared_session, therapy_session_instance.id)
+    assert all(f"Message number {i}" in history for i in range(5))
+    api_request.assert_not_called()
+
+
+def test_history_folds_messages_over_budget(
+    mocker: MockerFixture, shared_session: Session, therapy_session_instance: TherapySession
+):
+    """Test messages that would drop out of the history are folded into the summary before the turn."""
+    mocker.patch("logic.session_summary.recent_window_start", side_effect=lambda counts, **_: max(len(counts) - 2, 0))
+    api_request = mocker.patch("logic.session_summary.api_request", return_value="The user counted to two.")
+    chats = add_chats(shared_session, therapy_session_instance, 5)
+    history = build_session_history(shared_session, therapy_session_instance.id)
+    assert "The user counted to two." in history
+    assert "Message number 3" in history
+    assert "Message number 2" not in history
+    assert session_summary_store.get(therapy_session_instance.id).through_chat_id == chats[2].id
+    api_request.assert_called_once()
+
+    # A failed fold leaves the summary as it was and still bounds the history
+    session_summary_store.clear()
+    shared_session.refresh(therapy_session_instance)
+    therapy_session_instance.summary_through_chat_id = None
+    shared_session.commit()
+    api_request.side_effect = LLMUnavailableError("down")
+    history = build_session_history(shared_session, therapy_session_instance.id)
+    assert "Message number 4" in history
+    assert "Message number 2" not in history
@@ -0,0 +1,73 @@
+"""Tests for the system prompt cache."""
+from unittest.mock import MagicMock
+
+from logic.system_prompt_cache import SystemPromptCache, system_prompt_cache
+from logic.therapy_session_logic import TherapySessionLogic
+from models import Therapist, User
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+
+def test_prompts_are_built_once():
+    """Test a cached prompt is reused until its user changes."""
+    cache = SystemPromptCache()
+    builder = MagicMock(return_value="You are a therapist")
+    assert cache.get_or_build((1, 2), builder) == "You are a therapist"
+    assert cache.get_or_build((1, 2), builder) == "You are a therapist"
+    builder.assert_called_once()
+    cache.bump_user(1)
+    cache.get_or_build((1, 2), builder)
+    assert builder.call_count == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_other_users_are_not_invalidated():
+    """Test changing a therapist only invalidates their own prompts."""
+    cache = SystemPromptCache()
+    cache.get_or_build((1, 2), lambda: "first")
+    cache.get_or_build((3, 4), lambda: "second")
+    cache.bump_therapist(2)
+    assert cache.get((1, 2)) is None
+    assert cache.get((3, 4)) == "second"
+
+
+def test_update_during_build_is_not_cached():
+    """Test a prompt built from a row that changed while building is rebuilt next time."""
+    cache = SystemPromptCache()
+
+    def builder() -> str:
+        cache.bump_user(1)
+        return "stale"
+
+    cache.get_or_build((1, 2), builder)
+    assert cache.get((1, 2)) is None
+
+
+def test_expired_and_evicted_prompts(mocker: MockerFixture):
+    """Test prompts are dropped after the TTL and beyond the size limit."""
+    monotonic = mocker.patch("logic.system_prompt_cache.time.monotonic", return_value=0.0)
+    cache = SystemPromptCache(max_entries=2, ttl_seconds=10)
+    for key in [(1, 1), (2, 2), (3, 3)]:
+        cache.get_or_build(key, lambda: "prompt")
+    assert len(cache) == 2
+    assert cache.get((1, 1)) is None
+    monotonic.return_value = 11.0
+    assert cache.get((3, 3)) is None
+
+
+def test_session_startup_reuses_prompt(
+    mocker: MockerFixture, shared_session: Session, user_instance: User, therapist_instance: Therapist
+):
+    """Test new sessions reuse the prompt until the user row is updated."""
+    build_system_prompt = mocker.spy(TherapySessionLogic, "build_system_prompt")
+    TherapySessionLogic(user_instance.id, therapist_instance.id)
+    second = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    assert build_system_prompt.call_count == 1
+    assert "Test User" in second.system_prompt
+
+    user_instance.first_name = "Renamed"
+    shared_session.commit()
+    third = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    assert build_system_prompt.call_count == 2
+    assert "Renamed User" in third.system_prompt
+    assert system_prompt_cache.hits >= 1
@@ -104,3 +104,39 @@ def test_get_relevant_past_chats(therapy_session_instance_with_chat: TherapySess
     assert len(relevant_chat_ids) == 1
     assert relevant_chat_ids[0][0] == 1
     assert math.isclose(relevant_chat_ids[0][1], 1.0, rel_tol=1e-4)
+    # A chat exactly at the threshold is not relevant
+    threshold = relevant_chat_ids[0][1]
+    assert therapy_session_instance_with_chat.get_relevant_past_chat_ids(query_vector, threshold=threshold) == []
+
+
+def test_add_chat_message_appends_to_loaded_memory(therapy_session_instance_with_chat: TherapySessionLogic) -> None:
+    """Test new chats are appended to the loaded chat memory without reloading."""
+    therapy_session_instance_with_chat.load_all_session_previous_chats()
+    chat_out = therapy_session_instance_with_chat.add_chat_message("user", "Another message")
+    assert therapy_session_instance_with_chat.chat_vectors.shape == (2, 300)
+    assert therapy_session_instance_with_chat.chat_memory.ids[-1] == chat_out.id
+
+
+@pytest.mark.asyncio()
+async def test_async_stream_response(
+    mocker: MockerFixture, therapy_session_instance: TherapySessionLogic, db_session_manager: DBSessionManager
+) -> None:
+    """Test streaming a response forwards each delta and saves the full reply."""
+
+    async def stream_chat_completion(*args, **kwargs):
+        for delta in ["Hello", ", ", "user!"]:
+            yield delta
+
+    mocker.patch("logic.therapy_session_logic.async_stream_chat_completion", stream_chat_completion)
+    received = []
+
+    async def on_delta(delta: str) -> None:
+        received.append(delta)
+
+    chat_list_out = await therapy_session_instance.async_stream_response("Hello, therapist!", on_delta)
+    assert received == ["Hello", ", ", "user!"]
+    chat_out = chat_list_out.messages[0]
+    with db_session_manager.get_session() as session:
+        chat = session.query(Chat).filter(Chat.id == chat_out.id).first()
+        assert chat.sender == "therapist"
+        assert chat.text == "Hello, user!"
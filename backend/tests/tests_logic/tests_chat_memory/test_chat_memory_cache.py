@@ -0,0 +1,100 @@
+"""Tests for the process-wide chat memory cache."""
+import numpy as np
+from logic.chat_memory import ChatMemoryCache, ChatMemoryStore
+from logic.therapy_session_logic import TherapySessionLogic
+from pytest_mock import MockerFixture
+
+
+def make_store(n_rows: int, dim: int = 4) -> ChatMemoryStore:
+    store = ChatMemoryStore(dim=dim, initial_capacity=n_rows)
+    store.extend(range(n_rows), np.ones((n_rows, dim)))
+    return store
+
+
+def test_get_or_load_only_loads_once():
+    cache = ChatMemoryCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return make_store(2)
+
+    first = cache.get_or_load((1, 1), loader)
+    second = cache.get_or_load((1, 1), loader)
+    assert first is second
+    assert len(calls) == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_evicts_least_recently_used_over_budget():
+    store_bytes = make_store(10).nbytes
+    cache = ChatMemoryCache(max_bytes=2 * store_bytes)
+    cache.put((1, 1), make_store(10))
+    cache.put((2, 1), make_store(10))
+    # Touch the first store so the second is least recently used
+    cache.get((1, 1))
+    cache.put((3, 1), make_store(10))
+    assert (1, 1) in cache
+    assert (2, 1) not in cache
+    assert (3, 1) in cache
+    assert cache.evictions == 1
+    assert cache.total_bytes == 2 * store_bytes
+
+
+def test_keeps_most_recent_store_over_budget():
+    cache = ChatMemoryCache(max_bytes=1)
+    cache.put((1, 1), make_store(10))
+    assert (1, 1) in cache
+
+
+def test_add_chat_updates_cached_store_in_place():
+    cache = ChatMemoryCache()
+    store = make_store(2)
+    cache.put((1, 1), store)
+    assert cache.add_chat((1, 1), 99, np.ones(4))
+    assert 99 in store
+    # Uncached stores are left to be loaded later
+    assert not cache.add_chat((2, 1), 100, np.ones(4))
+    assert (2, 1) not in cache
+
+
+def test_add_chat_during_load_is_applied():
+    cache = ChatMemoryCache()
+
+    def loader():
+        store = make_store(2)
+        # Another session saves a chat after the loader has read the chat rows
+        cache.add_chat((1, 1), 99, np.ones(4))
+        cache.add_chat((1, 1), 1, np.ones(4))
+        return store
+
+    store = cache.get_or_load((1, 1), loader)
+    assert store.ids.tolist() == [0, 1, 99]
+    assert cache.total_bytes == store.nbytes
+
+
+def test_add_chat_tracks_growth():
+    cache = ChatMemoryCache()
+    store = make_store(2)
+    cache.put((1, 1), store)
+    before = cache.total_bytes
+    cache.add_chat((1, 1), 99, np.ones(4))
+    assert cache.total_bytes > before
+    assert cache.total_bytes == store.nbytes
+
+
+def test_sessions_share_warm_memory(user_instance, therapist_instance, mocker: MockerFixture):
+    mocker.patch("models.chat.get_embedding", return_value=np.array([0.1, 0.2, 0.3]))
+    first_session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    first_session.add_chat_message("user", "Hello there, therapist!")
+    assert first_session.chat_vectors is None
+    first_session.cosine_similarity_search(np.array([0.1, 0.2, 0.3]))
+
+    # A second session for the same user reuses the memory without going back to the database
+    second_session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    build_chat_memory = mocker.spy(second_session, "build_chat_memory")
+    second_session.add_chat_message("user", "Hello again!")
+    assert len(second_session.get_relevant_past_chat_ids(np.array([0.1, 0.2, 0.3]))) == 2
+    build_chat_memory.assert_not_called()
+    assert first_session.chat_memory is second_session.chat_memory
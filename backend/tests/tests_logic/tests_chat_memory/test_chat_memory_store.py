@@ -0,0 +1,120 @@
+"""Tests for the chat memory store."""
+import numpy as np
+import pytest
+from logic.chat_memory import MISSING_ID, ChatMemoryStore
+
+
+def test_add_normalises_and_aligns_ids():
+    store = ChatMemoryStore()
+    assert store.add(7, np.array([3.0, 4.0]))
+    assert len(store) == 1
+    assert store.dim == 2
+    assert store.vectors.dtype == np.float32
+    np.testing.assert_allclose(store.vectors[0], [0.6, 0.8])
+    np.testing.assert_allclose(store.norms, [5.0])
+    assert store.ids.tolist() == [7]
+    assert 7 in store
+
+
+def test_add_skips_missing_and_duplicate_vectors():
+    store = ChatMemoryStore()
+    assert not store.add(1, None)
+    assert store.add(1, np.array([1.0, 0.0]))
+    assert not store.add(1, np.array([0.0, 1.0]))
+    assert len(store) == 1
+
+
+def test_buffer_doubles_when_full():
+    store = ChatMemoryStore(dim=3, initial_capacity=2)
+    rng = np.random.default_rng(0)
+    vectors = rng.random((5, 3))
+    for chat_id, vector in enumerate(vectors):
+        store.add(chat_id, vector)
+    assert len(store) == 5
+    assert store.capacity == 8
+    assert store.ids.tolist() == [0, 1, 2, 3, 4]
+    expected = vectors / np.linalg.norm(vectors, axis=1)[:, None]
+    np.testing.assert_allclose(store.vectors, expected, rtol=1e-6)
+
+
+def test_extend_rejects_mismatched_dimension():
+    store = ChatMemoryStore(dim=3)
+    with pytest.raises(ValueError, match="dimension"):
+        store.extend([1], np.ones((1, 4)))
+
+
+def test_extend_rejects_mismatched_ids():
+    store = ChatMemoryStore()
+    with pytest.raises(ValueError, match="chat ids"):
+        store.extend([1, 2], np.ones((1, 4)))
+
+
+def test_similarities_match_cosine():
+    store = ChatMemoryStore()
+    rng = np.random.default_rng(1)
+    vectors = rng.random((10, 4))
+    store.extend(range(10), vectors)
+    query = rng.random(4)
+    expected = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    np.testing.assert_allclose(store.similarities(query), expected, rtol=1e-5)
+
+
+def test_zero_vectors_score_zero():
+    store = ChatMemoryStore()
+    store.extend([1, 2], np.array([[0.0, 0.0], [1.0, 1.0]]))
+    scores = store.similarities(np.array([1.0, 1.0]))
+    assert scores[0] == 0
+    assert scores[1] == pytest.approx(1.0)
+
+
+def test_similarities_on_empty_store():
+    store = ChatMemoryStore()
+    assert len(store.similarities(np.ones(3))) == 0
+
+
+def test_clear_keeps_buffers():
+    store = ChatMemoryStore()
+    store.extend([1, 2], np.ones((2, 3)))
+    capacity = store.capacity
+    store.clear()
+    assert len(store) == 0
+    assert 1 not in store
+    assert store.capacity == capacity
+
+
+def test_top_k_returns_best_first():
+    store = ChatMemoryStore()
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(50, 8))
+    store.extend(range(100, 150), vectors)
+    query = rng.normal(size=8)
+    chat_ids, scores = store.top_k(query, k=5)
+    expected = np.argsort(-store.similarities(query))[:5] + 100
+    assert chat_ids.dtype == np.int64
+    assert chat_ids.tolist() == expected.tolist()
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_top_k_applies_min_score():
+    store = ChatMemoryStore()
+    store.extend([1, 2, 3], np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]))
+    chat_ids, scores = store.top_k(np.array([1.0, 0.0]), k=3, min_score=0.5)
+    assert chat_ids.tolist() == [1, 3]
+    np.testing.assert_allclose(scores, [1.0, np.sqrt(0.5)], rtol=1e-6)
+
+
+def test_top_k_batch_pads_missing_results():
+    store = ChatMemoryStore()
+    store.extend([1, 2, 3], np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]))
+    queries = np.array([[1.0, 0.0], [0.0, 1.0]])
+    chat_ids, scores = store.top_k(queries, k=2, min_score=0.9)
+    assert chat_ids.shape == (2, 2)
+    assert chat_ids.tolist() == [[1, MISSING_ID], [2, MISSING_ID]]
+    assert np.isneginf(scores[:, 1]).all()
+
+
+def test_top_k_on_empty_store():
+    store = ChatMemoryStore()
+    chat_ids, scores = store.top_k(np.ones(3), k=5)
+    assert len(chat_ids) == 0
+    assert len(scores) == 0
@@ -0,0 +1,125 @@
+"""Tests for the on-disk embedding shards."""
+import numpy as np
+import pytest
+from logic.chat_memory import ChatMemoryStore, EmbeddingShard
+from logic.therapy_session_logic import TherapySessionLogic
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture()
+def store() -> ChatMemoryStore:
+    store = ChatMemoryStore()
+    store.extend([1, 2, 3], np.random.default_rng(0).random((3, 4)))
+    return store
+
+
+def test_write_and_open_round_trip(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    assert not shard.exists()
+    shard.write(store)
+    assert shard.exists()
+    assert len(shard) == 3
+
+    mapped = shard.open_store()
+    assert isinstance(mapped.vectors, np.memmap)
+    assert mapped.nbytes == 0
+    assert mapped.ids.tolist() == [1, 2, 3]
+    np.testing.assert_allclose(mapped.vectors, store.vectors)
+    np.testing.assert_allclose(mapped.norms, store.norms)
+
+
+def test_append_is_visible_on_next_open(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    shard.append([4], np.array([0.0, 3.0, 0.0, 4.0]))
+    mapped = shard.open_store()
+    assert mapped.ids.tolist() == [1, 2, 3, 4]
+    np.testing.assert_allclose(mapped.vectors[-1], [0.0, 0.6, 0.0, 0.8])
+
+
+def test_append_rejects_mismatched_dimension(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    with pytest.raises(ValueError, match="dimension"):
+        shard.append([4], np.ones(5))
+
+
+def test_append_drops_uncommitted_rows(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    # Simulate a crash after writing a vector row but before its index record
+    with shard.vectors_path.open("ab") as vectors_file:
+        vectors_file.write(np.ones(4, dtype=np.float32).tobytes())
+    shard.append([4], np.ones(4))
+    assert shard.vectors_path.stat().st_size == 4 * 4 * 4
+    assert shard.open_store().ids.tolist() == [1, 2, 3, 4]
+
+
+def test_append_skips_chats_already_in_shard(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    # Chat 3 was already written by a rebuild from the chat rows
+    shard.append([3, 4], np.ones((2, 4)))
+    assert shard.open_store().ids.tolist() == [1, 2, 3, 4]
+    shard.append([4], np.ones(4))
+    assert len(shard) == 4
+
+
+def test_append_after_delete_is_skipped(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    shard.delete()
+    shard.append([4], np.ones(4))
+    assert not shard.exists()
+    # The lock file is kept so workers waiting on it still exclude each other
+    assert shard.lock_path.exists()
+
+
+def test_mapped_store_copies_on_first_add(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    mapped = shard.open_store()
+    mapped.add(4, np.ones(4))
+    assert not isinstance(mapped.vectors, np.memmap)
+    assert mapped.ids.tolist() == [1, 2, 3, 4]
+    # The shard itself is left untouched
+    assert len(shard) == 3
+
+
+def test_session_logic_uses_shards(tmp_path, user_instance, therapist_instance, mocker: MockerFixture):
+    mocker.patch("logic.therapy_session_logic.EMBEDDING_SHARD_DIR", tmp_path)
+    mocker.patch("models.chat.get_embedding", return_value=np.array([0.1, 0.2, 0.3]))
+    session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    session.add_chat_message("user", "Hello there, therapist!")
+    # The first load builds the shard from the database
+    session.cosine_similarity_search(np.array([0.1, 0.2, 0.3]))
+    shard = session.embedding_shard
+    assert len(shard) == 1
+    # New chats are appended to the shard as well as the warm memory
+    session.add_chat_message("user", "Hello again!")
+    assert len(shard) == 2
+    assert len(session.chat_memory) == 2
+
+
+def test_shard_from_another_model_is_stale(tmp_path, store):
+    shard = EmbeddingShard(tmp_path, 1, 1, "model-a")
+    shard.write(store)
+    assert not shard.is_stale(dim=4)
+    assert shard.is_stale(dim=5)
+    assert EmbeddingShard(tmp_path, 1, 1, "model-b").is_stale()
+
+
+def test_session_logic_rebuilds_stale_shard(tmp_path, user_instance, therapist_instance, mocker: MockerFixture):
+    mocker.patch("logic.therapy_session_logic.EMBEDDING_SHARD_DIR", tmp_path)
+    mocker.patch("models.chat.get_embedding", return_value=np.array([0.1, 0.2, 0.3]))
+    session = TherapySessionLogic(user_instance.id, therapist_instance.id)
+    stale_shard = EmbeddingShard(tmp_path, user_instance.id, therapist_instance.id, "old-model")
+    stale_shard.write(ChatMemoryStore.from_arrays(np.array([99]), np.ones((1, 5), dtype=np.float32), np.ones(1)))
+    # Appending a vector of the new model drops the stale shard rather than failing
+    session.add_chat_message("user", "Hello there, therapist!")
+    assert not stale_shard.exists()
+    # The next load rebuilds it from the chat rows
+    session.cosine_similarity_search(np.array([0.1, 0.2, 0.3]))
+    assert session.embedding_shard.exists()
+    assert not session.embedding_shard.is_stale(dim=3)
+    assert session.embedding_shard.open_store().ids.tolist() != [99]
@@ -0,0 +1,109 @@
+"""Tests for the IVF approximate nearest neighbour index."""
+import numpy as np
+import pytest
+from logic.chat_memory import ChatMemoryStore, IVFVectorIndex, VectorIndex, create_vector_index
+
+
+def clustered_vectors(n_clusters: int = 8, per_cluster: int = 40, dim: int = 16, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dim))
+    return np.vstack([centre + 0.05 * rng.normal(size=(per_cluster, dim)) for centre in centres])
+
+
+@pytest.fixture()
+def vectors() -> np.ndarray:
+    return clustered_vectors()
+
+
+def test_untrained_index_is_exact():
+    index = IVFVectorIndex(n_lists=4)
+    index.extend(range(5), np.eye(5))
+    assert not index.is_trained
+    chat_ids, scores = index.top_k(np.eye(5)[2], k=1)
+    assert chat_ids.tolist() == [2]
+    assert scores[0] == pytest.approx(1.0)
+
+
+def test_trains_once_threshold_is_reached(vectors):
+    index = IVFVectorIndex(n_lists=8)
+    index.extend(range(len(vectors)), vectors)
+    assert index.is_trained
+    assert sum(len(rows) for rows in index._lists) == len(vectors)
+
+
+def test_full_probe_matches_exact_search(vectors):
+    exact = ChatMemoryStore()
+    exact.extend(range(len(vectors)), vectors)
+    index = IVFVectorIndex(n_lists=8, n_probe=8)
+    index.extend(range(len(vectors)), vectors)
+    queries = clustered_vectors(seed=1)[:10]
+    ivf_ids, ivf_scores = index.top_k(queries, k=5)
+    exact_ids, exact_scores = exact.top_k(queries, k=5)
+    assert ivf_ids.tolist() == exact_ids.tolist()
+    np.testing.assert_allclose(ivf_scores, exact_scores, rtol=1e-6)
+
+
+def test_low_probe_has_high_recall_on_clustered_data(vectors):
+    exact = ChatMemoryStore()
+    exact.extend(range(len(vectors)), vectors)
+    index = IVFVectorIndex(n_lists=8, n_probe=2)
+    index.extend(range(len(vectors)), vectors)
+    queries = vectors[::7]
+    ivf_ids, _ = index.top_k(queries, k=5)
+    exact_ids, _ = exact.top_k(queries, k=5)
+    recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(ivf_ids.tolist(), exact_ids.tolist())])
+    assert recall > 0.9
+
+
+def test_incremental_insert_after_training(vectors):
+    index = IVFVectorIndex(n_lists=8, n_probe=8)
+    index.extend(range(len(vectors)), vectors)
+    new_vector = vectors[0] + 0.001
+    assert index.add(10_000, new_vector)
+    assert not index.add(10_000, new_vector)
+    chat_ids, _ = index.top_k(new_vector, k=1)
+    assert chat_ids.tolist() == [10_000]
+
+
+def test_min_score_filters_single_query(vectors):
+    index = IVFVectorIndex(n_lists=8, n_probe=1)
+    index.extend(range(len(vectors)), vectors)
+    _, scores = index.top_k(vectors[0], k=50, min_score=0.99)
+    assert len(scores) > 0
+    assert np.all(scores >= 0.99)
+
+
+def test_save_and_load(tmp_path, vectors):
+    index = IVFVectorIndex(n_lists=8, n_probe=3)
+    index.extend(range(len(vectors)), vectors)
+    path = tmp_path / "index.npz"
+    index.save(path)
+    loaded = IVFVectorIndex.load(path)
+    assert loaded.is_trained
+    assert loaded.n_probe == 3
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    queries = vectors[:5]
+    assert loaded.top_k(queries, k=3)[0].tolist() == index.top_k(queries, k=3)[0].tolist()
+    # The loaded index accepts new vectors
+    assert loaded.add(10_000, vectors[0])
+
+
+def test_exact_store_save_and_load(tmp_path, vectors):
+    store = ChatMemoryStore()
+    store.extend(range(len(vectors)), vectors)
+    path = tmp_path / "store.npz"
+    store.save(path)
+    loaded = ChatMemoryStore.load(path)
+    assert loaded.ids.tolist() == store.ids.tolist()
+    np.testing.assert_array_equal(loaded.vectors, store.vectors)
+
+
+def test_create_vector_index():
+    store = ChatMemoryStore()
+    assert create_vector_index(store, index_type="exact") is store
+    index = create_vector_index(store, index_type="ivf")
+    assert isinstance(index, IVFVectorIndex)
+    assert isinstance(index, VectorIndex)
+    assert index.store is store
+    with pytest.raises(ValueError, match="Unknown vector index type"):
+        create_vector_index(store, index_type="hnsw")
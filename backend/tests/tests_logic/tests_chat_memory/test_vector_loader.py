@@ -0,0 +1,41 @@
+"""Tests for streamed loading of stored embeddings."""
+import numpy as np
+from logic.chat_memory import load_vector_store
+from models import Chat, ChatEmbedding
+from sqlalchemy import select
+
+
+def add_chats(session, user, therapist, therapy_session, vectors):
+    chats = []
+    for vector in vectors:
+        chat = Chat(user=user, therapist=therapist, sender="user", therapy_session=therapy_session)
+        session.add(chat)
+        chat.text = "Hello"
+        chat.vector = vector
+        chats.append(chat)
+    session.commit()
+    return chats
+
+
+def test_load_vector_store_streams_batches(
+    shared_session, user_instance, therapist_instance, therapy_session_instance
+):
+    vectors = np.random.default_rng(0).random((25, 8))
+    chats = add_chats(shared_session, user_instance, therapist_instance, therapy_session_instance, vectors)
+    # Empty vectors are skipped
+    shared_session.add(ChatEmbedding(chat_id=chats[0].id, model_name="other-model", _vector=b""))
+    shared_session.commit()
+
+    statement = select(ChatEmbedding.chat_id, ChatEmbedding._vector).order_by(ChatEmbedding.chat_id)
+    store = load_vector_store(shared_session, statement, batch_size=4)
+
+    assert store.ids.tolist() == [chat.id for chat in chats]
+    # The buffers are sized from the row count, so loading never regrows them
+    assert store.capacity == 26
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.vectors, expected, atol=1e-3)
+
+
+def test_load_vector_store_with_no_rows(shared_session):
+    store = load_vector_store(shared_session, select(ChatEmbedding.chat_id, ChatEmbedding._vector))
+    assert len(store) == 0
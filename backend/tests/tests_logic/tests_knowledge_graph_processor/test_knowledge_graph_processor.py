@@ -1,7 +1,9 @@
 """Tests for the knowledge graph processor."""
 
 import pytest
+from logic.knowledge_graph_processor import KnowledgeGraphProcessor
 from models import Edge, Node
+from spacy.lang.en import English
 from sqlalchemy import select
 
 # Mock data for get_nodes
@@ -20,7 +22,7 @@ def mock_get_nodes(doc):
 mock_edges = [{"label": "lives in", "source": 1, "spans": [[1, 2]], "target": 2}]
 
 
-def mock_get_edges(doc, nodes):
+async def mock_async_get_edges(doc, nodes):
     return mock_edges
 
 
@@ -50,8 +52,10 @@ async def test_create_or_update_nodes_async(async_knowledge_graph_processor, asy
 async def test_create_edges_async(
     async_knowledge_graph_processor, async_user_instance, async_chat_instance, async_shared_session, monkeypatch
 ):
-    # Monkey patch get_edges
-    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.get_edges", mock_get_edges)
+    # Monkey patch async_get_edges
+    monkeypatch.setattr(
+        "logic.knowledge_graph_processor.knowledge_graph_processor.async_get_edges", mock_async_get_edges
+    )
     nodes = [
         Node(label="Emily", user_id=async_user_instance.id, node_type="person"),
         Node(label="London", user_id=async_user_instance.id, node_type="place"),
@@ -73,21 +77,25 @@ async def test_process_chat_async(
     async_chat_instance.text = "Bob works at Microsoft in Seattle"
     await async_shared_session.commit()
 
-    def mock_get_nodes(doc):
+    async def mock_async_get_nodes(doc):
         return [
             {"label": "Bob", "spans": [[0]], "type": "person"},
             {"label": "Microsoft", "spans": [[3]], "type": "organisation"},
             {"label": "Seattle", "spans": [[5]], "type": "place"},
         ]
 
-    def mock_get_edges(doc, nodes):
+    async def mock_async_get_edges(doc, nodes):
         return [
             {"label": "works at", "source": 1, "spans": [[1, 2]], "target": 2},
             {"label": "in", "source": 1, "spans": [[4]], "target": 3},
         ]
 
-    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.get_nodes", mock_get_nodes)
-    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.get_edges", mock_get_edges)
+    monkeypatch.setattr(
+        "logic.knowledge_graph_processor.knowledge_graph_processor.async_get_nodes", mock_async_get_nodes
+    )
+    monkeypatch.setattr(
+        "logic.knowledge_graph_processor.knowledge_graph_processor.async_get_edges", mock_async_get_edges
+    )
 
     await async_knowledge_graph_processor.process_chat(async_chat_instance)
 
@@ -105,3 +113,62 @@ async def test_process_chat_async(
     result = await async_knowledge_graph_processor.db.execute(statement)
     edges = result.scalars().all()
     assert len(edges) == 2  # 'works at' and 'in'
+
+
+@pytest.mark.asyncio()
+async def test_process_chat_combined_async(async_chat_instance, async_shared_session, monkeypatch):
+    async_chat_instance.text = "Bob works at Microsoft"
+    await async_shared_session.commit()
+
+    async def mock_async_get_graph(doc):
+        return (
+            [
+                {"id": 1, "label": "Bob", "spans": [[0]], "type": "person"},
+                {"id": 2, "label": "Microsoft", "spans": [[3]], "type": "organisation"},
+            ],
+            [{"label": "works at", "source": 1, "spans": [[1, 2]], "target": 2}],
+        )
+
+    def fail(*args):
+        raise AssertionError
+
+    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.GRAPH_EXTRACTION_MODE", "combined")
+    monkeypatch.setattr(
+        "logic.knowledge_graph_processor.knowledge_graph_processor.async_get_graph", mock_async_get_graph
+    )
+    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.async_get_nodes", fail)
+    monkeypatch.setattr("logic.knowledge_graph_processor.knowledge_graph_processor.async_get_edges", fail)
+
+    processor = KnowledgeGraphProcessor(async_shared_session, English())
+    await processor.process_chat(async_chat_instance)
+
+    result = await async_shared_session.execute(select(Node).where(Node.label == "Microsoft"))
+    microsoft = result.scalars().one()
+    result = await async_shared_session.execute(select(Edge))
+    edges = result.scalars().all()
+    assert len(edges) == 1
+    assert edges[0].type == "works at"
+    assert edges[0].to_node_id == microsoft.id
+
+
+@pytest.mark.asyncio()
+async def test_process_chat_combined_request(async_chat_instance, async_shared_session, mocker):
+    """Test combined extraction goes through the async request without calling the blocking one."""
+    async_chat_instance.text = "Bob works at Microsoft"
+    await async_shared_session.commit()
+    mocker.patch("logic.knowledge_graph_processor.knowledge_graph_processor.GRAPH_EXTRACTION_MODE", "combined")
+    api_request = mocker.patch("llm.graph_processing.api_request")
+    async_api_request = mocker.patch(
+        "llm.graph_processing.async_api_request",
+        return_value='{"nodes": [{"id": 1, "label": "Bob", "spans": [[0]], "type": "person"}, '
+        '{"id": 2, "label": "Microsoft", "spans": [[3]], "type": "organisation"}], '
+        '"edges": [{"label": "works at", "spans": [[1, 2]], "source": 1, "target": 2}]}',
+    )
+
+    processor = KnowledgeGraphProcessor(async_shared_session, English())
+    await processor.process_chat(async_chat_instance)
+
+    async_api_request.assert_awaited_once()
+    api_request.assert_not_called()
+    result = await async_shared_session.execute(select(Edge))
+    assert [edge.type for edge in result.scalars().all()] == ["works at"]
@@ -0,0 +1,43 @@
+"""Tests for the chat embeddings side table."""
+import numpy as np
+from config import EMBEDDING_MODEL
+from models import Chat, ChatEmbedding
+from sqlalchemy.orm import Session
+
+
+def test_chat_vector_is_stored_in_side_table(shared_session: Session, chat_instance: Chat) -> None:
+    chat_instance.vector = np.array([1.0, 2.0, 3.0])
+    shared_session.commit()
+
+    embedding = shared_session.query(ChatEmbedding).filter_by(chat_id=chat_instance.id).one()
+    assert embedding.model_name == EMBEDDING_MODEL
+    assert embedding.vector_header.model == EMBEDDING_MODEL
+    assert chat_instance.is_vectorised
+    np.testing.assert_allclose(chat_instance.vector, [1.0, 2.0, 3.0])
+
+
+def test_embeddings_from_other_models_are_kept(shared_session: Session, chat_instance: Chat) -> None:
+    chat_instance.vector = np.array([1.0, 0.0])
+    other = ChatEmbedding(model_name="local-model")
+    other.vector = np.array([0.0, 1.0, 0.0])
+    chat_instance.embeddings.append(other)
+    shared_session.commit()
+
+    assert other.vector_header.model == "local-model"
+    np.testing.assert_allclose(chat_instance.vector, [1.0, 0.0])
+    # Replacing the configured model's vector leaves the other model's row alone
+    chat_instance.vector = np.array([0.5, 0.5])
+    shared_session.commit()
+    assert shared_session.query(ChatEmbedding).filter_by(chat_id=chat_instance.id).count() == 2
+    np.testing.assert_allclose(chat_instance.vector, [0.5, 0.5])
+
+
+def test_clearing_chat_vector_deletes_row(shared_session: Session, chat_instance: Chat) -> None:
+    chat_instance.vector = np.array([1.0, 2.0])
+    shared_session.commit()
+    chat_instance.vector = None
+    shared_session.commit()
+
+    assert chat_instance.vector is None
+    assert not chat_instance.is_vectorised
+    assert shared_session.query(ChatEmbedding).count() == 0
@@ -0,0 +1,69 @@
+"""Tests for the versioned vector encoding."""
+import numpy as np
+import pytest
+from models import Node
+from models.vector_codec import decode_vector, encode_vector, read_header
+
+
+@pytest.fixture()
+def embedding() -> np.ndarray:
+    vector = np.random.default_rng(0).normal(size=1536)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize(
+    ("dtype", "bytes_per_value", "tolerance"), [("float32", 4, 1e-7), ("float16", 2, 1e-3), ("int8", 1, 1e-2)]
+)
+def test_round_trip(embedding, dtype, bytes_per_value, tolerance):
+    data = encode_vector(embedding, dtype=dtype, model="text-embedding-ada-002")
+    # Header, model name and at most a 4 byte scale on top of the values themselves
+    assert len(data) <= 12 + len("text-embedding-ada-002") + 4 + bytes_per_value * len(embedding)
+    decoded = decode_vector(data)
+    assert decoded.dtype == np.float32
+    assert decoded.shape == embedding.shape
+    np.testing.assert_allclose(decoded, embedding, atol=tolerance)
+    cosine = decoded @ embedding / np.linalg.norm(decoded)
+    assert cosine > 0.9999
+
+
+def test_header(embedding):
+    header = read_header(encode_vector(embedding, dtype="int8", model="local-model"))
+    assert header.version == 1
+    assert header.dtype == "int8"
+    assert header.dim == 1536
+    assert header.model == "local-model"
+
+
+def test_int8_zero_vector():
+    np.testing.assert_array_equal(decode_vector(encode_vector(np.zeros(4), dtype="int8")), np.zeros(4))
+
+
+def test_legacy_float64_bytes_are_decoded(embedding):
+    data = embedding.tobytes()
+    assert read_header(data) is None
+    np.testing.assert_array_equal(decode_vector(data), embedding)
+
+
+def test_exact_storage(embedding):
+    assert read_header(encode_vector(embedding, dtype=None)).dtype == "float64"
+    np.testing.assert_array_equal(decode_vector(encode_vector(embedding, dtype=None)), embedding)
+    single = embedding.astype(np.float32)
+    assert read_header(encode_vector(single, dtype=None)).dtype == "float32"
+    np.testing.assert_array_equal(decode_vector(encode_vector(single, dtype=None)), single)
+
+
+def test_unknown_dtype():
+    with pytest.raises(ValueError, match="Unknown vector storage dtype"):
+        encode_vector(np.ones(3), dtype="float8")
+
+
+def test_mixin_stores_quantised_vectors(user_instance, embedding):
+    node = Node("label", user_id=user_instance.id)
+    node.set_vector(embedding, model="test-model", dtype="int8")
+    assert len(node._vector) < embedding.nbytes / 7
+    assert node.vector_header.model == "test-model"
+    np.testing.assert_allclose(node.vector, embedding, atol=1e-2)
+    # Legacy rows are read without a header
+    node._vector = embedding.tobytes()
+    assert node.vector_header is None
+    np.testing.assert_array_equal(node.vector, embedding)
@@ -23,7 +23,7 @@ const SessionScreen = () => {
         setMessages([...messages, {sender: "user", text}]);
         // Send to backend
         if (webSocketRef.current && webSocketRef.current.readyState === WebSocket.OPEN) {
-            webSocketRef.current.send(JSON.stringify({message: text}));
+            webSocketRef.current.send(JSON.stringify({message: text, stream: true}));
         }
         // TODO: Send the message to the backend using WebSocket
         // After receiving a response from the backend, append the therapist's message
@@ -56,12 +56,29 @@ const SessionScreen = () => {
             } else {
                 // Handle JSON messages here
                 const parsedObjects = JSON.parse(message);
+                if (parsedObjects.error !== undefined) {
+                    console.error("Response failed: ", parsedObjects.error);
+                    // Drop any partly streamed reply
+                    setMessages(currentMessages => currentMessages.filter(obj => !obj.streaming));
+                    return;
+                }
+                if (parsedObjects.delta !== undefined) {
+                    // Grow the therapist reply as it is streamed
+                    setMessages(currentMessages => {
+                        const last = currentMessages[currentMessages.length - 1];
+                        if (last && last.streaming) {
+                            return [...currentMessages.slice(0, -1), {...last, text: last.text + parsedObjects.delta}];
+                        }
+                        return [...currentMessages, {sender: "therapist", text: parsedObjects.delta, streaming: true}];
+                    });
+                    return;
+                }
                 console.log("Received messages: ", parsedObjects);
-                // Append the messages to the chat
+                // Append the messages to the chat, replacing any streamed reply with the saved one
                 console.log("Appending messages to the chat");
                 setMessages(
                     currentMessages => [
-                        ...currentMessages,
+                        ...currentMessages.filter(obj => !obj.streaming),
                         ...parsedObjects.messages.map(obj => ({sender: obj.sender, text: obj.text}))
                     ]
                 );